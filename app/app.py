@@ -1,8 +1,13 @@
+import os
 import cv2
 import time
+import uuid
+import atexit
+import threading
 import streamlit as st
 
-from main_engine import MainEngine
+from utils.sources import open_source
+from utils.render import PreviewRenderer, WidgetSlot, reference_gif
 
 
 # Setup the various UI components
@@ -11,13 +16,105 @@ USER_STREAM = st.empty()
 USER_FEEDBACK = st.empty()
 REF_VID = st.sidebar.empty()
 SETS_COUNTS = st.sidebar.empty()
+DIAGNOSTICS = st.sidebar.checkbox('Diagnostics', value=False)
+DIAGNOSTICS_PANEL = st.sidebar.empty()
 USER_FEEDBACK_TEMPLATE = '<span style="font-family:sans-serif; color:Red; font-size: 2.0rem;">%s</span>'
 SETS_COUNTS_TEMPLATE = '<span style="font-family:sans-serif; font-size: 1.2rem;">%s</span>'
+# camera index or video file of the station, eg. CAMERA_SOURCE=1 streamlit run app.py
+CAMERA_SOURCE = os.environ.get('CAMERA_SOURCE', '0')
+# if set, the session is recorded to this file for replay.py
+RECORD_FILE = os.environ.get('RECORD_FILE')
+# secs to wait for the engine to load its models
+LOAD_TIMEOUT = 120
+# secs without frames from the browser session using the station, after which another may take over
+TAKEOVER_TIMEOUT = 5
+# the camera preview is rendered at a lower rate and resolution than it is captured
+PREVIEW_FPS = 15
+PREVIEW_WIDTH = 480
 FINAL_REPORT_TEMPLATE = '<span style="font-family:sans-serif; color:Red; font-size: 2.0rem;">\
   <ul style="list-style-type:circle;">%s</ul></span>'
 
+
+@st.cache(allow_output_mutation=True, show_spinner=False)
+def engine_slot():
+  """
+    Returns the one engine slot of the server. Streamlit re-runs this script on every widget
+    change, the slot keeps the engine and its loaded models across the re-runs. A station has
+    one camera, so the engine serves one browser session at a time, its owner
+  """
+  slot = {'engine': None, 'owner': None, 'seen': 0.0, 'lock': threading.Lock()}
+  atexit.register(lambda: slot['engine'] is not None and stop_engine(slot['engine']))
+  return slot
+
+def get_engine(frame_shape):
+  """
+    Returns the engine for frames of the given shape, starting it on first use. An engine for
+    another frame shape is stopped, and an engine whose process has died is started afresh
+  """
+  slot = engine_slot()
+  with slot['lock']:
+    me = slot['engine']
+    if (me is not None) and ((me.ring.frame_shape != tuple(frame_shape)) or (not me.proc.is_alive())):
+      stop_engine(me)
+      me = slot['engine'] = None
+    if me is None:
+      # the engine and its models are imported only when they are first needed
+      from main_engine import MainEngine
+      # the engine works on the freshest frame, and paces how often frames are sampled
+      me = slot['engine'] = MainEngine(frame_shape=frame_shape, latest_only=True, min_interval=0.2,
+                                       record=RECORD_FILE)
+    return me
+
+def stop_engine(me):
+  me.speech.stop()
+  me.stop()
+  print("Frames processed: %(processed)d  dropped: %(dropped)d" %me.stats())
+
+def session_id():
+  # id of this browser session, kept across its re-runs
+  if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = uuid.uuid4().hex
+  return st.session_state['session_id']
+
+def claim_engine():
+  """
+    Makes this browser session the owner of the engine, returns False if another session is
+    using it. Its claim lapses TAKEOVER_TIMEOUT secs after it last pushed a frame
+  """
+  slot = engine_slot()
+  with slot['lock']:
+    if (slot['owner'] not in (None, session_id())) and (time.time()-slot['seen'] < TAKEOVER_TIMEOUT):
+      return False
+    slot['owner'], slot['seen'] = session_id(), time.time()
+    return True
+
+def owns_engine():
+  return engine_slot()['owner'] == session_id()
+
+def release_engine():
+  # the next session can use the engine right away
+  slot = engine_slot()
+  with slot['lock']:
+    if slot['owner'] == session_id():
+      slot['owner'] = None
+
+def update_output(events):
+  # keeps the latest counts in the session state, for the report
+  for event in events:
+    if event.kind == 'counts':
+      sets_counts, pose_counts = event.data
+      st.session_state['output'] = {'sets_counts': sets_counts, 'pose_counts': pose_counts}
+
+
 output = st.session_state.get('output', None)
 total_time = st.session_state.get('total_time', 0.0)
+if (not RUN_STATUS) and st.session_state.get('running', False):
+  # the session is stopped, the counts of the frames still in the engine are collected
+  st.session_state['running'] = False
+  if owns_engine():
+    update_output(get_engine(st.session_state['frame_shape']).drain(timeout=0.5))
+    release_engine()
+  output = st.session_state.get('output', None)
 if (output is not None) and (not RUN_STATUS):
   # If the app is not in running state, we show the exercises data for the user so far
   sets_counts = output['sets_counts']
@@ -38,58 +135,101 @@ if (output is not None) and (not RUN_STATUS):
   USER_STREAM.write(FINAL_REPORT_TEMPLATE %exercise_data_text, unsafe_allow_html=True)
 
 def main():
-  start_time = time.time()
   second_start = time.time()
-  me = MainEngine()
+  if not claim_engine():
+    USER_FEEDBACK.write(USER_FEEDBACK_TEMPLATE %'The station is in use by another session',
+                        unsafe_allow_html=True)
+    return
+  slot = engine_slot()
+  camera = open_source(CAMERA_SOURCE)
+  # the frame ring is sized from a frame actually read, the capture size is 0 when the source fails
+  status, frame = camera.read() if camera.isOpened() else (False, None)
+  if (not status) or (frame.size == 0):
+    camera.release()
+    release_engine()
+    USER_FEEDBACK.write(USER_FEEDBACK_TEMPLATE %('Cannot read from source %s' %CAMERA_SOURCE), unsafe_allow_html=True)
+    return
+  frame_shape = frame.shape
+  me = get_engine(frame_shape)
+  if not me.ready.is_set():
+    USER_FEEDBACK.write('Loading models..')
+    deadline = time.time()+LOAD_TIMEOUT
+    # the engine process exits if it cannot load the models, eg. missing model files
+    while me.proc.is_alive() and (time.time() < deadline) and (not me.wait_ready(0.5)):
+      slot['seen'] = time.time()
+    if not me.ready.is_set():
+      camera.release()
+      release_engine()
+      USER_FEEDBACK.write(USER_FEEDBACK_TEMPLATE %'The models could not be loaded, see the server log',
+                          unsafe_allow_html=True)
+      return
+    USER_FEEDBACK.empty()
+  me.set_metrics(DIAGNOSTICS)
+  if (not st.session_state.get('running', False)) or (st.session_state['frame_shape'] != frame_shape):
+    # a new session, re-runs while it is running carry on with its counts. An engine started
+    # for a new frame shape has none of them
+    me.reset()
+    st.session_state['running'] = True
+    st.session_state['frame_shape'] = frame_shape
+    st.session_state['start_time'] = time.time()
+    st.session_state.pop('output', None)
+  start_time = st.session_state['start_time']
+  # widgets are only re-rendered when their content changes
+  ref_vid, sets_counts_slot = WidgetSlot(REF_VID), WidgetSlot(SETS_COUNTS)
+  user_feedback, diagnostics = WidgetSlot(USER_FEEDBACK), WidgetSlot(DIAGNOSTICS_PANEL)
+  renderer = PreviewRenderer(fps=PREVIEW_FPS, width=PREVIEW_WIDTH).start()
 
-  camera = cv2.VideoCapture(0)
-  while camera.isOpened() and RUN_STATUS:
-    _, frame = camera.read()
-    frame = cv2.flip(frame, 1)   # Horizontally flip the frame for mirror image
-    USER_STREAM.image(frame, channels='BGR')
+  try:
+    # the loop ends if another session has taken the engine over
+    while camera.isOpened() and RUN_STATUS and (slot['owner'] == session_id()):
+      status, frame = camera.read()
+      if not status:
+        break
+      frame = cv2.flip(frame, 1)   # Horizontally flip the frame for mirror image
+      renderer.submit(frame)
+      preview = renderer.latest()
+      if preview is not None:
+        USER_STREAM.image(preview)
     
-    time_now = time.time()
-    if (time_now-second_start)*1000 >= 200 and RUN_STATUS:
-      me.push((time_now, frame))
-      # cv2.cvtColor(cv2.flip(frame, 1), cv2.COLOR_RGB2BGR)
-      # cv2.imwrite("./pics/pic_%d.png"%i, frame)
-      second_start = time.time()
+      time_now = time.time()
+      if (time_now-second_start) >= me.sample_interval() and RUN_STATUS:
+        me.push((time_now, frame))
+        slot['seen'] = time_now
+        # cv2.cvtColor(cv2.flip(frame, 1), cv2.COLOR_RGB2BGR)
+        # cv2.imwrite("./pics/pic_%d.png"%i, frame)
+        second_start = time.time()
     
-    output = me.get_output()
-    if output is not None:
-      if 'add' in output:
-        pose = output['add']
-        REF_VID.image('../resources/videos/%s.gif'%pose, caption='Wahoo Fitness')
-        sets_counts = output['sets_counts']
-        sets_counts = ['%s : %d' %(key.replace('_',' ').title(), val) for key, val in sets_counts.items()]
-        sets_counts_text = '<br>'.join(sets_counts)
-        SETS_COUNTS.write(SETS_COUNTS_TEMPLATE %sets_counts_text, unsafe_allow_html=True)
-      if 'correction' in output:
-        correction = output['correction']
-        USER_FEEDBACK.write(USER_FEEDBACK_TEMPLATE %correction, unsafe_allow_html=True)
-      if 'error' in output:
-        error = output['error']
-        USER_FEEDBACK.write(USER_FEEDBACK_TEMPLATE %error, unsafe_allow_html=True)
-      
-      st.session_state['output'] = output
-
-    # Update total time
-    st.session_state['total_time'] = (time_now-start_time)
-  
-  camera.release()
-  cv2.destroyAllWindows()
+      # all the events since the last frame are handled at once, only the latest counts arrive
+      for event in me.drain():
+        if event.kind == 'add':
+          ref_vid.update('image', reference_gif(event.data), caption='Wahoo Fitness')
+        elif event.kind == 'counts':
+          sets_counts, pose_counts = event.data
+          sets_counts_text = '<br>'.join(['%s : %d' %(key.replace('_',' ').title(), val) for key, val in sets_counts.items()])
+          sets_counts_slot.update('write', SETS_COUNTS_TEMPLATE %sets_counts_text, unsafe_allow_html=True)
+          st.session_state['output'] = {'sets_counts': sets_counts, 'pose_counts': pose_counts}
+        elif event.kind in ('correction', 'error'):
+          feedback = '' if event.data is None else event.data
+          user_feedback.update('write', USER_FEEDBACK_TEMPLATE %feedback, unsafe_allow_html=True)
+        elif event.kind == 'metrics':
+          # engine diagnostics, these do not carry the exercise state
+          diagnostics.update('json', event.data)
 
-  me.speech.stop()
-  output = me.get_output()
-  while output is not None:
-    # process any remaining outputs to make the queue empty
-    st.session_state['output'] = output
-  st.session_state['total_time'] = (time.time()-start_time)
-  me.stop()
+      # Update total time
+      st.session_state['total_time'] = (time_now-start_time)
+  finally:
+    # a re-run interrupts the loop, the camera is released for the next run
+    camera.release()
+    cv2.destroyAllWindows()
+    renderer.stop()
 
-  print("System exiting..")
+  # the source has ended, and with it the session. The engine is kept for the next one
+  st.session_state['running'] = False
+  if owns_engine():
+    update_output(me.drain(timeout=0.5))
+    release_engine()
+  st.session_state['total_time'] = (time.time()-start_time)
 
 
-if __name__ == '__main__' and (output is None):
-  # This prevents streamlit from re-runnning the whole app in case of click or change event
+if __name__ == '__main__' and RUN_STATUS:
   main()
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+  Offline batch analysis of recorded workout videos. Each video is run through the same
+  stages as the live app - landmarks, features, classification, pose corrections and rep
+  counting - with the videos spread across a pool of processes. For every video the per-frame
+  columns are written to '<content hash>.npz' and the final counts to '<content hash>.json'
+  in the output directory, so re-runs skip the videos which are already analysed. A video
+  which fails gets the error in its summary instead, and is retried on re-runs.
+
+  Run from the app directory :
+    > python batch_analyse.py ../recordings/*.mp4 --out ../resources/output/batch --workers 4
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+import multiprocessing as mp
+
+from utils.dataset import content_hash
+from utils.skeleton import N_FEATURES, POINT_NAMES, get_batch_features
+from utils.rep_counter import SESSION_MAX_GAP, RepCounter
+from utils.frame_extractor import FrameExtractor
+from utils.frame_processor import FrameProcessor
+from utils.pose_classifier import PoseClassifier
+
+
+# per-process state of the pool workers
+_analyser = {}
+
+def _init_analyser(time_interval, scale):
+  _analyser['fex'] = FrameExtractor(time_interval=time_interval, scale=scale)
+  _analyser['fproc'] = FrameProcessor(static_image_mode=False, roi=True)
+  _analyser['pose_clf'] = PoseClassifier()
+
+def analyse_video(file_path, out_path):
+  """
+    Analyses one video and writes its per-frame columns and summary. Returns the summary
+  """
+  fex, fproc, pose_clf = _analyser['fex'], _analyser['fproc'], _analyser['pose_clf']
+  start_time = time.time()
+
+  # landmarks are the only per-frame stage, the rest runs over the whole video at once
+  time_ms, skeletons, errors, frame_height = list(), list(), list(), None
+  fproc.reset()
+  for timestamp, frame in fex.iter_frames(file_path):
+    frame_height = frame.shape[0]
+    time_ms.append(timestamp)
+    try:
+      skeleton = fproc.get_frame_skeleton(frame)
+      errors.append('' if skeleton is not None else 'No pose detected')
+    except AssertionError as ex:
+      skeleton = None
+      errors.append(str(ex))
+    except Exception as ex:
+      # eg. a corrupt frame, the tracking restarts from the next one
+      skeleton = None
+      errors.append(str(ex))
+      fproc.reset()
+    skeletons.append(np.full((len(POINT_NAMES), 3), np.nan, dtype=np.float32) if skeleton is None else skeleton)
+
+  n_frames = len(time_ms)
+  skeletons = np.array(skeletons, dtype=np.float32).reshape(n_frames, len(POINT_NAMES), 3)
+  has_pose = np.array([error == '' for error in errors], dtype=bool)
+  features = np.full((n_frames, N_FEATURES), np.nan, dtype=np.float64)
+  pose_ids = np.full(n_frames, -1, dtype=np.int16)
+  if has_pose.any():
+    features[has_pose] = get_batch_features(skeletons[has_pose], frame_height)
+    pose_ids[has_pose] = pose_clf.classify_batch(features[has_pose])
+
+  # counting is sequential, then corrections are checked against the smoothed classes. The
+  # counter credits the same gaps as the live app, so both give the same counts
+  counter = RepCounter(max_gap=SESSION_MAX_GAP)
+  smoothed = np.full(n_frames, -1, dtype=np.int16)
+  for i in range(n_frames):
+    pose_clas = pose_clf.labels[pose_ids[i]] if has_pose[i] else None
+    pose_clas, _ = counter.update(time_ms[i]/1000.0, pose_clas)
+    if has_pose[i]:
+      smoothed[i] = pose_clf.labels.index(pose_clas)
+  corrections = np.zeros(n_frames, dtype=np.uint32)
+  if has_pose.any():
+    labels = np.array(pose_clf.labels)[smoothed[has_pose]]
+    corrections[has_pose] = fproc.corrector.masks(skeletons[has_pose], labels)
+
+  np.savez_compressed(out_path+'.npz', time_ms=np.array(time_ms, dtype=np.float64), skeleton=skeletons,
+                      features=features, pose_id=pose_ids, smoothed_pose_id=smoothed,
+                      correction_mask=corrections, error=np.array(errors), labels=np.array(pose_clf.labels),
+                      messages=np.array(fproc.corrector.messages))
+  summary = {'video': file_path, 'frames': n_frames, 'sets_counts': counter.sets_counts,
+             'pose_counts': counter.pose_counts, 'elapsed': time.time()-start_time}
+  # the summary is written last, it marks the video as done
+  with open(out_path+'.json', 'w') as f:
+    json.dump(summary, f, indent=2)
+  return summary
+
+def _analyse_job(file_path, out_path):
+  # a failing video is recorded in its summary, so the other videos of the batch carry on
+  try:
+    return analyse_video(file_path, out_path)
+  except Exception as ex:
+    summary = {'video': file_path, 'frames': 0, 'sets_counts': {}, 'pose_counts': {}, 'error': str(ex)}
+    with open(out_path+'.json', 'w') as f:
+      json.dump(summary, f, indent=2)
+    return summary
+
+def _is_done(out_path):
+  # a video is done once its summary is written without an error
+  if not os.path.isfile(out_path+'.json'):
+    return False
+  with open(out_path+'.json') as f:
+    return 'error' not in json.load(f)
+
+
+def main(args):
+  if not os.path.isdir(args.out):
+    os.makedirs(args.out)
+
+  jobs = dict()
+  for file_path in args.videos:
+    hash_code = content_hash(file_path)
+    out_path = os.path.join(args.out, hash_code)
+    if (_is_done(out_path) and not args.force) or (hash_code in jobs):
+      print("Skipping %s, already analysed" %file_path)
+      continue
+    jobs[hash_code] = (file_path, out_path)
+  jobs = list(jobs.values())
+
+  start_time = time.time()
+  total_frames = 0
+  with mp.Pool(args.workers, initializer=_init_analyser, initargs=(args.interval, args.scale)) as pool:
+    for summary in pool.starmap(_analyse_job, jobs, chunksize=1):
+      if 'error' in summary:
+        print("%s : failed, %s" %(summary['video'], summary['error']))
+        continue
+      total_frames += summary['frames']
+      print("%s : %d frames  %s" %(summary['video'], summary['frames'], summary['sets_counts']))
+  elapsed = max(time.time()-start_time, 1e-9)
+
+  print("Analysed %d videos, %d frames in %.1f secs" %(len(jobs), total_frames, elapsed))
+  print("Throughput : %.2f frames/sec  %.1f videos/hour" %(total_frames/elapsed, len(jobs)*3600/elapsed))
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Batch analysis of recorded workout videos')
+  parser.add_argument('videos', nargs='+', help='video files to analyse')
+  parser.add_argument('--out', default='../resources/output/batch', help='output directory')
+  parser.add_argument('--workers', type=int, default=mp.cpu_count(), help='number of processes')
+  parser.add_argument('--interval', type=int, default=200, help='frame sampling interval in ms')
+  parser.add_argument('--scale', type=float, default=1.0, help='resize factor for the frames')
+  parser.add_argument('--force', action='store_true', help='re-analyse videos already done')
+  main(parser.parse_args())
@@ -0,0 +1,59 @@
+"""
+  Compares the single frame latency and the batch throughput of the classifier against the
+  original per-frame path of two sklearn predicts, and checks that the predictions match.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_classifier
+"""
+import time
+import argparse
+import numpy as np
+
+from utils.pose_classifier import PoseClassifier
+
+
+def legacy_classify(pose_clf, features):
+  # the original path - sklearn predicts, encoders and string agreement check
+  pred_clas = pose_clf.clf_clas.predict(features.reshape(1, -1))
+  clas_name = pose_clf.clas_encoder.inverse_transform(pred_clas)[0]
+  features = np.hstack((features, pred_clas))
+  pred_subclas = pose_clf.clf_subclas.predict(features.reshape(1, -1))
+  subclas_name = pose_clf.subclas_encoder.inverse_transform(pred_subclas)[0]
+  return subclas_name if subclas_name.startswith(clas_name) else 'random-random'
+
+def per_frame(name, func, rows):
+  latencies = list()
+  preds = list()
+  for row in rows:
+    start_time = time.perf_counter()
+    preds.append(func(row))
+    latencies.append(time.perf_counter()-start_time)
+  latencies = np.array(latencies)*1000
+  print("%-8s : p50 %7.3f ms  p95 %7.3f ms  %9.1f frames/sec" %(name, np.percentile(latencies, 50),
+          np.percentile(latencies, 95), len(rows)/latencies.sum()*1000))
+  return preds
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Pose classifier benchmark')
+  parser.add_argument('--data', default='../resources/data/expanded_data_v2.csv', help='features csv')
+  parser.add_argument('--batch', type=int, default=256, help='batch size for classify_batch')
+  args = parser.parse_args()
+
+  pose_clf = PoseClassifier(model='cascade')
+  n_features = pose_clf.n_features
+  features = np.genfromtxt(args.data, delimiter=',', skip_header=1, usecols=range(n_features))
+
+  legacy = per_frame('legacy', lambda row: legacy_classify(pose_clf, row), features)
+  single = per_frame('classify', pose_clf.classify, features)
+
+  start_time = time.perf_counter()
+  batch = np.concatenate([pose_clf.classify_batch(features[i:i+args.batch])
+                          for i in range(0, len(features), args.batch)])
+  elapsed = time.perf_counter()-start_time
+  print("%-8s : batch of %d  %9.1f frames/sec" %('batch', args.batch, len(features)/elapsed))
+
+  batch = [pose_clf.labels[i] for i in batch]
+  mismatches = sum(a != b for a, b in zip(legacy, batch)) + sum(a != b for a, b in zip(legacy, single))
+  print("rows : %d  mismatches : %d" %(len(features), mismatches))
+  assert mismatches == 0, "Predictions differ from the original path"
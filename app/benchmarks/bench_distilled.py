@@ -0,0 +1,86 @@
+"""
+  Compares the distilled single-stage model against the XGBoost+KNN cascade : accuracy and
+  agreement on the dataset, single frame latency, batch throughput, model size, and the import
+  plus load time and peak memory of each model in a fresh interpreter.
+
+  Run from the app directory, after python distill.py :
+    > python -m benchmarks.bench_distilled
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import numpy as np
+
+from utils.distilled import DISTILLED_PATH
+
+
+def load_model(model):
+  """   runs in a fresh interpreter, returns the import and load time and the modules brought in   """
+  start_time = time.perf_counter()
+  from utils.pose_classifier import PoseClassifier
+  imported = time.perf_counter()
+  PoseClassifier(model=model)
+  loaded = time.perf_counter()
+  return {'import_ms': (imported-start_time)*1000, 'load_ms': (loaded-imported)*1000,
+          'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024,
+          'xgboost': 'xgboost' in sys.modules, 'sklearn': 'sklearn' in sys.modules}
+
+def model_bytes(pose_clf):
+  # size of the model files on disk, the .npz arrays or the pickled cascade
+  if pose_clf.model == 'distilled':
+    return os.path.getsize(DISTILLED_PATH)
+  return sum(os.path.getsize(file_path) for file_path in pose_clf.model_files.values())
+
+def single_latencies(pose_clf, rows):
+  # ms per classify() call
+  latencies = list()
+  for row in rows:
+    start_time = time.perf_counter()
+    pose_clf.classify(row)
+    latencies.append(time.perf_counter()-start_time)
+  return np.array(latencies)*1000
+
+def batch_throughput(pose_clf, features, batch_size):
+  # rows/sec of classify_batch() over the features
+  start_time = time.perf_counter()
+  preds = np.concatenate([pose_clf.classify_batch(features[i:i+batch_size])
+                          for i in range(0, len(features), batch_size)])
+  return len(features)/(time.perf_counter()-start_time), preds
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Distilled vs cascade pose model benchmark')
+  parser.add_argument('--data', default='../resources/data/expanded_data_v2.csv', help='features csv')
+  parser.add_argument('--batch', type=int, default=256, help='batch size for classify_batch')
+  parser.add_argument('--child', help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.child is not None:
+    print(json.dumps(load_model(args.child)))
+    sys.exit(0)
+
+  # imported after the child has run, so that it times its own import
+  from utils.dataset import load_csv
+  from utils.pose_classifier import PoseClassifier, MODELS
+
+  features, labels = load_csv(args.data)
+  preds = dict()
+  for model in MODELS:
+    out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_distilled', '--child', model],
+                         stdout=subprocess.PIPE, check=True)
+    cold = json.loads(out.stdout.decode().strip().splitlines()[-1])
+    pose_clf = PoseClassifier(model=model)
+    latencies = single_latencies(pose_clf, features)
+    throughput, pred = batch_throughput(pose_clf, features, args.batch)
+    preds[model] = np.array([pose_clf.labels[i] for i in pred])
+    print("%-9s : acc %.4f  p50 %7.3f ms  p95 %7.3f ms  batch %10.1f rows/sec  size %9d bytes" %(model,
+            np.mean(preds[model] == labels), np.percentile(latencies, 50), np.percentile(latencies, 95),
+            throughput, model_bytes(pose_clf)))
+    print("%-9s   import %7.1f ms  load %7.1f ms  peak rss %7.1f MB  xgboost %s  sklearn %s" %('',
+            cold['import_ms'], cold['load_ms'], cold['peak_rss_mb'], cold['xgboost'], cold['sklearn']))
+
+  print("agreement : %.4f of %d rows" %(np.mean(preds['cascade'] == preds['distilled']), len(features)))
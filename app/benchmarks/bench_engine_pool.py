@@ -0,0 +1,48 @@
+"""
+  Measures the frames/sec MainEngine sustains with 1 to N worker processes, replaying the
+  frames of a clip as fast as the engine accepts them.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_engine_pool --max-workers 4
+"""
+import time
+import argparse
+import multiprocessing as mp
+
+from main_engine import MainEngine
+from utils.frame_extractor import FrameExtractor
+
+
+def replay(frames, n_workers, repeat):
+  me = MainEngine(frame_shape=frames[0].shape, n_workers=n_workers)
+  me.wait_ready()
+  total = len(frames)*repeat
+  start_time = time.time()
+  time_stamp = start_time
+  for _ in range(repeat):
+    for frame in frames:
+      time_stamp += 0.2   # synthetic capture time, frames are 200ms apart
+      me.push((time_stamp, frame))
+  while me.stats()['processed'] < total:
+    time.sleep(0.01)
+  elapsed = time.time()-start_time
+  me.speech.stop()
+  me.stop()
+  return total/elapsed
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='MainEngine worker pool scaling benchmark')
+  parser.add_argument('--video', default='../resources/videos/squats.gif', help='clip to replay')
+  parser.add_argument('--max-workers', type=int, default=mp.cpu_count(), help='largest pool to try')
+  parser.add_argument('--repeat', type=int, default=5, help='times the clip is replayed')
+  args = parser.parse_args()
+
+  frames = FrameExtractor(time_interval=100).get_frames(args.video)
+  assert frames, "No frames read from %s" %args.video
+
+  base_fps = None
+  for n_workers in range(1, args.max_workers+1):
+    fps = replay(frames, n_workers, args.repeat)
+    base_fps = base_fps or fps
+    print("workers %2d : %8.2f frames/sec  speedup %5.2fx" %(n_workers, fps, fps/base_fps))
@@ -0,0 +1,97 @@
+"""
+  Compares the legacy one-message-per-poll outputs against the batched, coalescing event
+  channel under bursty load. A producer process sends bursts of count updates, errors and
+  additions, and the UI loop polls once per camera frame. Reports the bytes pickled per
+  burst and the lag from emit to the UI handling an event.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_events --bursts 100 --burst-size 20
+"""
+import time
+import pickle
+import argparse
+import numpy as np
+import multiprocessing as mp
+
+from utils.worker import EventChannel, coalesce
+
+
+SETS_COUNTS = {'squats': 12, 'lunges': 8, 'crunches': 15, 'jumping_jacks': 20, 'planks': 35.2}
+POSE_COUNTS = {'squats': 140, 'lunges': 92, 'crunches': 180, 'jumping_jacks': 240, 'planks': 176, 'random': 75}
+
+
+def legacy_producer(outputs, bursts, burst_size, gap, sizes):
+  # one dict per message, each carrying full copies of both counts
+  total = 0
+  for _ in range(bursts):
+    for i in range(burst_size):
+      msg = {'add': 'squats', 'correction': None, 'sets_counts': SETS_COUNTS, 'pose_counts': POSE_COUNTS,
+             'time': time.time()} if i % 2 else {'error': 'Feet not in frame', 'sets_counts': SETS_COUNTS,
+             'pose_counts': POSE_COUNTS, 'time': time.time()}
+      total += len(pickle.dumps(msg))
+      outputs.put(msg)
+    time.sleep(gap)
+  outputs.put('done')
+  sizes.put(total)
+
+def channel_producer(channel, bursts, burst_size, gap, sizes):
+  # compact events, the counts only once per flush
+  total = 0
+  for _ in range(bursts):
+    for i in range(burst_size):
+      if i % 2:
+        channel.emit('add', 'squats')
+        channel.emit('correction', None)
+      else:
+        channel.emit('error', 'Feet not in frame')
+      channel.emit('counts', (SETS_COUNTS, POSE_COUNTS, time.time()))
+    total += len(pickle.dumps(coalesce(channel.pending, channel.state_kinds)))
+    channel.flush()
+    time.sleep(gap)
+  channel.emit('done')
+  channel.flush()
+  sizes.put(total)
+
+def ui_legacy(outputs, frame_time):
+  # polls one message per camera frame, the same way app.py used to
+  lags = list()
+  while True:
+    msg = None if outputs.empty() else outputs.get()
+    if msg == 'done':
+      break
+    if msg is not None:
+      lags.append(time.time()-msg['time'])
+    time.sleep(frame_time)
+  return np.array(lags)*1000
+
+def ui_channel(channel, frame_time):
+  # drains all the pending events once per camera frame
+  lags = list()
+  while True:
+    events = channel.drain()
+    now = time.time()
+    lags.extend(now-event.data[2] for event in events if event.kind == 'counts')
+    if any(event.kind == 'done' for event in events):
+      break
+    time.sleep(frame_time)
+  return np.array(lags)*1000
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='UI event channel benchmark')
+  parser.add_argument('--bursts', type=int, default=100, help='number of bursts')
+  parser.add_argument('--burst-size', type=int, default=20, help='updates per burst')
+  parser.add_argument('--gap', type=float, default=0.2, help='secs between bursts')
+  parser.add_argument('--fps', type=int, default=30, help='UI polling rate')
+  args = parser.parse_args()
+
+  for name in ('legacy', 'channel'):
+    sizes = mp.Queue()
+    outputs = mp.Queue() if name == 'legacy' else EventChannel()
+    producer = legacy_producer if name == 'legacy' else channel_producer
+    proc = mp.Process(target=producer, args=(outputs, args.bursts, args.burst_size, args.gap, sizes))
+    proc.start()
+    lags = ui_legacy(outputs, 1.0/args.fps) if name == 'legacy' else ui_channel(outputs, 1.0/args.fps)
+    proc.join()
+    print("%-8s : %8.1f KB pickled  state updates seen %5d  lag p50 %8.1f ms  p95 %8.1f ms  max %8.1f ms" %(name,
+          sizes.get()/1024, len(lags), np.percentile(lags, 50), np.percentile(lags, 95), lags.max()))
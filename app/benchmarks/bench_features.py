@@ -0,0 +1,80 @@
+"""
+  Checks the single frame and the vectorized batch features against the original per-Point
+  computation and compares their speed. A single frame must not be slower than the original.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_features --frames 5000
+"""
+import time
+import argparse
+import numpy as np
+
+from utils.skeleton import N_LANDMARKS, to_skeleton, get_features, get_batch_features
+
+
+def _distance(p1, p2):
+  return np.sqrt((p1[0]-p2[0])**2 + (p1[1]-p2[1])**2)
+
+def _angle(p1, p2, p3):
+  ab, bc = (p1[0]-p2[0], p1[1]-p2[1]), (p3[0]-p2[0], p3[1]-p2[1])
+  dot_prod = (ab[0]*bc[0])+(ab[1]*bc[1])
+  mod_prod = np.sqrt((ab[0]**2+ab[1]**2)*(bc[0]**2+bc[1]**2))
+  angle = np.rad2deg(np.arccos(dot_prod/mod_prod))
+  det = ab[0]*bc[1] - ab[1]*bc[0]
+  return 360-angle if det<0 else angle
+
+def _mid(p1, p2):
+  return ((p1[0]+p2[0])*0.5, (p1[1]+p2[1])*0.5, (p1[2]+p2[2])*0.5)
+
+def reference_features(landmarks, frame_shape):
+  # the original scalar computation, one joint tuple at a time
+  h, w = frame_shape[:2]
+  ids = [0, 11, 12, 23, 24, 13, 14, 15, 16, 25, 26, 27, 28, 31, 32]
+  lhip, rhip = landmarks[23].tolist(), landmarks[24].tolist()
+  mx, my = (lhip[0]+rhip[0])*0.5, (lhip[1]+rhip[1])*0.5
+  (nose, lsh, rsh, lhp, rhp, lel, rel, lwr, rwr, lkn, rkn, lan, ran, lfi, rfi) = [
+    ((x-mx)*w, (y-my)*h, v) for x, y, v in landmarks[ids].tolist()]
+  neck = _mid(lsh, rsh)
+  torso_len = (_distance(neck, lhp) + _distance(neck, rhp))*0.5
+  mid_hips = _mid(lhp, rhp)
+  core = _mid(neck, mid_hips)
+  dist_feats = np.array([_distance(core, p) for p in (nose, lel, rel, lwr, rwr, lkn, rkn, lan, ran)] +
+    [_distance(p1, p2) for p1, p2 in ((lsh, lwr), (rsh, rwr), (lhp, lel), (rhp, rel), (lsh, lkn),
+      (rsh, rkn), (lhp, lan), (rhp, ran), (lkn, lfi), (rkn, rfi), (lwr, rwr), (lel, rel), (lsh, rsh),
+      (lhp, rhp), (lkn, rkn))])/torso_len
+  ground = (core[0], h-1, 0.9)
+  angle_feats = np.array([_angle(lel, neck, rel), _angle(lkn, mid_hips, rkn),
+                          _angle(nose, neck, mid_hips), _angle(nose, core, ground)])/360.0
+  visibility_feats = np.array([(lsh[2]+lhp[2])*0.5, (lhp[2]+lkn[2])*0.5, (rsh[2]+rhp[2])*0.5,
+                               (rhp[2]+rkn[2])*0.5])
+  return np.hstack((dist_feats, angle_feats, visibility_feats))
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Feature extraction benchmark')
+  parser.add_argument('--frames', type=int, default=5000, help='number of random landmark sets')
+  args = parser.parse_args()
+
+  rng = np.random.default_rng(123)
+  frame_shape = (720, 1280, 3)
+  landmarks = rng.uniform(0.1, 0.9, size=(args.frames, N_LANDMARKS, 3)).astype(np.float32)
+
+  start_time = time.perf_counter()
+  reference = np.array([reference_features(lm, frame_shape) for lm in landmarks])
+  ref_time = time.perf_counter()-start_time
+
+  start_time = time.perf_counter()
+  single = np.array([get_features(to_skeleton(lm, frame_shape), frame_shape[0]) for lm in landmarks])
+  single_time = time.perf_counter()-start_time
+
+  start_time = time.perf_counter()
+  batch = get_batch_features(to_skeleton(landmarks, frame_shape), frame_shape[0])
+  batch_time = time.perf_counter()-start_time
+
+  print("max abs diff : single %.2e  batch %.2e" %(np.abs(single-reference).max(), np.abs(batch-reference).max()))
+  assert np.allclose(single, reference, rtol=1e-4, atol=1e-4), "Single frame features differ from reference"
+  assert np.allclose(batch, reference, rtol=1e-4, atol=1e-4), "Vectorized features differ from reference"
+  for name, elapsed in [('reference', ref_time), ('single', single_time), ('batch', batch_time)]:
+    print("%-10s : %10.1f frames/sec  %8.2f us/frame" %(name, args.frames/elapsed, elapsed*1e6/args.frames))
+  assert single_time <= ref_time, "Single frame features take %.2f us, the original %.2f us" %(
+          single_time*1e6/args.frames, ref_time*1e6/args.frames)
@@ -0,0 +1,58 @@
+"""
+  Compares the decode throughput and peak memory of the original seek-per-frame extraction
+  against the sequential frame iterator. Each mode runs in its own process so that peak RSS
+  is measured separately. Use a multi-minute clip for meaningful numbers.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_frame_extractor --video session.mp4
+"""
+import time
+import resource
+import argparse
+import multiprocessing as mp
+
+import cv2
+
+from utils.frame_extractor import FrameExtractor
+
+
+def seek_frames(file_path, time_interval):
+  # the original extraction, seeking before every read and collecting all frames
+  vidObj = cv2.VideoCapture(file_path)
+  frames, frame_count = list(), 0
+  status, image = vidObj.read()
+  while status:
+    frame_count += 1
+    frames.append(image)
+    vidObj.set(cv2.CAP_PROP_POS_MSEC, frame_count*time_interval)
+    status, image = vidObj.read()
+  return len(frames)
+
+def stream_frames(file_path, time_interval, scale):
+  return sum(1 for _ in FrameExtractor(time_interval=time_interval, scale=scale).iter_frames(file_path))
+
+def run(mode, args, results):
+  start_time = time.time()
+  if mode == 'seek':
+    n_frames = seek_frames(args.video, args.interval)
+  else:
+    n_frames = stream_frames(args.video, args.interval, args.scale if mode == 'stream+scale' else 1.0)
+  elapsed = time.time()-start_time
+  # ru_maxrss is in KB on Linux
+  results.put((mode, n_frames, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0))
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Frame extraction benchmark')
+  parser.add_argument('--video', required=True, help='clip to extract frames from')
+  parser.add_argument('--interval', type=int, default=100, help='frame sampling interval in ms')
+  parser.add_argument('--scale', type=float, default=0.5, help='resize factor for the scaled run')
+  args = parser.parse_args()
+
+  results = mp.Queue()
+  for mode in ['seek', 'stream', 'stream+scale']:
+    proc = mp.Process(target=run, args=(mode, args, results))
+    proc.start()
+    mode, n_frames, elapsed, peak_rss = results.get()
+    proc.join()
+    print("%-12s : %6d frames  %8.2f frames/sec  peak RSS %8.1f MB" %(mode, n_frames, n_frames/elapsed, peak_rss))
@@ -0,0 +1,61 @@
+"""
+  Measures the CPU saved by the pre-inference frame gate on a recorded session. The clip is
+  replayed at the engine's sampling interval, once running pose estimation on every frame
+  and once gated, and the CPU time, skip ratio and final counts of both runs are reported.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_frame_gate --video session.mp4
+"""
+import time
+import argparse
+
+from main_engine import analyse_frame
+from utils.frame_gate import FrameGate
+from utils.rep_counter import RepCounter
+from utils.frame_extractor import FrameExtractor
+from utils.frame_processor import FrameProcessor
+from utils.pose_classifier import PoseClassifier
+
+
+def replay(frames, fproc, pose_clf, gate):
+  # runs the clip through the per-frame stages and the counter, optionally gated
+  counter = RepCounter()
+  last_result, skipped = (None, None), 0
+  fproc.reset()
+  cpu_start = time.process_time()
+  for time_ms, frame in frames:
+    time_stamp = time_ms/1000.0
+    if gate is not None:
+      status, reuse = gate.check(frame, time_stamp)
+      if (status is not None) or reuse:
+        skipped += 1
+        counter.update(time_stamp, last_result[1] if reuse else None)
+        continue
+    skeleton, pose_clas, _, _, _ = analyse_frame(fproc, pose_clf, frame)
+    last_result = (skeleton, pose_clas)
+    counter.update(time_stamp, pose_clas)
+  return time.process_time()-cpu_start, skipped, counter.sets_counts
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Frame gate CPU savings benchmark')
+  parser.add_argument('--video', default='../resources/videos/planks.gif', help='recorded session to replay')
+  parser.add_argument('--interval', type=int, default=200, help='frame sampling interval in ms')
+  parser.add_argument('--threshold', type=float, default=3.0, help='motion threshold of the gate')
+  args = parser.parse_args()
+
+  frames = list(FrameExtractor(time_interval=args.interval).iter_frames(args.video))
+  fproc = FrameProcessor(static_image_mode=False)
+  pose_clf = PoseClassifier()
+  # warm up the pose session
+  analyse_frame(fproc, pose_clf, frames[0][1])
+
+  full_cpu, _, full_counts = replay(frames, fproc, pose_clf, None)
+  gated_cpu, skipped, gated_counts = replay(frames, fproc, pose_clf, FrameGate(motion_threshold=args.threshold))
+  fproc.close()
+
+  print("Frames: %d" %len(frames))
+  print("ungated : %7.2f ms CPU/frame  counts %s" %(full_cpu*1000/len(frames), full_counts))
+  print("gated   : %7.2f ms CPU/frame  counts %s  skip ratio %.2f" %(gated_cpu*1000/len(frames), gated_counts,
+        skipped/len(frames)))
+  print("CPU saved : %.1f%%" %(100*(1-gated_cpu/max(full_cpu, 1e-9))))
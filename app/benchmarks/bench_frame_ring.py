@@ -0,0 +1,75 @@
+"""
+  Compares passing frames to a worker process through the shared memory frame ring 
+  against pickling them through a multiprocessing Queue, at several resolutions. Reports
+  the transfer latency and the CPU time spent by both the processes per frame.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_frame_ring --frames 300
+"""
+import time
+import argparse
+import numpy as np
+import multiprocessing as mp
+
+from utils.worker import FrameRing
+
+
+RESOLUTIONS = {'480p': (480, 640, 3), '720p': (720, 1280, 3), '1080p': (1080, 1920, 3)}
+
+
+def consume(inputs, outputs, ring):
+  # receives frames till None, then reports the latencies and its cpu time
+  latencies = list()
+  while True:
+    inp = inputs.get()
+    if inp is None:
+      break
+    time_stamp, frame = inp
+    slot = None
+    if isinstance(frame, int):
+      slot, frame = frame, ring.get(frame)
+    frame[::64, ::64].sum()   # touch the frame like a consumer would
+    latencies.append(time.time()-time_stamp)
+    if slot is not None:
+      ring.release(slot)
+  outputs.put((latencies, time.process_time()))
+
+def transfer(frame, n_frames, use_ring):
+  ring = FrameRing(frame.shape) if use_ring else None
+  inputs, outputs = mp.Queue(), mp.Queue()
+  proc = mp.Process(target=consume, args=(inputs, outputs, ring))
+  proc.start()
+
+  start_cpu = time.process_time()
+  for i in range(n_frames):
+    frame[0, 0, 0] = i % 256
+    if use_ring:
+      slot = ring.put(frame)
+      while slot is None:
+        # all slots are in flight, wait for the consumer
+        time.sleep(0.0005)
+        slot = ring.put(frame)
+      inputs.put((time.time(), slot))
+    else:
+      inputs.put((time.time(), frame))
+  producer_cpu = time.process_time()-start_cpu
+  inputs.put(None)
+
+  latencies, consumer_cpu = outputs.get()
+  proc.join()
+  if ring is not None:
+    ring.close()
+  latencies = np.array(latencies)*1000
+  return np.percentile(latencies, 50), np.percentile(latencies, 95), (producer_cpu+consumer_cpu)*1000/n_frames
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Frame transfer benchmark')
+  parser.add_argument('--frames', type=int, default=300, help='frames sent per run')
+  args = parser.parse_args()
+
+  for res_name, shape in RESOLUTIONS.items():
+    frame = np.random.randint(0, 256, size=shape, dtype=np.uint8)
+    for name, use_ring in [('queue', False), ('ring', True)]:
+      p50, p95, cpu = transfer(frame, args.frames, use_ring)
+      print("%-6s %-6s : latency p50 %7.3f ms  p95 %7.3f ms  cpu %7.3f ms/frame" %(res_name, name, p50, p95, cpu))
@@ -0,0 +1,50 @@
+"""
+  Measures the per-frame overhead of the engine instrumentation, disabled and enabled,
+  against the same loop without any instrumentation.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_metrics --frames 200000
+"""
+import time
+import argparse
+
+from main_engine import _lap
+from utils.metrics import Metrics
+
+
+def frame_loop(n_frames, metrics, timed):
+  # mimics the instrumentation calls made for one frame in analyse_frame and the sequencer
+  start_time = time.perf_counter()
+  for _ in range(n_frames):
+    timings = {} if timed else None
+    stage_start = time.perf_counter()
+    for stage in ('landmarks', 'features', 'classify'):
+      stage_start = _lap(timings, stage, stage_start)
+    if metrics is not None:
+      if timings is not None:
+        for stage, secs in timings.items():
+          metrics.add_time(stage, secs)
+        metrics.count('frames')
+      metrics.add_time('sequence', 0.0)
+  return (time.perf_counter()-start_time)*1e9/n_frames
+
+def bare_loop(n_frames):
+  start_time = time.perf_counter()
+  for _ in range(n_frames):
+    stage_start = time.perf_counter()
+    for stage in ('landmarks', 'features', 'classify'):
+      stage_start = time.perf_counter()
+  return (time.perf_counter()-start_time)*1e9/n_frames
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Instrumentation overhead benchmark')
+  parser.add_argument('--frames', type=int, default=200000, help='number of simulated frames')
+  args = parser.parse_args()
+
+  bare = bare_loop(args.frames)
+  disabled = frame_loop(args.frames, Metrics(enabled=False), timed=False)
+  enabled = frame_loop(args.frames, Metrics(enabled=True), timed=True)
+  print("uninstrumented : %8.1f ns/frame" %bare)
+  print("disabled       : %8.1f ns/frame  (+%.1f ns)" %(disabled, disabled-bare))
+  print("enabled        : %8.1f ns/frame  (+%.1f ns)" %(enabled, enabled-bare))
@@ -0,0 +1,52 @@
+"""
+  Measures the landmark latency and mean skeleton visibility of each pose model tier on a
+  clip, then replays it with a latency budget and reports the tiers the processor settled on.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_model_tiers --video session.mp4 --budget 0.05
+"""
+import time
+import argparse
+import numpy as np
+from collections import Counter
+
+from utils.skeleton import LANDMARK_IDS
+from utils.frame_extractor import FrameExtractor
+from utils.frame_processor import FrameProcessor, MODEL_TIERS
+
+
+def replay(fproc, frames):
+  # returns the landmark latencies(ms), mean visibility and tier of every frame
+  latencies, visibilities, tiers = list(), list(), list()
+  for frame in frames:
+    start_time = time.perf_counter()
+    landmarks = fproc.get_frame_landmarks(frame)
+    latencies.append((time.perf_counter()-start_time)*1000)
+    visibilities.append(np.nan if landmarks is None else landmarks[LANDMARK_IDS, 2].mean())
+    tiers.append(fproc.model_tier())
+  return np.array(latencies), np.array(visibilities), tiers
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Pose model tier benchmark')
+  parser.add_argument('--video', default='../resources/videos/squats.gif', help='clip to replay')
+  parser.add_argument('--interval', type=int, default=100, help='frame sampling interval in ms')
+  parser.add_argument('--budget', type=float, default=0.05, help='latency budget in secs')
+  parser.add_argument('--passes', type=int, default=5, help='passes over the clip in the adaptive run')
+  args = parser.parse_args()
+
+  frames = [frame for _, frame in FrameExtractor(time_interval=args.interval).iter_frames(args.video)]
+  for complexity, tier in enumerate(MODEL_TIERS):
+    with FrameProcessor(static_image_mode=False, model_complexity=complexity) as fproc:
+      fproc.get_frame_landmarks(frames[0])
+      latencies, visibilities, _ = replay(fproc, frames)
+    print("%-6s : p50 %7.2f ms  p95 %7.2f ms  visibility %.3f" %(tier, np.percentile(latencies, 50),
+          np.percentile(latencies, 95), np.nanmean(visibilities)))
+
+  fproc = FrameProcessor(static_image_mode=False, latency_budget=args.budget, switch_interval=1.0)
+  latencies, visibilities, tiers = replay(fproc, frames*args.passes)
+  fproc.close()
+  print("adaptive(budget %.0f ms) : p50 %7.2f ms  p95 %7.2f ms  visibility %.3f  final tier %s" %(args.budget*1000,
+        np.percentile(latencies, 50), np.percentile(latencies, 95), np.nanmean(visibilities), tiers[-1]))
+  print("frames per tier : %s  switches : %d" %(dict(Counter(tiers)),
+        sum(1 for a, b in zip(tiers, tiers[1:]) if a != b)))
@@ -0,0 +1,151 @@
+"""
+  Measures how many skeletons per second the pose correction rules score, one frame at a
+  time and as a batch, against the original if/elif chain of FrameProcessor.pose_corrector.
+  Every frame must get the same feedback from all three.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_pose_rules --frames 20000
+"""
+import time
+import argparse
+import numpy as np
+
+from utils.skeleton import N_LANDMARKS, to_skeleton, extend_skeleton
+from utils.pose_rules import PoseCorrector
+
+
+POSE_CLASSES = ['jumping_jacks-start', 'jumping_jacks-end', 'crunches-start', 'crunches-end',
+  'lunges-start', 'lunges-end', 'planks-planks', 'squats-start', 'squats-end', 'random-random']
+
+
+class Point(object):
+  # joint in 2-D space, as used by the original checks
+  def __init__(self, x=0.0, y=0.0, visibility=0.0):
+    self.x, self.y, self.visibility = x, y, visibility
+
+  def __sub__(self, other):
+    return Point(self.x-other.x, self.y-other.y, (self.visibility+other.visibility)*0.5)
+
+def _get_distance(p1, p2):
+  p = p1 - p2
+  return np.sqrt(p.x**2 + p.y**2)
+
+def _get_angle(p1, p2, p3):
+  ab, bc = p1-p2, p3-p2
+  dot_prod = (ab.x*bc.x)+(ab.y*bc.y)
+  mod_prod = np.sqrt((ab.x**2+ab.y**2)*(bc.x**2+bc.y**2))
+  angle = np.rad2deg(np.arccos(dot_prod/mod_prod))
+  det = ab.x*bc.y - ab.y*bc.x
+  angle = 360-angle if det<0 else angle
+  return angle
+
+def legacy_corrector(skeleton, pose_clas):
+  """
+    The original FrameProcessor.pose_corrector, returns the feedback text else None. The
+    arms straight and planks range checks are fixed from 'and' to 'or', as in the rules
+  """
+  feedback = list()
+  ext = extend_skeleton(skeleton)[0]
+  (nose, left_shoulder, right_shoulder, left_hip, right_hip, left_elbow, right_elbow,
+      left_wrist, right_wrist, left_knee, right_knee, left_ankle, right_ankle, left_foot_idx,
+      right_foot_idx, neck, mid_hips, core, mid_knees, mid_ankle, ground) = [Point(*joint) for joint in ext]
+
+  if pose_clas.startswith('jumping_jacks'):
+    feet_width = _get_distance(left_ankle, right_ankle)
+    shoulder_width = _get_distance(left_shoulder, right_shoulder)
+    if pose_clas=='jumping_jacks-start':
+      left_hand_angle = _get_angle(left_shoulder, left_elbow, left_wrist)
+      left_hand_angle = min(left_hand_angle, 360-left_hand_angle)
+      right_hand_angle = _get_angle(right_shoulder, right_elbow, right_wrist)
+      right_hand_angle = min(right_hand_angle, 360-right_hand_angle)
+      if(feet_width <= shoulder_width*0.85):
+        feedback.append("Your feet are too close when starting Jumping Jacks.")
+      if(feet_width > 2*shoulder_width):
+        feedback.append("Your feet are too wide when starting Jumping Jacks.")
+      if((left_hand_angle < 120 or left_hand_angle > 180) or (right_hand_angle < 120 or right_hand_angle > 180)):
+        feedback.append("Keep your arms straight while doing Jumping Jacks.")
+    if pose_clas=='jumping_jacks-end':
+      if not(nose.y > left_wrist.y and nose.y > right_wrist.y):
+        feedback.append("Keep your arms above your head when ending Jumping Jacks.")
+      if(feet_width <= 1.5*shoulder_width):
+        feedback.append("Your feet are too close when ending Jumping Jacks.")
+      if(feet_width > 2.75*shoulder_width):
+        feedback.append("Your feet are too wide when ending Jumping Jacks.")
+
+  elif pose_clas.startswith('crunches'):
+    if pose_clas=='crunches-start':
+      body_angle = _get_angle(neck, core, mid_hips)
+      body_angle = min(body_angle, 360.0-body_angle)
+      if body_angle > 190 or body_angle < 170:
+        feedback.append("Lie down in a relaxed way while starting crunches.")
+    if pose_clas=='crunches-end':
+      body_angle = _get_angle(nose, core, mid_hips)
+      body_angle = min(body_angle, 360.0-body_angle)
+      if body_angle < 120 or body_angle > 160:
+        feedback.append("Raise your head slightly from neck while ending crunches.")
+
+  elif pose_clas.startswith('lunges'):
+    body_angle = _get_angle(neck, core, mid_hips)
+    body_angle = min(body_angle, 360.0-body_angle)
+    if body_angle > 190 or body_angle < 170:
+      feedback.append("Keep your core straight while doing lunges.")
+    if pose_clas=='lunges-end':
+      left_leg_angle = _get_angle(left_ankle, left_knee, left_hip)
+      left_leg_angle = min(left_leg_angle, 360.0-left_leg_angle)
+      right_leg_angle = _get_angle(right_ankle, right_knee, right_hip)
+      right_leg_angle = min(right_leg_angle, 360.0-right_leg_angle)
+      if ((left_leg_angle > 100 or left_leg_angle < 80) or (right_leg_angle > 100 or right_leg_angle < 80)):
+        feedback.append("While doing lunges your knees should be at right angles.")
+
+  elif pose_clas.startswith('planks'):
+    upper_body_angle = _get_angle(neck, core, mid_hips)
+    upper_body_angle = min(upper_body_angle, 360.0-upper_body_angle)
+    lower_body_angle = _get_angle(mid_hips, mid_knees, mid_ankle)
+    lower_body_angle = min(lower_body_angle, 360.0-lower_body_angle)
+    if upper_body_angle < 165 or upper_body_angle > 190:
+      feedback.append("Straighten your upper body while doing planks.")
+    if lower_body_angle < 165 or lower_body_angle > 190:
+      feedback.append("Straighten your lower body while doing planks.")
+
+  elif pose_clas.startswith('squats'):
+    if pose_clas=='squats-end':
+      if (right_knee.x-right_hip.x >= 0):
+        dist = right_foot_idx.x - right_knee.x
+      else:
+        dist = left_knee.x - left_foot_idx.x
+      if dist <= 0:
+        feedback.append("While doing squats your knees should not cross your toes.")
+
+  return " ".join(feedback) if len(feedback) else None
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Pose correction rules benchmark')
+  parser.add_argument('--frames', type=int, default=20000, help='number of random skeletons')
+  args = parser.parse_args()
+
+  rng = np.random.default_rng(123)
+  landmarks = rng.uniform(0.1, 0.9, size=(args.frames, N_LANDMARKS, 3)).astype(np.float32)
+  skeletons = to_skeleton(landmarks, (720, 1280))
+  pose_classes = [str(clas) for clas in rng.choice(POSE_CLASSES, size=args.frames)]
+  corrector = PoseCorrector()
+
+  start_time = time.perf_counter()
+  legacy = [legacy_corrector(skel, clas) for skel, clas in zip(skeletons, pose_classes)]
+  legacy_time = time.perf_counter()-start_time
+
+  start_time = time.perf_counter()
+  single = [corrector.feedback(corrector.mask(skel, clas)) for skel, clas in zip(skeletons, pose_classes)]
+  single_time = time.perf_counter()-start_time
+
+  start_time = time.perf_counter()
+  batch = corrector.masks(skeletons, pose_classes)
+  batch_time = time.perf_counter()-start_time
+
+  differ = [k for k in range(args.frames) if single[k] != legacy[k]]
+  assert not differ, "Feedback differs from the original checks on %d frames, first %s : %r vs %r" %(len(differ),
+          pose_classes[differ[0]], single[differ[0]], legacy[differ[0]])
+  assert single == [corrector.feedback(mask) for mask in batch], "Batched masks differ from single frame masks"
+  print("frames with corrections : %.1f%%" %(100.0*np.mean(batch > 0)))
+  for name, elapsed in [('legacy', legacy_time), ('single', single_time), ('batch', batch_time)]:
+    print("%-6s : %12.1f frames/sec  %8.2f us/frame" %(name, args.frames/elapsed, elapsed*1e6/args.frames))
@@ -0,0 +1,45 @@
+"""
+  Compares the frames/sec of pose estimation with a new MediaPipe graph per frame (old 
+  behaviour), a persistent static image session and a persistent tracking session.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_pose_session --video ../resources/videos/squats.gif
+"""
+import time
+import argparse
+
+from utils.frame_extractor import FrameExtractor
+from utils.frame_processor import FrameProcessor
+
+
+def per_frame_graph(fproc, frames):
+  # the old path, which built and tore down a graph for every frame
+  for frame in frames:
+    with fproc.mp_pose.Pose(static_image_mode=True, min_detection_confidence=0.3,
+                            min_tracking_confidence=0.4) as pose:
+      pose.process(frame)
+
+def session(fproc, frames):
+  with fproc:
+    for frame in frames:
+      fproc._get_frame_landmarks(frame)
+
+def measure(name, func, fproc, frames):
+  start_time = time.time()
+  func(fproc, frames)
+  elapsed = time.time()-start_time
+  print("%-16s : %4d frames  %8.2f frames/sec" %(name, len(frames), len(frames)/elapsed))
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Pose session benchmark')
+  parser.add_argument('--video', default='../resources/videos/squats.gif', help='clip to read frames from')
+  parser.add_argument('--interval', type=int, default=100, help='frame sampling interval in ms')
+  args = parser.parse_args()
+
+  frames = FrameExtractor(time_interval=args.interval).get_frames(args.video)
+  assert frames, "No frames read from %s" %args.video
+
+  measure('per-frame graph', per_frame_graph, FrameProcessor(static_image_mode=True), frames)
+  measure('static session', session, FrameProcessor(static_image_mode=True), frames)
+  measure('tracking session', session, FrameProcessor(static_image_mode=False), frames)
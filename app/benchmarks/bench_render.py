@@ -0,0 +1,64 @@
+"""
+  Measures the CPU cost of rendering the camera preview, before and after the rendering
+  layer. The legacy path encodes every captured frame at full resolution, as st.image did
+  with the raw BGR frame, the renderer encodes downscaled frames at the preview rate on its
+  thread. Capture is simulated at --camera-fps from the frames of a clip.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_render --seconds 10
+"""
+import io
+import time
+import argparse
+
+import cv2
+from PIL import Image
+
+from utils.render import PreviewRenderer
+from utils.frame_extractor import FrameExtractor
+
+
+def legacy_encode(frame):
+  # what st.image(frame, channels='BGR') does for every camera frame
+  buffer = io.BytesIO()
+  Image.fromarray(frame[:, :, ::-1]).save(buffer, format='JPEG')
+  return buffer.getvalue()
+
+def capture(frames, seconds, camera_fps, render):
+  # simulates the capture loop, returns the CPU secs used and the frames rendered
+  cpu_start = time.process_time()
+  rendered, i = 0, 0
+  end_time = time.time()+seconds
+  while time.time() < end_time:
+    frame_start = time.time()
+    rendered += render(frames[i % len(frames)])
+    i += 1
+    time.sleep(max(0.0, 1.0/camera_fps-(time.time()-frame_start)))
+  return time.process_time()-cpu_start, rendered
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Preview rendering CPU benchmark')
+  parser.add_argument('--video', default='../resources/videos/squats.gif', help='clip to simulate the camera with')
+  parser.add_argument('--width', type=int, default=1280, help='camera frame width')
+  parser.add_argument('--height', type=int, default=720, help='camera frame height')
+  parser.add_argument('--camera-fps', type=int, default=30, help='camera frame rate')
+  parser.add_argument('--preview-fps', type=int, default=15, help='preview frame rate')
+  parser.add_argument('--preview-width', type=int, default=480, help='preview width')
+  parser.add_argument('--seconds', type=float, default=10.0, help='duration of each run')
+  args = parser.parse_args()
+
+  frames = [cv2.resize(frame, (args.width, args.height))
+            for _, frame in FrameExtractor(time_interval=100).iter_frames(args.video)]
+
+  cpu, rendered = capture(frames, args.seconds, args.camera_fps, lambda frame: bool(legacy_encode(frame)))
+  print("legacy   : %4d frames rendered  %6.2f ms CPU/rendered frame  %5.1f%% CPU" %(rendered,
+        cpu*1000/max(rendered, 1), cpu*100/args.seconds))
+
+  with PreviewRenderer(fps=args.preview_fps, width=args.preview_width) as renderer:
+    def render(frame):
+      renderer.submit(frame)
+      return renderer.latest() is not None
+    cpu, rendered = capture(frames, args.seconds, args.camera_fps, render)
+  print("renderer : %4d frames rendered  %6.2f ms CPU/rendered frame  %5.1f%% CPU" %(rendered,
+        cpu*1000/max(rendered, 1), cpu*100/args.seconds))
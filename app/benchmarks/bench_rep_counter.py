@@ -0,0 +1,82 @@
+"""
+  Feeds synthetic pose sequences to the streaming RepCounter and the original window
+  counter at different frame rates and drop rates. Reports the reps and plank seconds each
+  counted against the true totals, and the cost of an update.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_rep_counter
+"""
+import time
+import random
+import argparse
+from collections import Counter
+
+from utils.rep_counter import RepCounter
+
+
+class LegacyCounter(object):
+  # the original counting, a Counter over a sliced window and 0.2 secs per plank frame
+  def __init__(self):
+    self.clf_window, self.ongoing_pose, self.sets_counts = [], None, {}
+
+  def update(self, time_stamp, pose_clas=None):
+    if pose_clas is None:
+      return None, None
+    self.clf_window.append(pose_clas)
+    self.clf_window = self.clf_window[-3:]
+    pose_clas = Counter(self.clf_window).most_common(1)[0][0]
+    exc_clas = pose_clas.split('-')[0]
+    if exc_clas != 'random':
+      if pose_clas.endswith('-end') and (self.ongoing_pose == pose_clas.replace('end', 'start')):
+        self.sets_counts[exc_clas] = self.sets_counts.get(exc_clas, 0)+1
+      if pose_clas.endswith('planks'):
+        self.sets_counts[exc_clas] = self.sets_counts.get(exc_clas, 0)+0.2
+      self.ongoing_pose = pose_clas
+    return pose_clas, None
+
+
+def session(fps, drop_rate, reps=20, phase_secs=1.0, plank_secs=30.0, noise=0.05, seed=0):
+  """
+    returns a synthetic (time stamp, pose) sequence of squats and a plank sampled at fps,
+    with a fraction of the frames dropped and misclassified, and its true totals
+  """
+  rnd = random.Random(seed)
+  timeline = list()
+  for _ in range(reps):
+    timeline += [('squats-start', phase_secs), ('squats-end', phase_secs)]
+  timeline += [('random-random', 2.0), ('planks-planks', plank_secs)]
+  frames, t = list(), 0.0
+  for pose, secs in timeline:
+    end_time = t+secs
+    while t < end_time:
+      if rnd.random() >= drop_rate:
+        frames.append((t, pose if rnd.random() >= noise else 'random-random'))
+      t += 1.0/fps
+  return frames, {'squats': reps, 'planks': plank_secs}
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Rep counter accuracy and cost benchmark')
+  parser.add_argument('--reps', type=int, default=20, help='squats in the synthetic session')
+  args = parser.parse_args()
+
+  print("%6s %6s | %-24s | %-24s" %('fps', 'drop', 'legacy squats/planks', 'streaming squats/planks'))
+  for fps in (10, 5, 2):
+    for drop_rate in (0.0, 0.3):
+      frames, truth = session(fps, drop_rate, reps=args.reps)
+      results = list()
+      for counter in (LegacyCounter(), RepCounter()):
+        for time_stamp, pose in frames:
+          counter.update(time_stamp, pose)
+        results.append("%3d/%-3d  %6.1f/%-6.1f" %(counter.sets_counts.get('squats', 0), truth['squats'],
+                       counter.sets_counts.get('planks', 0), truth['planks']))
+      print("%6d %6.1f | %-24s | %-24s" %(fps, drop_rate, results[0], results[1]))
+
+  frames, _ = session(10, 0.0, reps=args.reps)
+  for name, counter_class in (('legacy', LegacyCounter), ('streaming', RepCounter)):
+    counter = counter_class()
+    start_time = time.perf_counter()
+    for _ in range(20):
+      for time_stamp, pose in frames:
+        counter.update(time_stamp, pose)
+    print("%-9s : %.2f us/update" %(name, (time.perf_counter()-start_time)*1e6/(20*len(frames))))
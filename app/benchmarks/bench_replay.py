@@ -0,0 +1,61 @@
+"""
+  Measures the size and replay speed of session recordings. The landmarks of a clip are
+  looped into a recording of the given length at the engine's sampling rate, which is then
+  replayed through features, classifier, corrector and counter, with and without classifying
+  again. Reports bytes per frame and replayed frames/sec against real time.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_replay --video ../resources/videos/squats.gif --hours 2
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from replay import replay
+from utils.skeleton import to_skeleton, visibility_status, get_features
+from utils.recording import SessionRecorder, load_recording
+from utils.frame_extractor import FrameExtractor
+from utils.frame_processor import FrameProcessor
+from utils.pose_classifier import PoseClassifier
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Session recording size and replay speed benchmark')
+  parser.add_argument('--video', default='../resources/videos/squats.gif', help='clip whose landmarks are looped')
+  parser.add_argument('--hours', type=float, default=1.0, help='length of the recording')
+  parser.add_argument('--interval', type=float, default=0.2, help='sampling interval of the recording in secs')
+  args = parser.parse_args()
+
+  pose_clf = PoseClassifier()
+  with FrameProcessor(static_image_mode=False) as fproc:
+    clip = [(frame.shape, fproc.get_frame_landmarks(frame))
+            for _, frame in FrameExtractor(time_interval=args.interval*1000).iter_frames(args.video)]
+  # the pose classes recorded with the frames, as the engine classifies them
+  clip_poses = list()
+  for shape, landmarks in clip:
+    skeleton = None if landmarks is None else to_skeleton(landmarks, shape)
+    if (skeleton is None) or (visibility_status(skeleton) is not None):
+      clip_poses.append(None)
+    else:
+      clip_poses.append(pose_clf.classify(get_features(skeleton, shape[0])))
+
+  n_frames = int(args.hours*3600/args.interval)
+  file_path = os.path.join(tempfile.mkdtemp(), 'bench.vfrec')
+  start_time = time.perf_counter()
+  with SessionRecorder(file_path, pose_clf.labels) as recorder:
+    for i in range(n_frames):
+      shape, landmarks = clip[i % len(clip)]
+      recorder.append(i*args.interval, shape, landmarks, clip_poses[i % len(clip)])
+  write_time = time.perf_counter()-start_time
+  size = os.path.getsize(file_path)
+
+  header, records = load_recording(file_path)
+  print("Recording : %d frames(%.1f hours), %.0f bytes/frame, %.1f MB, written at %.0f frames/sec" %(n_frames,
+        args.hours, size/n_frames, size/2**20, n_frames/write_time))
+  for name, clf in (('recorded poses', None), ('classified again', pose_clf)):
+    start_time = time.perf_counter()
+    replay(records, header['labels'], clf)
+    elapsed = time.perf_counter()-start_time
+    print("%-16s : %8.0f frames/sec  %7.0fx real time" %(name, n_frames/elapsed, n_frames*args.interval/elapsed))
+  os.remove(file_path)
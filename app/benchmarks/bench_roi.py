@@ -0,0 +1,53 @@
+"""
+  Compares full frame pose estimation against the landmark-guided region of interest on a
+  recorded clip. Reports the latency, pixels processed per frame, detection rate and the
+  mean landmark deviation of the region mode from the full frame mode.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_roi --video session.mp4
+"""
+import time
+import argparse
+import numpy as np
+
+from utils.frame_extractor import FrameExtractor
+from utils.frame_processor import FrameProcessor
+
+
+def run(fproc, frames):
+  # returns the landmarks of every frame(None if missed), the latency and pixels processed
+  landmarks, latencies, pixels = list(), list(), list()
+  for frame in frames:
+    box, fallbacks = fproc.roi_box, fproc.roi_fallbacks
+    start_time = time.perf_counter()
+    landmarks.append(fproc.get_frame_landmarks(frame))
+    latencies.append(time.perf_counter()-start_time)
+    # a frame which fell back to a full frame search processes both
+    processed = frame.shape[0]*frame.shape[1] if box is None else box[2]**2
+    if fproc.roi_fallbacks > fallbacks:
+      processed += frame.shape[0]*frame.shape[1]
+    pixels.append(processed)
+  return landmarks, np.array(latencies)*1000, np.mean(pixels)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Region of interest pose estimation benchmark')
+  parser.add_argument('--video', default='../resources/videos/squats.gif', help='clip to replay')
+  parser.add_argument('--interval', type=int, default=100, help='frame sampling interval in ms')
+  args = parser.parse_args()
+
+  frames = [frame for _, frame in FrameExtractor(time_interval=args.interval).iter_frames(args.video)]
+  results = dict()
+  for name, roi in [('full frame', False), ('roi', True)]:
+    with FrameProcessor(static_image_mode=False, roi=roi) as fproc:
+      fproc.get_frame_landmarks(frames[0])
+      fproc.reset()
+      results[name] = run(fproc, frames)
+
+  full = results['full frame'][0]
+  for name, (landmarks, latencies, pixels) in results.items():
+    detected = [lm is not None for lm in landmarks]
+    both = [(a, b) for a, b in zip(full, landmarks) if (a is not None) and (b is not None)]
+    deviation = np.mean([np.abs(a[:, :2]-b[:, :2]).mean() for a, b in both]) if both else float('nan')
+    print("%-10s : p50 %6.2f ms  p95 %6.2f ms  %9.0f px/frame  detected %.2f  deviation %.4f" %(name,
+          np.percentile(latencies, 50), np.percentile(latencies, 95), pixels, np.mean(detected), deviation))
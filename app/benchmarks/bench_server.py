@@ -0,0 +1,107 @@
+"""
+  Load generator for the inference server on localhost. The server is started with each batch
+  window, and 1, 4, 16, .. clients each stream the landmarks of a recorded clip over their own
+  WebSocket session as fast as they are answered(or JPEG frames with --jpeg). Reports the
+  throughput, p50/p95/p99 round trip latency and mean classification batch size.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_server --clients 1 4 16 64 --windows 0 0.002 0.005 0.01
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import numpy as np
+
+import cv2
+from tornado.httpclient import AsyncHTTPClient
+from tornado.websocket import websocket_connect
+
+from utils.frame_processor import FrameProcessor
+
+
+def read_clip(video):
+  # returns the landmark payloads and JPEG frames of the clip
+  capture = cv2.VideoCapture(video)
+  payloads, jpegs = list(), list()
+  with FrameProcessor() as fproc:
+    while True:
+      status, frame = capture.read()
+      if not status:
+        break
+      landmarks = fproc.get_frame_landmarks(frame)
+      if landmarks is not None:
+        payloads.append({'landmarks': landmarks.tolist(), 'shape': list(frame.shape[:2])})
+      jpegs.append(cv2.imencode('.jpg', frame)[1].tobytes())
+  capture.release()
+  return payloads, jpegs
+
+async def client(url, messages, seconds, latencies):
+  # streams the messages in a loop, one in flight, recording the round trip latencies
+  connection = await websocket_connect(url)
+  end_time, k = time.time()+seconds, 0
+  while time.time() < end_time:
+    start = time.time()
+    await connection.write_message(messages[k % len(messages)], binary=isinstance(messages[0], bytes))
+    await connection.read_message()
+    latencies.append(time.time()-start)
+    k += 1
+  connection.close()
+
+async def run(port, n_clients, messages, seconds):
+  # returns the throughput(requests/sec), the latencies and the server stats of the step
+  latencies = list()
+  tag = '%d-%d' %(n_clients, int(time.time()*1000))
+  start = time.time()
+  await asyncio.gather(*[client('ws://localhost:%d/sessions/bench%s-%d/ws' %(port, tag, i), messages, seconds,
+                                latencies) for i in range(n_clients)])
+  elapsed = time.time()-start
+  response = await AsyncHTTPClient().fetch('http://localhost:%d/stats' %port)
+  return len(latencies)/elapsed, np.array(latencies)*1000, json.loads(response.body)
+
+async def wait_ready(port, timeout=60.0):
+  end_time = time.time()+timeout
+  while time.time() < end_time:
+    try:
+      await AsyncHTTPClient().fetch('http://localhost:%d/stats' %port)
+      return
+    except Exception:
+      await asyncio.sleep(0.5)
+  raise RuntimeError("Server did not start")
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Inference server load generator')
+  parser.add_argument('--video', default='../resources/videos/squats.gif', help='clip streamed by every client')
+  parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16, 64], help='numbers of clients')
+  parser.add_argument('--windows', type=float, nargs='+', default=[0.0, 0.002, 0.005, 0.01],
+                      help='batch windows of the server in secs')
+  parser.add_argument('--jpeg', action='store_true', help='send JPEG frames instead of landmarks')
+  parser.add_argument('--workers', type=int, default=None, help='pose workers of the server')
+  parser.add_argument('--seconds', type=float, default=10.0, help='measured duration per step')
+  parser.add_argument('--port', type=int, default=8799, help='port of the server')
+  args = parser.parse_args()
+
+  payloads, jpegs = read_clip(args.video)
+  messages = jpegs if args.jpeg else [json.dumps(payload) for payload in payloads]
+  loop = asyncio.get_event_loop()
+  for window in args.windows:
+    command = [sys.executable, 'inference_server.py', '--port', str(args.port), '--address', '127.0.0.1',
+               '--batch-window', str(window)]
+    if args.workers is not None:
+      command += ['--workers', str(args.workers)]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    try:
+      loop.run_until_complete(wait_ready(args.port))
+      batches, rows = 0, 0
+      for n_clients in args.clients:
+        rate, latencies, stats = loop.run_until_complete(run(args.port, n_clients, messages, args.seconds))
+        mean_batch = (stats['rows']-rows)/max(stats['batches']-batches, 1)
+        batches, rows = stats['batches'], stats['rows']
+        print("window %4.1f ms  clients %3d : %8.1f req/sec  p50 %6.2f  p95 %6.2f  p99 %6.2f ms  batch %5.1f" %(
+              window*1000, n_clients, rate, *np.percentile(latencies, [50, 95, 99]), mean_batch))
+    finally:
+      server.terminate()
+      server.wait()
@@ -0,0 +1,54 @@
+"""
+  Measures how many sessions one host serves at a target latency. Synthetic streams are
+  replayed from a recorded clip, looped and paced to its frame rate, with 1, 2, .. sessions
+  on a shared pool of pose workers. Capacity is the largest number of sessions whose p95
+  latency stays within the target while each is served at its sampling rate, reported per
+  core.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_sessions --video session.mp4 --target 0.5 --max-sessions 12
+"""
+import time
+import argparse
+import numpy as np
+import multiprocessing as mp
+
+from session_manager import SessionManager
+
+
+def run(video, n_sessions, n_workers, interval, seconds, warmup):
+  # returns the p95 latency(secs) over all sessions and the lowest per-session processed rate
+  manager = SessionManager([video]*n_sessions, n_workers=n_workers, min_interval=interval, loop=True).start()
+  time.sleep(warmup)
+  start_processed = [session.processed for session in manager.sessions]
+  for session in manager.sessions:
+    session.latencies.clear()
+  time.sleep(seconds)
+  rates = [(session.processed-start)/seconds for session, start in zip(manager.sessions, start_processed)]
+  latencies = np.concatenate([np.array(session.latencies) for session in manager.sessions])
+  manager.stop()
+  return float(np.percentile(latencies, 95)) if len(latencies) else float('inf'), min(rates)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Sessions per core capacity benchmark')
+  parser.add_argument('--video', default='../resources/videos/squats.gif', help='clip to replay as every stream')
+  parser.add_argument('--target', type=float, default=0.5, help='target p95 latency in secs')
+  parser.add_argument('--interval', type=float, default=0.2, help='frame sampling interval of a session in secs')
+  parser.add_argument('--workers', type=int, default=mp.cpu_count(), help='number of pose workers')
+  parser.add_argument('--max-sessions', type=int, default=2*mp.cpu_count(), help='most sessions to try')
+  parser.add_argument('--seconds', type=float, default=20.0, help='measured duration per step')
+  parser.add_argument('--warmup', type=float, default=5.0, help='warm up duration per step')
+  args = parser.parse_args()
+
+  capacity = 0
+  for n_sessions in range(1, args.max_sessions+1):
+    p95, min_rate = run(args.video, n_sessions, args.workers, args.interval, args.seconds, args.warmup)
+    ok = (p95 <= args.target) and (min_rate >= 0.9/args.interval)
+    print("sessions %2d : p95 %7.1f ms  slowest session %5.2f frames/sec  %s" %(n_sessions, p95*1000, min_rate,
+          'ok' if ok else 'over target'))
+    if not ok:
+      break
+    capacity = n_sessions
+  print("Capacity : %d sessions at p95 <= %.0f ms, %.2f sessions per core(%d cores)" %(capacity, args.target*1000,
+        capacity/mp.cpu_count(), mp.cpu_count()))
@@ -0,0 +1,67 @@
+"""
+  Measures the time from SpeechEngine.say() to the start of audio playback, cold(nothing
+  rendered, every phrase is synthesized on first use) and warm(after the prewarm step).
+  The cold run renders into a fresh directory, --mute skips the actual playback.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_speech --mute
+"""
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import multiprocessing as mp
+
+from utils.speech_engine import SpeechEngine, known_phrases
+from utils.speech_backends import AudioPlayer, default_backend, default_player
+
+
+class TimedPlayer(AudioPlayer):
+  # reports the time every playback starts at, and plays through the wrapped player
+  def __init__(self, player, started):
+    self.player = player
+    self.started = started
+
+  def load(self, file_path):
+    return file_path if self.player is None else self.player.load(file_path)
+
+  def play(self, audio):
+    self.started.put(time.time())
+    if self.player is not None:
+      self.player.play(audio)
+
+
+def say_latencies(speech, started, phrases):
+  # returns the say() to playback start latency(ms) of every phrase
+  latencies = list()
+  for phrase in phrases:
+    start_time = time.time()
+    speech.say(phrase)
+    latencies.append((started.get(timeout=60)-start_time)*1000)
+  return np.array(latencies)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='SpeechEngine say to playback latency benchmark')
+  parser.add_argument('--mute', action='store_true', help='do not play the audio')
+  args = parser.parse_args()
+
+  backend = default_backend()
+  player = None if args.mute else default_player(backend)
+  phrases = known_phrases()
+  speech_dir = tempfile.mkdtemp()
+  try:
+    for name, prewarm in [('cold', False), ('warm', True)]:
+      started = mp.Queue()
+      speech = SpeechEngine(backend=backend, player=TimedPlayer(player, started), prewarm=prewarm,
+                            speech_dir=speech_dir)
+      start_time = time.time()
+      speech.ready.wait()
+      prewarm_time = time.time()-start_time
+      latencies = say_latencies(speech, started, phrases)
+      speech.stop()
+      print("%-5s : %d phrases  p50 %8.1f ms  p95 %8.1f ms  max %8.1f ms  (startup %.1f secs)" %(name,
+            len(phrases), np.percentile(latencies, 50), np.percentile(latencies, 95), latencies.max(), prewarm_time))
+  finally:
+    shutil.rmtree(speech_dir)
@@ -0,0 +1,105 @@
+"""
+  Measures the time to first classification, the startup the user waits for. A cold start
+  runs in a fresh interpreter, from its launch through the imports, model loading and warm
+  up to the first frame processed by the engine. A warm start reuses a ready engine, as the
+  app does across sessions, from reset() to the first frame processed. Both are tracked in
+  the suite's baseline, see benchmarks.suite.
+
+  Run from the app directory :
+    > python -m benchmarks.bench_startup --runs 5
+"""
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import numpy as np
+
+import cv2
+
+
+def first_frame(video):
+  """   returns the first frame of the clip   """
+  capture = cv2.VideoCapture(video)
+  status, frame = capture.read()
+  capture.release()
+  assert status, "No frames read from %s" %video
+  return frame
+
+def wait_processed(me, processed, timeout=60.0):
+  # waits for the engine to have processed the given number of frames
+  end_time = time.time()+timeout
+  while me.stats()['processed'] < processed:
+    assert time.time() < end_time, "Engine did not process the frame"
+    time.sleep(0.001)
+
+def cold_start(launched, video):
+  """   runs in a fresh interpreter, returns the times(secs) since its launch at each phase   """
+  frame = first_frame(video)
+  from main_engine import MainEngine
+  imported = time.time()
+  me = MainEngine(frame_shape=frame.shape)
+  created = time.time()
+  me.wait_ready()
+  ready = time.time()
+  me.push((ready, frame))
+  wait_processed(me, 1)
+  first = time.time()
+  me.speech.stop()
+  me.stop()
+  return {'imported': imported-launched, 'created': created-launched, 'ready': ready-launched,
+          'first': first-launched, 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024}
+
+def _stage(secs, peak_memory_mb):
+  # the times as a stage of the suite's results
+  latencies = np.array(secs)*1000
+  return {'calls': len(latencies), 'throughput': len(latencies)/(latencies.sum()/1000),
+          'p50': float(np.percentile(latencies, 50)), 'p95': float(np.percentile(latencies, 95)),
+          'p99': float(np.percentile(latencies, 99)), 'peak_memory_mb': peak_memory_mb}
+
+def startup_stages(video, runs=3):
+  """   returns the cold and warm time to first classification as suite stages, and the cold phases   """
+  cold = list()
+  for _ in range(runs):
+    out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_startup', '--video', video,
+                          '--child', repr(time.time())], stdout=subprocess.PIPE, check=True)
+    # the last line is the result, the engine prints on exit
+    cold.append(json.loads(out.stdout.decode().strip().splitlines()[-1]))
+
+  from main_engine import MainEngine
+  frame = first_frame(video)
+  me = MainEngine(frame_shape=frame.shape)
+  me.wait_ready()
+  warm = list()
+  for _ in range(runs):
+    processed = me.stats()['processed']
+    start_time = time.time()
+    me.reset()
+    me.push((start_time, frame))
+    wait_processed(me, processed+1)
+    warm.append(time.time()-start_time)
+  me.speech.stop()
+  me.stop()
+
+  stages = {'startup_cold': _stage([run['first'] for run in cold], max(run['peak_rss_mb'] for run in cold)),
+            'startup_warm': _stage(warm, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024)}
+  return stages, cold
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Time to first classification benchmark')
+  parser.add_argument('--video', default='../resources/videos/squats.gif', help='clip whose first frame is classified')
+  parser.add_argument('--runs', type=int, default=3, help='number of cold and warm starts')
+  parser.add_argument('--child', help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.child is not None:
+    print(json.dumps(cold_start(float(args.child), args.video)))
+    sys.exit(0)
+
+  stages, cold = startup_stages(args.video, args.runs)
+  for phase in ('imported', 'created', 'ready', 'first'):
+    print("cold %-8s : %8.0f ms after launch" %(phase, np.mean([run[phase] for run in cold])*1000))
+  for stage, res in stages.items():
+    print("%-12s : p50 %8.1f ms  p95 %8.1f ms" %(stage, res['p50'], res['p95']))
@@ -0,0 +1,175 @@
+"""
+  Per-stage benchmark suite of the frame pipeline. Replays fixed inputs - the images in
+  resources/data/test_data and the frames of a recorded clip - through every stage on its
+  own and then end to end, and reports throughput, p50/p95/p99 latency and peak memory of
+  each stage, along with the time to first classification of cold and warm engine starts(see
+  bench_startup). Results can be saved as a machine-readable baseline, and later runs checked
+  against it, failing when a stage's p95 latency regresses past the threshold.
+
+  Run from the app directory :
+    > python -m benchmarks.suite --save benchmarks/baseline.json
+    > python -m benchmarks.suite --check benchmarks/baseline.json --threshold 0.2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+import multiprocessing as mp
+
+import cv2
+
+from main_engine import analyse_frame
+from utils.worker import FrameRing
+from utils.skeleton import get_features
+from utils.frame_extractor import FrameExtractor
+from utils.frame_processor import FrameProcessor
+from utils.pose_classifier import PoseClassifier
+from utils.speech_engine import SpeechEngine
+from benchmarks.bench_startup import startup_stages
+
+
+def measure(func, inputs, repeat=1, warmup=2):
+  """
+    Calls func on every input(repeat times) and returns its throughput, latency percentiles
+    and peak traced memory. Memory is traced in a separate pass so it does not skew timings
+  """
+  for inp in inputs[:warmup]:
+    func(inp)
+  latencies = list()
+  for _ in range(repeat):
+    for inp in inputs:
+      start_time = time.perf_counter()
+      func(inp)
+      latencies.append(time.perf_counter()-start_time)
+  tracemalloc.start()
+  for inp in inputs:
+    func(inp)
+  peak_memory = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  latencies = np.array(latencies)*1000
+  return {'calls': len(latencies), 'throughput': len(latencies)/(latencies.sum()/1000),
+          'p50': float(np.percentile(latencies, 50)), 'p95': float(np.percentile(latencies, 95)),
+          'p99': float(np.percentile(latencies, 99)), 'peak_memory_mb': peak_memory/2**20}
+
+
+def _echo(inputs, outputs, ring):
+  # worker side of the queue transfer stage, acknowledges every frame it receives
+  while True:
+    inp = inputs.get()
+    if inp is None:
+      break
+    if isinstance(inp, int):
+      ring.get(inp)[0, 0]
+      ring.release(inp)
+    outputs.put(1)
+
+def queue_stages(frame):
+  """   returns the round trip of a frame to a worker process, pickled and through the ring   """
+  results = dict()
+  for name, use_ring in [('worker_queue', False), ('worker_ring', True)]:
+    ring = FrameRing(frame.shape) if use_ring else None
+    inputs, outputs = mp.Queue(), mp.Queue()
+    proc = mp.Process(target=_echo, args=(inputs, outputs, ring))
+    proc.start()
+
+    def transfer(frame):
+      inputs.put(ring.put(frame) if use_ring else frame)
+      outputs.get()
+    results[name] = measure(transfer, [frame]*100)
+    inputs.put(None)
+    proc.join()
+    if ring is not None:
+      ring.close()
+  return results
+
+
+def run(args):
+  test_dir = '../resources/data/test_data'
+  images = [cv2.imread(os.path.join(test_dir, file)) for file in sorted(os.listdir(test_dir))]
+  clip_frames = FrameExtractor(time_interval=100).get_frames(args.video)
+  fproc_static = FrameProcessor(static_image_mode=True)
+  fproc = FrameProcessor(static_image_mode=False)
+  pose_clf = PoseClassifier()
+  results = dict()
+
+  results['landmarks_static'] = measure(fproc_static._get_frame_landmarks, images, repeat=args.repeat)
+  results['landmarks_tracking'] = measure(fproc._get_frame_landmarks, clip_frames, repeat=args.repeat)
+
+  # the downstream stages replay the skeletons detected in the clip
+  fproc.reset()
+  skeletons = list()
+  for frame in clip_frames:
+    try:
+      skeleton = fproc.get_frame_skeleton(frame)
+    except AssertionError:
+      skeleton = None
+    if skeleton is not None:
+      skeletons.append((skeleton, frame.shape[0]))
+  assert skeletons, "No poses detected in %s" %args.video
+  features = [get_features(skeleton, height) for skeleton, height in skeletons]
+  labels = [pose_clf.classify(feats) for feats in features]
+
+  repeat = args.repeat*10
+  results['features'] = measure(lambda inp: get_features(*inp), skeletons, repeat=repeat)
+  results['classify'] = measure(pose_clf.classify, features, repeat=repeat)
+  results['pose_corrector'] = measure(lambda inp: fproc.pose_corrector(inp[1], inp[0][0]),
+                                      list(zip(skeletons, labels)), repeat=repeat)
+  results['lightcheck'] = measure(fproc.lightcheck, clip_frames, repeat=args.repeat)
+  results.update(queue_stages(clip_frames[0]))
+
+  speech = SpeechEngine()
+  results['speech_dispatch'] = measure(speech.say, ["Keep your core straight while doing lunges."]*100)
+  speech.stop()
+
+  fproc.reset()
+  results['end_to_end'] = measure(lambda frame: analyse_frame(fproc, pose_clf, frame, lightcheck=True),
+                                  clip_frames, repeat=args.repeat)
+  fproc.close()
+  fproc_static.close()
+  if args.startup_runs:
+    results.update(startup_stages(args.video, args.startup_runs)[0])
+  return results
+
+
+def check(results, baseline, threshold):
+  """   returns the stages whose p95 latency regressed more than threshold over the baseline   """
+  regressions = list()
+  for stage, base in baseline['stages'].items():
+    if stage in results and results[stage]['p95'] > base['p95']*(1+threshold):
+      regressions.append((stage, base['p95'], results[stage]['p95']))
+  return regressions
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Per-stage pipeline benchmark suite')
+  parser.add_argument('--video', default='../resources/videos/squats.gif', help='clip to replay')
+  parser.add_argument('--repeat', type=int, default=3, help='passes over the inputs per stage')
+  parser.add_argument('--startup-runs', type=int, default=3, help='cold and warm starts measured, 0 skips them')
+  parser.add_argument('--save', help='write the results as a baseline to this file')
+  parser.add_argument('--check', help='baseline file to check the results against')
+  parser.add_argument('--threshold', type=float, default=0.2, help='allowed p95 regression, 0.2 is 20%%')
+  args = parser.parse_args()
+
+  results = run(args)
+  print("%-20s %12s %10s %10s %10s %10s" %('stage', 'calls/sec', 'p50 ms', 'p95 ms', 'p99 ms', 'peak MB'))
+  for stage, res in results.items():
+    print("%-20s %12.1f %10.3f %10.3f %10.3f %10.2f" %(stage, res['throughput'], res['p50'], res['p95'],
+            res['p99'], res['peak_memory_mb']))
+
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump({'host': platform.node(), 'machine': platform.machine(), 'cpus': mp.cpu_count(),
+                 'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'stages': results}, f, indent=2)
+    print("Baseline saved to %s" %args.save)
+
+  if args.check:
+    with open(args.check) as f:
+      baseline = json.load(f)
+    regressions = check(results, baseline, args.threshold)
+    for stage, base_p95, p95 in regressions:
+      print("REGRESSION %s : p95 %.3f ms -> %.3f ms" %(stage, base_p95, p95))
+    sys.exit(1 if regressions else 0)
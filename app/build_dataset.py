@@ -0,0 +1,135 @@
+"""
+  Builds the training dataset from the images under resources/data/train_data. Raw pose
+  landmarks are cached per image, keyed by the hash of its contents, so re-builds only run
+  pose estimation on new or changed images and feature changes only recompute the geometry.
+  The dataset is written as NumPy arrays which can be memory-mapped, see load_dataset().
+
+  Images are expected at train_data/<class>/<sub-class>/<image>, or train_data/<class>/<image>
+  for poses without sub-classes(eg. planks).
+
+  Run from the app directory :
+    > python build_dataset.py --workers 4
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+import multiprocessing as mp
+
+import cv2
+
+from utils.dataset import content_hash
+from utils.skeleton import landmarks_array, to_skeleton, get_features
+from utils.frame_processor import FrameProcessor
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def list_images(data_dir):
+  """   returns the sorted (image path, class, sub-class) of all images under data_dir   """
+  images = list()
+  for root, _, files in os.walk(data_dir):
+    parts = os.path.relpath(root, data_dir).split(os.sep)
+    if parts[0] == '.':
+      continue
+    clas = parts[0]
+    subclas = parts[1] if len(parts) > 1 else clas
+    for file in files:
+      if file.lower().endswith(IMAGE_EXTENSIONS):
+        images.append((os.path.join(root, file), clas, subclas))
+  return sorted(images)
+
+
+_fproc = {}
+
+def _init_worker():
+  # training images are unrelated, so every image runs a full detection
+  _fproc['fproc'] = FrameProcessor(static_image_mode=True)
+
+def _detect(job):
+  # runs pose estimation on one image and caches its landmarks and shape
+  image_path, cache_path = job
+  image = cv2.imread(image_path)
+  if image is None:
+    # unreadable or corrupt, it gets no cache entry
+    return image_path, False
+  pose_landmarks = _fproc['fproc']._get_frame_landmarks(image)
+  landmarks = np.zeros((0, 3), dtype=np.float32) if pose_landmarks is None else landmarks_array(pose_landmarks)
+  # written under a temporary name first, so an interrupted build never leaves a partial entry
+  np.savez(cache_path+'.tmp.npz', landmarks=landmarks, shape=np.array(image.shape[:2]))
+  os.replace(cache_path+'.tmp.npz', cache_path+'.npz')
+  return image_path, True
+
+
+def build(data_dir, cache_dir, out_dir, workers):
+  """   builds the dataset, running pose estimation only for images missing from the cache   """
+  for dir_path in (cache_dir, out_dir):
+    if not os.path.isdir(dir_path):
+      os.makedirs(dir_path)
+
+  images = list_images(data_dir)
+  hashes = [content_hash(image_path) for image_path, _, _ in images]
+  jobs = [(image_path, os.path.join(cache_dir, hash_code)) for (image_path, _, _), hash_code in zip(images, hashes)
+          if not os.path.isfile(os.path.join(cache_dir, hash_code+'.npz'))]
+
+  start_time = time.time()
+  if jobs:
+    with mp.Pool(workers, initializer=_init_worker) as pool:
+      for image_path, readable in pool.imap_unordered(_detect, jobs):
+        if not readable:
+          print("Cannot read %s, skipped" %image_path)
+  print("Pose estimation ran on %d of %d images in %.1f secs" %(len(jobs), len(images), time.time()-start_time))
+
+  # the geometry is cheap, so features are always recomputed from the cached landmarks
+  rows = list()
+  for (image_path, clas, subclas), hash_code in zip(images, hashes):
+    cache_path = os.path.join(cache_dir, hash_code+'.npz')
+    if not os.path.isfile(cache_path):
+      # unreadable image
+      continue
+    with np.load(cache_path) as cached:
+      landmarks, shape = cached['landmarks'], tuple(cached['shape'])
+    if len(landmarks) == 0:
+      print("No pose detected in %s, skipped" %image_path)
+      continue
+    skeleton = to_skeleton(landmarks, shape)
+    rows.append((get_features(skeleton, shape[0]), clas, clas+'-'+subclas, hash_code, image_path))
+
+  if not rows:
+    # an existing dataset is left as it is
+    print("No pose detected in any of the %d images, dataset not written" %len(images))
+    return
+
+  classes = sorted(set(row[1] for row in rows))
+  subclasses = sorted(set(row[2] for row in rows))
+  np.save(os.path.join(out_dir, 'features.npy'), np.array([row[0] for row in rows], dtype=np.float64))
+  np.save(os.path.join(out_dir, 'class_ids.npy'), np.array([classes.index(row[1]) for row in rows], dtype=np.int16))
+  np.save(os.path.join(out_dir, 'subclass_ids.npy'), np.array([subclasses.index(row[2]) for row in rows], dtype=np.int16))
+  with open(os.path.join(out_dir, 'encodings.json'), 'w') as f:
+    json.dump({'classes': classes, 'subclasses': subclasses,
+               'sources': [{'image': row[4], 'hash': row[3]} for row in rows]}, f, indent=2)
+  print("Dataset of %d rows written to %s" %(len(rows), out_dir))
+
+
+def load_dataset(out_dir):
+  """
+    returns the memory-mapped features, class ids and sub-class ids, along with the
+    label encodings of a built dataset
+  """
+  arrays = [np.load(os.path.join(out_dir, name+'.npy'), mmap_mode='r')
+            for name in ('features', 'class_ids', 'subclass_ids')]
+  with open(os.path.join(out_dir, 'encodings.json')) as f:
+    encodings = json.load(f)
+  return arrays + [encodings]
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Build the training dataset with a landmark cache')
+  parser.add_argument('--data', default='../resources/data/train_data', help='training images directory')
+  parser.add_argument('--cache', default='../resources/data/landmark_cache', help='landmark cache directory')
+  parser.add_argument('--out', default='../resources/data/dataset', help='output directory')
+  parser.add_argument('--workers', type=int, default=mp.cpu_count(), help='number of processes')
+  args = parser.parse_args()
+  build(args.data, args.cache, args.out, args.workers)
@@ -0,0 +1,148 @@
+"""
+  Trains the single-stage distilled pose model, see utils.distilled, with the XGBoost+KNN
+  cascade as the teacher. The student is a small multi-layer perceptron trained on the
+  sub-class labels of expanded_data_v2.csv, plus jittered copies of the training rows
+  labelled by the cascade, so it also follows the teacher between the training poses. The
+  held out rows report the accuracy of both models and how often they agree.
+
+  Run from the app directory :
+    > python distill.py --hidden 64 --epochs 300
+  and select the model with POSE_MODEL=distilled
+"""
+import os
+import time
+import argparse
+import numpy as np
+
+from utils.dataset import load_csv
+from utils.pose_classifier import PoseClassifier
+from utils.distilled import DISTILLED_PATH, DistilledModel
+
+
+def stratified_split(labels, test_size, seed):
+  """   returns the train and test row indices, with each label split in the same ratio   """
+  rng = np.random.default_rng(seed)
+  train, test = list(), list()
+  for label in np.unique(labels):
+    rows = rng.permutation(np.flatnonzero(labels == label))
+    n_test = int(round(len(rows)*test_size))
+    test.extend(rows[:n_test])
+    train.extend(rows[n_test:])
+  return np.sort(train), np.sort(test)
+
+def jitter(features, copies, noise, rng):
+  """   returns copies of the rows with gaussian noise, scaled to each feature's spread   """
+  if copies == 0:
+    return features[:0]
+  scale = noise*features.std(axis=0)
+  rows = np.repeat(features, copies, axis=0)
+  return rows + rng.standard_normal(rows.shape)*scale
+
+def train_mlp(features, targets, n_labels, hidden=(64,), epochs=300, batch_size=128, lr=1e-3,
+              weight_decay=1e-4, seed=123):
+  """
+    Trains a ReLU multi-layer perceptron with softmax cross-entropy and Adam, in NumPy
+
+    Arguments:
+      features : (N, n_features) training rows
+      targets : N label ids
+      hidden : sizes of the hidden layers
+    Returns:
+      the feature mean and scale, and the (weights, bias) of each layer
+  """
+  rng = np.random.default_rng(seed)
+  mean = features.mean(axis=0)
+  scale = features.std(axis=0)
+  scale[scale == 0] = 1.0
+  x_all = (features-mean)/scale
+  sizes = [features.shape[1]] + list(hidden) + [n_labels]
+  # He initialisation for the ReLU layers
+  params = list()
+  for n_in, n_out in zip(sizes[:-1], sizes[1:]):
+    params.append(rng.standard_normal((n_in, n_out))*np.sqrt(2.0/n_in))
+    params.append(np.zeros(n_out))
+  moments = [np.zeros_like(p) for p in params]
+  velocities = [np.zeros_like(p) for p in params]
+  beta1, beta2, eps = 0.9, 0.999, 1e-8
+  step = 0
+
+  for epoch in range(epochs):
+    order = rng.permutation(len(x_all))
+    for start in range(0, len(order), batch_size):
+      rows = order[start:start+batch_size]
+      # forward, keeping the activations for the backward pass
+      activations = [x_all[rows]]
+      for k in range(0, len(params)-2, 2):
+        activations.append(np.maximum(activations[-1] @ params[k] + params[k+1], 0.0))
+      logits = activations[-1] @ params[-2] + params[-1]
+      logits -= logits.max(axis=1, keepdims=True)
+      probs = np.exp(logits)
+      probs /= probs.sum(axis=1, keepdims=True)
+      # gradient of the mean cross-entropy with respect to the logits
+      delta = probs
+      delta[np.arange(len(rows)), targets[rows]] -= 1.0
+      delta /= len(rows)
+
+      grads = [None]*len(params)
+      for k in range(len(params)-2, -1, -2):
+        grads[k] = activations[k//2].T @ delta + weight_decay*params[k]
+        grads[k+1] = delta.sum(axis=0)
+        if k > 0:
+          delta = (delta @ params[k].T)*(activations[k//2] > 0)
+
+      step += 1
+      for p, g, m, v in zip(params, grads, moments, velocities):
+        m *= beta1
+        m += (1-beta1)*g
+        v *= beta2
+        v += (1-beta2)*g*g
+        p -= lr*(m/(1-beta1**step))/(np.sqrt(v/(1-beta2**step))+eps)
+
+  layers = [(params[k], params[k+1]) for k in range(0, len(params), 2)]
+  return mean, scale, layers
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Distils the pose classifier cascade into a single-stage model')
+  parser.add_argument('--data', default='../resources/data/expanded_data_v2.csv', help='features csv')
+  parser.add_argument('--out', default=DISTILLED_PATH, help='.npz file the model is saved to')
+  parser.add_argument('--hidden', type=int, nargs='+', default=[64], help='sizes of the hidden layers')
+  parser.add_argument('--epochs', type=int, default=300, help='passes over the transfer set')
+  parser.add_argument('--lr', type=float, default=1e-3, help='learning rate')
+  parser.add_argument('--augment', type=int, default=4, help='jittered copies of each training row, labelled by the cascade')
+  parser.add_argument('--noise', type=float, default=0.05, help='jitter, as a fraction of each feature\'s std')
+  parser.add_argument('--test-size', type=float, default=0.3, help='fraction of rows held out')
+  parser.add_argument('--seed', type=int, default=123, help='seed of the split, jitter and initialisation')
+  args = parser.parse_args()
+
+  features, labels = load_csv(args.data)
+  teacher = PoseClassifier(model='cascade')
+  assert features.shape[1] == teacher.n_features, "Dataset has %d features, the cascade %d" %(features.shape[1], teacher.n_features)
+  unknown = set(labels) - set(teacher.labels)
+  assert not unknown, "Labels not known to the cascade : %s" %sorted(unknown)
+  label_ids = np.array([teacher.labels.index(label) for label in labels])
+  train, test = stratified_split(labels, args.test_size, args.seed)
+
+  # transfer set, the training rows with their true labels and the jittered rows with the teacher's
+  rng = np.random.default_rng(args.seed)
+  jittered = jitter(features[train], args.augment, args.noise, rng)
+  transfer_x = np.vstack((features[train], jittered))
+  transfer_y = np.concatenate((label_ids[train], teacher.classify_batch(jittered).astype(np.intp)))
+
+  start_time = time.time()
+  mean, scale, layers = train_mlp(transfer_x, transfer_y, len(teacher.labels), hidden=args.hidden,
+                                  epochs=args.epochs, lr=args.lr, seed=args.seed)
+  student = DistilledModel(mean, scale, layers, teacher.labels)
+  print("trained on %d rows in %.1f secs" %(len(transfer_x), time.time()-start_time))
+
+  noisy_test = jitter(features[test], 1, args.noise, rng)
+  for name, rows in (('test', features[test]), ('noisy test', noisy_test)):
+    teacher_pred = teacher.classify_batch(rows)
+    student_pred = student.predict(rows)
+    print("%-10s : cascade acc %.4f  distilled acc %.4f  agreement %.4f" %(name,
+            np.mean(teacher_pred == label_ids[test]), np.mean(student_pred == label_ids[test]),
+            np.mean(teacher_pred == student_pred)))
+
+  os.makedirs(os.path.dirname(args.out), exist_ok=True)
+  student.save(args.out)
+  print("saved %s, %d bytes of weights" %(args.out, student.nbytes()))
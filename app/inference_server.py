@@ -0,0 +1,321 @@
+"""
+  Local inference server for thin clients(browsers, tablets at the stations) which send their
+  frames, or the landmarks they computed themselves, instead of running the full stack. Pose
+  estimation runs in worker processes, each session sticking to one so that tracking is kept,
+  while the classification of requests arriving within a few milliseconds of each other is
+  micro-batched into one classifier call across all the sessions. Each session keeps its own
+  rep counting state.
+
+  Endpoints, per session id :
+    ws   /sessions/<id>/ws         binary messages are JPEG frames, text messages are landmark
+                                   payloads, every message is answered with its JSON result
+    POST /sessions/<id>/frame      JPEG frame in the body, returns the JSON result
+    POST /sessions/<id>/landmarks  landmark payload in the body, returns the JSON result
+    GET  /sessions/<id>            counts of the session, DELETE ends the session
+    GET  /stats                    sessions and micro-batching counters
+
+  A landmark payload is {"landmarks": [[x, y, visibility], ..], "shape": [height, width],
+  "time": secs} with the 33 MediaPipe landmarks normalised to the frame. "time" is optional,
+  the time of arrival is used without it. A result is {"seq", "pose", "added", "correction",
+  "error"}, along with "counts" as [sets_counts, pose_counts] whenever they change. A request
+  which fails gets {"error"} instead, with the status 400 for a bad request and 500 otherwise.
+
+  The server listens on 127.0.0.1 unless given another address, and accepts WebSockets from
+  pages of its own host and of the given origins only.
+
+  Run from the app directory :
+    > python inference_server.py --port 8765 --batch-window 0.005
+    > python inference_server.py --address 0.0.0.0 --origins http://192.168.1.20:8080
+"""
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import tornado.web
+import tornado.ioloop
+from tornado.log import app_log
+import tornado.websocket
+
+from utils.skeleton import N_LANDMARKS, to_skeleton, visibility_status, get_features
+from utils.rep_counter import SESSION_MAX_GAP, RepCounter
+from utils.pose_rules import PoseCorrector
+from utils.frame_processor import FrameProcessor
+from utils.pose_classifier import PoseClassifier
+
+
+# pose sessions of the streams served by a pose worker process
+_pose_worker = {}
+
+def _landmarks_task(session_id, jpeg):
+  # decodes a JPEG frame of a session and returns its landmarks(None if no pose) and shape
+  frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+  if frame is None:
+    raise ValueError("Invalid JPEG frame")
+  fproc = _pose_worker.get(session_id)
+  if fproc is None:
+    fproc = _pose_worker[session_id] = FrameProcessor(static_image_mode=False, roi=True)
+  return fproc.get_frame_landmarks(frame), frame.shape[:2]
+
+def _end_task(session_id):
+  # releases the pose session of an ended session
+  fproc = _pose_worker.pop(session_id, None)
+  if fproc is not None:
+    fproc.close()
+
+
+class MicroBatcher(object):
+  """
+    Classifies the feature rows of all the requests arriving within window secs of the
+    first one with a single classify_batch call
+
+    Arguments:
+      pose_clf : the PoseClassifier
+      window : time(secs) a batch is held open for more requests, 0 batches only the
+               requests already waiting on the event loop
+      max_batch : batch size at which the batch is classified right away
+  """
+  def __init__(self, pose_clf, window=0.005, max_batch=64):
+    self.pose_clf = pose_clf
+    self.window = window
+    self.max_batch = max_batch
+    self.pending = list()
+    self.timer = None
+    self.batches, self.rows = 0, 0
+
+  def classify(self, features):
+    """   returns a future of the pose class of a feature row   """
+    future = asyncio.get_event_loop().create_future()
+    self.pending.append((features, future))
+    if len(self.pending) >= self.max_batch:
+      self._flush()
+    elif self.timer is None:
+      self.timer = asyncio.get_event_loop().call_later(self.window, self._flush)
+    return future
+
+  def _flush(self):
+    if self.timer is not None:
+      self.timer.cancel()
+      self.timer = None
+    pending, self.pending = self.pending, list()
+    if not pending:
+      return
+    try:
+      label_ids = self.pose_clf.classify_batch(np.array([features for features, _ in pending]))
+    except Exception as ex:
+      for _, future in pending:
+        future.set_exception(ex)
+      return
+    for (_, future), label_id in zip(pending, label_ids):
+      if not future.done():
+        future.set_result(self.pose_clf.labels[label_id])
+    self.batches += 1
+    self.rows += len(pending)
+
+
+class ServerSession(object):
+  """   counting state of a session, its frames are handled one at a time in arrival order   """
+  def __init__(self, executor):
+    self.executor = executor
+    self.counter = RepCounter(max_gap=SESSION_MAX_GAP)
+    self.last_counts = ({}, {})
+    self.seq = 0
+    self.lock = asyncio.Lock()
+
+
+class InferenceServer(object):
+  """
+    Sessions, pose workers and the classification batcher behind the endpoints
+
+    Arguments:
+      pose_workers : number of pose estimation processes
+      batch_window : time(secs) a classification batch is held open
+      max_batch : largest classification batch
+  """
+  def __init__(self, pose_workers=mp.cpu_count(), batch_window=0.005, max_batch=64):
+    self.pose_clf = PoseClassifier()
+    self.corrector = PoseCorrector()
+    self.batcher = MicroBatcher(self.pose_clf, batch_window, max_batch)
+    # single process executors, so that each session sticks to one pose worker
+    self.executors = [ProcessPoolExecutor(1) for _ in range(pose_workers)]
+    self.load = [0]*pose_workers
+    self.sessions = dict()
+
+  def session(self, session_id):
+    """   returns the session, starting it on the least loaded pose worker if it is new   """
+    session = self.sessions.get(session_id)
+    if session is None:
+      worker = self.load.index(min(self.load))
+      self.load[worker] += 1
+      session = self.sessions[session_id] = ServerSession(self.executors[worker])
+      session.worker = worker
+    return session
+
+  def end_session(self, session_id):
+    """   ends a session, returns its final counts   """
+    session = self.sessions.pop(session_id, None)
+    if session is None:
+      return None
+    self.load[session.worker] -= 1
+    session.executor.submit(_end_task, session_id)
+    return session.last_counts
+
+  def stats(self):
+    return {'sessions': len(self.sessions), 'batches': self.batcher.batches, 'rows': self.batcher.rows,
+            'mean_batch': self.batcher.rows/self.batcher.batches if self.batcher.batches else 0.0}
+
+  async def handle_frame(self, session_id, jpeg):
+    """   runs pose estimation on a JPEG frame of the session, returns the result   """
+    session = self.session(session_id)
+    time_stamp = time.time()
+    async with session.lock:
+      landmarks, shape = await asyncio.get_event_loop().run_in_executor(session.executor, _landmarks_task,
+                                                                        session_id, jpeg)
+      return await self._process(session, time_stamp, landmarks, shape)
+
+  async def handle_landmarks(self, session_id, payload):
+    """   processes a landmark payload of the session, returns the result   """
+    landmarks = np.asarray(payload['landmarks'], dtype=np.float32)
+    if landmarks.shape != (N_LANDMARKS, 3):
+      raise ValueError("Expected %d landmarks of x, y, visibility" %N_LANDMARKS)
+    session = self.session(session_id)
+    time_stamp = payload.get('time', time.time())
+    async with session.lock:
+      return await self._process(session, time_stamp, landmarks, tuple(payload['shape']))
+
+  async def _process(self, session, time_stamp, landmarks, shape):
+    # featurizes and classifies the landmarks, then updates the session's counts
+    skeleton, pose_clas, error_text = None, None, None
+    if landmarks is not None:
+      skeleton = to_skeleton(landmarks, shape)
+      error_text = visibility_status(skeleton)
+      if error_text is None:
+        pose_clas = await self.batcher.classify(get_features(skeleton, shape[0]))
+
+    counter = session.counter
+    pose_clas, added = counter.update(time_stamp, pose_clas)
+    correction = None
+    if added is not None:
+      correction = self.corrector.feedback(self.corrector.mask(skeleton, pose_clas))
+    session.seq += 1
+    result = {'seq': session.seq, 'pose': pose_clas, 'added': added, 'correction': correction, 'error': error_text}
+    counts = (counter.sets_counts, counter.pose_counts)
+    if counts != session.last_counts:
+      session.last_counts = (dict(counter.sets_counts), dict(counter.pose_counts))
+      result['counts'] = session.last_counts
+    return result
+
+  def close(self):
+    for executor in self.executors:
+      executor.shutdown()
+
+
+class _Handler(tornado.web.RequestHandler):
+  def initialize(self, server):
+    self.server = server
+
+  def write_error(self, status_code, **kwargs):
+    # the reason of the status, or the exception of a request which failed unexpectedly
+    error = self._reason
+    if 'exc_info' in kwargs and not isinstance(kwargs['exc_info'][1], tornado.web.HTTPError):
+      error = "%s : %s" %(kwargs['exc_info'][0].__name__, kwargs['exc_info'][1])
+    self.finish({'error': error})
+
+
+class FrameHandler(_Handler):
+  async def post(self, session_id):
+    try:
+      result = await self.server.handle_frame(session_id, self.request.body)
+    except ValueError as ex:
+      raise tornado.web.HTTPError(400, reason=str(ex))
+    self.write(result)
+
+
+class LandmarksHandler(_Handler):
+  async def post(self, session_id):
+    try:
+      result = await self.server.handle_landmarks(session_id, json.loads(self.request.body))
+    except (ValueError, KeyError) as ex:
+      raise tornado.web.HTTPError(400, reason=str(ex))
+    self.write(result)
+
+
+class SessionHandler(_Handler):
+  def get(self, session_id):
+    if session_id not in self.server.sessions:
+      raise tornado.web.HTTPError(404, reason="Unknown session")
+    self.write({'counts': self.server.sessions[session_id].last_counts})
+
+  def delete(self, session_id):
+    self.write({'counts': self.server.end_session(session_id)})
+
+
+class StatsHandler(_Handler):
+  def get(self):
+    self.write(self.server.stats())
+
+
+class SessionSocket(tornado.websocket.WebSocketHandler):
+  """   streams the result of every frame or landmark payload sent by a session's client   """
+  def initialize(self, server, origins=()):
+    self.server = server
+    self.origins = origins
+
+  def check_origin(self, origin):
+    # pages of this host, or of the origins the server was started with
+    return super().check_origin(origin) or (origin in self.origins)
+
+  def open(self, session_id):
+    self.session_id = session_id
+
+  async def on_message(self, message):
+    # messages of a connection are handled one after another
+    try:
+      if isinstance(message, bytes):
+        result = await self.server.handle_frame(self.session_id, message)
+      else:
+        result = await self.server.handle_landmarks(self.session_id, json.loads(message))
+    except (ValueError, KeyError) as ex:
+      result = {'error': str(ex)}
+    except Exception as ex:
+      # the connection stays open for the next message
+      app_log.exception("Message of session %s failed", self.session_id)
+      result = {'error': "%s : %s" %(type(ex).__name__, ex)}
+    await self.write_message(json.dumps(result))
+
+
+def make_app(server, origins=()):
+  """
+    returns the tornado application serving the endpoints of the server, origins are the
+    ones of the pages on other hosts allowed to open WebSockets
+  """
+  args = dict(server=server)
+  return tornado.web.Application([
+    (r'/sessions/([\w-]+)/ws', SessionSocket, dict(server=server, origins=tuple(origin.rstrip('/').lower() for origin in origins))),
+    (r'/sessions/([\w-]+)/frame', FrameHandler, args),
+    (r'/sessions/([\w-]+)/landmarks', LandmarksHandler, args),
+    (r'/sessions/([\w-]+)', SessionHandler, args),
+    (r'/stats', StatsHandler, args)])
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Local pose inference server')
+  parser.add_argument('--port', type=int, default=8765, help='port to listen on')
+  parser.add_argument('--address', default='127.0.0.1', help='address to listen on, 0.0.0.0 for all the interfaces')
+  parser.add_argument('--origins', nargs='*', default=[], help='origins of pages on other hosts allowed to open WebSockets')
+  parser.add_argument('--workers', type=int, default=mp.cpu_count(), help='number of pose estimation processes')
+  parser.add_argument('--batch-window', type=float, default=0.005, help='classification batch window in secs')
+  parser.add_argument('--max-batch', type=int, default=64, help='largest classification batch')
+  args = parser.parse_args()
+
+  server = InferenceServer(args.workers, args.batch_window, args.max_batch)
+  make_app(server, args.origins).listen(args.port, address=args.address)
+  print("Serving on %s:%d" %(args.address, args.port))
+  try:
+    tornado.ioloop.IOLoop.current().start()
+  finally:
+    server.close()
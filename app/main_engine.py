@@ -1,6 +1,15 @@
-from collections import Counter
+import time
+import queue
+import numpy as np
+import multiprocessing as mp
+from collections import deque, namedtuple
 
 from utils.worker import Worker
+from utils.metrics import Metrics
+from utils.frame_gate import FrameGate
+from utils.recording import SessionRecorder, ERROR as RECORD_ERROR, REUSED as RECORD_REUSED
+from utils.skeleton import N_FEATURES, get_features
+from utils.rep_counter import SESSION_MAX_GAP, RepCounter
 from utils.frame_processor import FrameProcessor
 from utils.pose_classifier import PoseClassifier
 from utils.speech_engine import SpeechEngine
@@ -8,16 +17,61 @@ from utils.speech_engine import SpeechEngine
 
 class MainEngine(Worker):
   """
-    This is the main driver class running all the utilities and sending updates to UI
+    This is the main driver class running all the utilities and sending updates to UI.
+    The models are loaded in the engine process, which sets the ready event once it can
+    classify, and the engine can be kept across sessions with reset().
+    The updates are events(see worker.EventChannel) of the kinds
+      'add' : name of the exercise whose count changed
+      'correction' : pose correction text for the added exercise, None if the pose is fine
+      'error' : error text, eg. a visibility or lighting problem
+      'counts' : (sets_counts, pose_counts), sent whenever they change
+      'metrics' : metrics snapshot, when metrics are enabled
+
+    Arguments:
+      frame_shape : shape of the camera frames, if given frames are passed through a
+                    shared memory frame ring instead of being pickled
+      n_slots : number of slots in the frame ring
+      latest_only : if True the engine always processes the freshest pushed frame and 
+                    drops the stale ones, else every pushed frame is processed
+      min_interval : minimum interval(secs) at which frames should be pushed
+      n_workers : number of processes running the per-frame stages in parallel, 1 runs
+                  them in the engine process itself. The pool hands frames to whichever 
+                  worker is free, so the workers detect the person on every frame instead
+                  of tracking it
+      metrics : if True, stage timings and counters are collected and published to the 
+                outputs as a 'metrics' event every metrics_interval secs
+      metrics_interval : interval(secs) between published metrics
+      metrics_file : if given, published metrics are also appended to this file
+      latency_budget : if given, the per-frame pose estimation time(secs) to stay within by
+                       moving between the lite, full and heavy pose models
+      gate : if True, a cheap check on a downscaled frame runs before pose estimation. 
+             Badly lit frames skip it, and still frames reuse the last result
+      record : if given, the landmarks and pose class of every processed frame are appended
+               to this recording file, which replay.py runs through the later stages
   """
-  def __init__(self):
-    # setup utilities
-    self.fproc = FrameProcessor()
-    self.pose_clf = PoseClassifier()
+  def __init__(self, frame_shape=None, n_slots=4, latest_only=False, min_interval=0.2, n_workers=1,
+               metrics=False, metrics_interval=5.0, metrics_file=None, gate=True, latency_budget=None,
+               record=None):
+    # setup utilities, the models are loaded by the engine process
+    self.latency_budget = latency_budget
     self.speech = SpeechEngine()
-    self.clf_window = []
-    self.last_lightcheck = None
-    self.pose_counts_hist = {}
+    self.latest_only = latest_only
+    self.min_interval = min_interval
+    self.n_workers = n_workers
+    self.metrics = Metrics(enabled=metrics, file_path=metrics_file)
+    self.metrics_interval = metrics_interval
+    self.gate = FrameGate() if gate else None
+    self.record = record
+    # counters shared with the caller's process
+    self.processed = mp.Value('i', 0)
+    self.dropped = mp.Value('i', 0)
+    self.proc_time = mp.Value('d', 0.0)
+    self.skipped = mp.Value('i', 0)
+    # set once the models are loaded and warmed up
+    self.ready = mp.Event()
+    if frame_shape is not None:
+      # frames in flight in the pool also hold a slot
+      self.create_ring(frame_shape, max(n_slots, 2*n_workers+2))
     self.run()
 
   def name(self):
@@ -25,61 +79,371 @@ class MainEngine(Worker):
 
   def push(self, time_frame):
     """   push a frame to the main engine for processing   """
-    self.inputs.put(time_frame)
+    time_stamp, frame = time_frame
+    slot = None if self.ring is None else self.ring.put(frame)
+    # only the slot index crosses the queue, the frame is pickled only if the ring is full
+    self.inputs.put(time_frame if slot is None else (time_stamp, slot))
+
+  def wait_ready(self, timeout=None):
+    """   waits up to timeout secs for the engine to be ready, returns True if it is   """
+    return self.ready.wait(timeout)
+
+  def reset(self):
+    """   starts a new session, the frames pushed before are completed and the counts cleared   """
+    self.inputs.put(Command('reset', None))
+
+  def set_metrics(self, enabled):
+    """   turns the metrics collection on or off   """
+    self.inputs.put(Command('metrics', enabled))
+
+  def sample_interval(self):
+    """   returns the interval(secs) at which frames should be pushed for the engine to keep up   """
+    # some headroom over the measured processing time, so that frames do not pile up
+    return max(self.min_interval, self.proc_time.value*1.2)
+
+  def stats(self):
+    """   returns the frame admission counters   """
+    processed, skipped = self.processed.value, self.skipped.value
+    return {'processed': processed, 'dropped': self.dropped.value, 'skipped': skipped,
+            'skip_ratio': skipped/processed if processed else 0.0,
+            'proc_time': self.proc_time.value, 'sample_interval': self.sample_interval()}
+
+  def _drop(self, inp):
+    # discards a stale frame, freeing its ring slot
+    time_stamp, frame = inp
+    if isinstance(frame, int):
+      self.ring.release(frame)
+    with self.dropped.get_lock():
+      self.dropped.value += 1
+
+  def _latest(self, inp):
+    # drains the inputs to the freshest frame, dropping the older ones. A command or the kill
+    # signal behind it is held back, so that the freshest frame is still processed before it
+    while _is_frame(inp):
+      try:
+        newer = self.inputs.get_nowait()
+      except queue.Empty:
+        break
+      if not _is_frame(newer):
+        self.held = newer
+        break
+      self._drop(inp)
+      inp = newer
+    return inp
   
+  def _analyse(self, frame, lightcheck):
+    # runs the stateless stages in this process and returns their result
+    start_time = time.time()
+    timings = {} if self.metrics.enabled else None
+    result = analyse_frame(self.fproc, self.pose_clf, frame, lightcheck, timings)
+    return result + (time.time()-start_time,)
+
+  def _warmup(self):
+    # runs the models once, so that the first frame does not pay for their initialisation
+    blank = np.zeros(self.ring.frame_shape if self.ring is not None else (480, 640, 3), dtype=np.uint8)
+    self.fproc._get_frame_landmarks(blank)
+    self.fproc.reset()
+    self.pose_clf.classify(np.zeros(N_FEATURES))
+
+  def _command(self, command):
+    # applies a command from the caller, once the frames pushed before it are completed
+    if command.name == 'reset':
+      self.counter.reset()
+      self.fproc.reset()
+      if self.gate is not None:
+        self.gate.reset()
+      self.metrics.reset()
+      self.last_result = (None, None, None, None)
+      self.last_lightcheck = None
+      self.last_counts = ({}, {})
+      self.outputs.emit('counts', self.last_counts)
+      self.outputs.flush()
+    elif command.name == 'metrics':
+      self.metrics.enabled = command.value
+
+  def _admit(self, time_stamp):
+    # decides the per-frame work which depends on the frame order, at dispatch time.
+    # We do a lightcheck after every 2 secs
+    lightcheck = (self.last_lightcheck is None) or (time_stamp-self.last_lightcheck > 2)
+    if lightcheck:
+      self.last_lightcheck = time_stamp
+    return lightcheck
+
+  def _gate(self, time_stamp, frame, lightcheck):
+    # returns the result of a frame which can skip pose estimation, else None. A still 
+    # frame gets a REUSED result, which is resolved when the frame is sequenced
+    start_time = time.perf_counter()
+    status, reuse = self.gate.check(frame, time_stamp)
+    if status is not None:
+      # badly lit, the user is told about it at the lightcheck interval
+      self.metrics.count('gate_light')
+      result = (None, None, status if lightcheck else None, None, None)
+    elif reuse:
+      self.metrics.count('gate_still')
+      result = (REUSED, None, None, None, None)
+    else:
+      return None
+    with self.skipped.get_lock():
+      self.skipped.value += 1
+    gate_time = time.perf_counter()-start_time
+    self.metrics.add_time('gate', gate_time)
+    return result + (gate_time,)
+
+  def _sequence(self, time_stamp, skeleton, pose_clas, error_text, timings, proc_time):
+    # the stateful stage, which has to see the frames in order of their time stamps
+    counter, metrics = self.counter, self.metrics
+    if timings is not None:
+      self._record(timings)
+    start_time = time.perf_counter()
+    try:
+      pose_clas, added = counter.update(time_stamp, pose_clas)
+      if added is not None:
+        # Get recommendation based on pose correction check
+        correction = self.fproc.pose_corrector(pose_clas, skeleton)
+        self.outputs.emit('add', added)
+        self.outputs.emit('correction', correction)
+
+      if error_text is not None:
+        self.outputs.emit('error', error_text)
+        self.speech.say(error_text)
+        metrics.error(error_text)
+      counts = (counter.sets_counts, counter.pose_counts)
+      if counts != self.last_counts:
+        # the counts only cross to the caller when they change
+        self.last_counts = (dict(counter.sets_counts), dict(counter.pose_counts))
+        self.outputs.emit('counts', self.last_counts)
+    except Exception as ex:
+      # a failure is an error of this frame, the engine carries on with the next one
+      self.outputs.emit('error', str(ex))
+      metrics.error(str(ex))
+    metrics.add_time('sequence', time.perf_counter()-start_time)
+
+    # moving average of the processing time, which paces the caller. With a pool of 
+    # workers, frames complete n_workers times as often
+    proc_time /= max(self.n_workers, 1)
+    self.proc_time.value = proc_time if self.processed.value == 0 else 0.8*self.proc_time.value+0.2*proc_time
+    with self.processed.get_lock():
+      self.processed.value += 1
+    if metrics.enabled and (time.time()-self.last_publish >= self.metrics_interval):
+      self._publish()
+    # the events of a frame are sent together
+    self.outputs.flush()
+
+  def _record(self, timings):
+    # adds the stage timings and flags of a frame from analyse_frame to the metrics
+    metrics = self.metrics
+    for stage in ('landmarks', 'features', 'classify', 'lightcheck'):
+      if stage in timings:
+        metrics.add_time(stage, timings[stage])
+    metrics.count('frames')
+    if not timings['detected']:
+      metrics.count('detection_miss')
+    if 'lightcheck' in timings:
+      metrics.count('lightcheck_runs')
+    if timings['light_fail']:
+      metrics.count('lightcheck_fails')
+    metrics.gauge('model_tier', timings['model_tier'])
+    metrics.count('tier_'+timings['model_tier'])
+
+  def _publish(self):
+    # publishes the metrics to the outputs, along with the queue depths and frame counters
+    metrics = self.metrics
+    for name, q in (('input_queue', self.inputs), ('output_queue', self.outputs)):
+      try:
+        metrics.gauge(name, q.qsize())
+      except NotImplementedError:
+        # qsize is not available on macOS
+        pass
+    metrics.gauge('processed', self.processed.value)
+    metrics.gauge('dropped', self.dropped.value)
+    metrics.gauge('skip_ratio', self.stats()['skip_ratio'])
+    self.outputs.emit('metrics', metrics.publish())
+    self.last_publish = time.time()
+
   def main(self):
-    ongoing_pose = None
-    # sets_counts keeps a count of all the completed exercise, whereas pose_counts keeps 
-    # count of all types of classified pose. These is later used for analysis between exercise
-    # and non-exercise(random) poses
-    pose_counts, sets_counts = {}, {}
+    # consecutive webcam frames are tracked instead of detecting the person every time
+    self.fproc = FrameProcessor(static_image_mode=False, roi=True, latency_budget=self.latency_budget)
+    self.pose_clf = PoseClassifier()
+    self.counter = RepCounter(max_gap=SESSION_MAX_GAP)
+    self.last_result = (None, None, None, None)
+    self.last_lightcheck = None
+    self.last_counts = ({}, {})
+    self.last_publish = time.time()
+    self.held = None
+    self.recorder = None if self.record is None else SessionRecorder(self.record, self.pose_clf.labels)
+
+    pool = None
+    if self.n_workers > 1:
+      # the workers are forked from this process once the models are loaded, and share them.
+      # They are forked before the warm up starts the threads of the models
+      pool = mp.Pool(self.n_workers, initializer=_init_analyser, initargs=(self.ring, self.pose_clf, self.latency_budget))
+    self._warmup()
+    # frames in flight in the pool, in the order they were pushed
+    pending = deque()
+    self.ready.set()
 
     while True:
-      inp = self.inputs.get()
+      # sequence the frames completed by the pool in the order they were pushed, waiting
+      # for the oldest one only when the pool is saturated
+      while pending and (pending[0][3].ready() or len(pending) >= 2*self.n_workers):
+        time_stamp, slot, frame_size, result = pending.popleft()
+        self._finish(time_stamp, slot, frame_size, result.get())
+      if self.held is not None:
+        inp, self.held = self.held, None
+      elif pending:
+        try:
+          inp = self.inputs.get(timeout=0.005)
+        except queue.Empty:
+          continue
+      else:
+        inp = self.inputs.get()
+
+      if self.latest_only:
+        inp = self._latest(inp)
       if (type(inp) is int) and (inp == 0):
         # this is the kill signal
         break
+      if isinstance(inp, Command):
+        while pending:
+          time_stamp, slot, frame_size, result = pending.popleft()
+          self._finish(time_stamp, slot, frame_size, result.get())
+        self._command(inp)
+        continue
       
+      time_stamp, frame = inp
+      slot = None
+      if isinstance(frame, int):
+        # frame is in the shared memory ring, it is read in place till the slot is released
+        slot = frame
+      frame_size = (self.ring.frame_shape if slot is not None else frame.shape)[:2]
+      lightcheck = self._admit(time_stamp)
+      if self.gate is not None:
+        result = self._gate(time_stamp, frame if slot is None else self.ring.get(slot), lightcheck)
+        if result is not None:
+          # queued behind the frames in flight, so that the results stay in order
+          if pending:
+            pending.append((time_stamp, slot, frame_size, _Done(result)))
+          else:
+            self._finish(time_stamp, slot, frame_size, result)
+          continue
+        # the gate has already checked the lighting
+        lightcheck = False
+      if pool is None:
+        frame = frame if slot is None else self.ring.get(slot)
+        self._finish(time_stamp, slot, frame_size, self._analyse(frame, lightcheck))
       else:
-        time_stamp, frame = inp
-        try:
-          # get features from frame
-          feats = self.fproc.get_frame_features(frame)
-          if feats is not None:
-            pose_clas = self.pose_clf.classify(feats)
-            # to avoid jitter we do smoothening using moving window
-            self.clf_window.append(pose_clas)
-            self.clf_window = self.clf_window[-3:]
-            pose_clas = Counter(self.clf_window).most_common(1)[0][0]
-            # Get recommendation based on pose correction check
-            correction = self.fproc.pose_corrector(pose_clas)
-
-            exc_clas = pose_clas.split('-')[0]
-            pose_counts[exc_clas] = pose_counts.get(exc_clas, 0)+1
-            # print(exercise_counts)
-            if exc_clas != 'random':
-              if pose_clas.endswith('-end') and (ongoing_pose is not None):
-                # Handles Jumping Jacks, Squats, Crunches, Lunges
-                if (ongoing_pose==pose_clas.replace('end', 'start')):
-                  sets_counts[exc_clas] = sets_counts.get(exc_clas, 0)+1
-                  self.outputs.put({'add': exc_clas, 'correction': correction, 'sets_counts': sets_counts,
-                                      'pose_counts': pose_counts})
-              if pose_clas.endswith('planks'):
-                # Handles planks. Planks are measured in milliseconds
-                sets_counts[exc_clas] = sets_counts.get(exc_clas, 0)+0.2
-                self.outputs.put({'add': 'planks', 'correction': correction, 'sets_counts': sets_counts,
-                                    'pose_counts': pose_counts})
-              ongoing_pose = pose_clas
-            
-          # we also do a lightcheck after every 2 secs
-          if (self.last_lightcheck is None) or (time_stamp-self.last_lightcheck > 2):
-            status = self.fproc.lightcheck(frame)
-            self.last_lightcheck = time_stamp
-            assert status is None, status
-        except Exception as ex:
-          error_text = str(ex)
-          self.outputs.put({'error':error_text, 'pose_counts': pose_counts, 'sets_counts': sets_counts})
-          self.speech.say(error_text)
-        finally:
-          pass
+        result = pool.apply_async(_analyse_task, (frame, lightcheck, self.metrics.enabled))
+        pending.append((time_stamp, slot, frame_size, result))
+
+    # complete the frames still in flight before exiting
+    while pending:
+      time_stamp, slot, frame_size, result = pending.popleft()
+      self._finish(time_stamp, slot, frame_size, result.get())
+    if pool is not None:
+      pool.close()
+      pool.join()
+    if self.recorder is not None:
+      self.recorder.close()
+    self.fproc.close()
+
+  def _finish(self, time_stamp, slot, frame_size, result):
+    # releases the frame's ring slot and passes its result to the stateful stage
+    if slot is not None:
+      self.ring.release(slot)
+    reused = result[0] is REUSED
+    if reused:
+      # a still frame, holding the last pose keeps counting(eg. plank time). The error of
+      # the last frame was already reported
+      skeleton, pose_clas, _, landmarks = self.last_result
+      result = (skeleton, pose_clas, None, landmarks) + result[4:]
+    else:
+      self.last_result = result[:4]
+    skeleton, pose_clas, error_text, landmarks, timings, proc_time = result
+    if self.recorder is not None:
+      flags = (RECORD_REUSED if reused else 0) | (RECORD_ERROR if error_text is not None else 0)
+      try:
+        self.recorder.append(time_stamp, frame_size, landmarks, pose_clas, flags)
+      except Exception as ex:
+        # the session carries on unrecorded for this frame
+        self.outputs.emit('error', 'Recording failed : %s' %ex)
+    self._sequence(time_stamp, skeleton, pose_clas, error_text, timings, proc_time)
+
+
+# result of a still frame, which reuses the last skeleton and pose class
+REUSED = 'reused'
+
+# a command to the engine, sent through its inputs in order with the frames
+Command = namedtuple('Command', ['name', 'value'])
+
+def _is_frame(inp):
+  return isinstance(inp, tuple) and not isinstance(inp, Command)
 
+
+class _Done(object):
+  # a result known at dispatch time, which waits in line with the pool's async results
+  def __init__(self, result):
+    self.result = result
+
+  def ready(self):
+    return True
+
+  def get(self):
+    return self.result
+
+
+# per-process state of the pool workers
+_analyser = {}
+
+def _init_analyser(ring, pose_clf, latency_budget):
+  # each pool worker owns its pose session, the classifier is the engine's. A worker gets
+  # whichever frames it is free for, not consecutive ones, so it has nothing to track
+  _analyser['fproc'] = FrameProcessor(static_image_mode=True, roi=False, latency_budget=latency_budget)
+  _analyser['pose_clf'] = pose_clf
+  _analyser['ring'] = ring
+
+def _analyse_task(frame, lightcheck, timed):
+  # runs the stateless stages in a pool worker, frame can be a ring slot index
+  start_time = time.time()
+  if isinstance(frame, int):
+    frame = _analyser['ring'].get(frame)
+  timings = {} if timed else None
+  result = analyse_frame(_analyser['fproc'], _analyser['pose_clf'], frame, lightcheck, timings)
+  return result + (time.time()-start_time,)
+
+def _lap(timings, stage, start_time):
+  # records the time of a stage when timings are collected, and returns the next start time
+  now = time.perf_counter()
+  if timings is not None:
+    timings[stage] = now-start_time
+  return now
+
+def analyse_frame(fproc, pose_clf, frame, lightcheck=False, timings=None):
+  """
+    Runs the stateless per-frame stages - landmarks, features, classification and the
+    optional lightcheck. Returns the skeleton, pose class, error text(if any), the raw
+    landmarks and the timings dict, which is filled with the stage timings and flags when
+    given
+  """
+  skeleton, pose_clas, error_text = None, None, None
+  detected, light_fail = True, False
+  start_time = time.perf_counter()
+  try:
+    skeleton = fproc.get_frame_skeleton(frame)
+    detected = skeleton is not None
+    start_time = _lap(timings, 'landmarks', start_time)
+    if skeleton is not None:
+      feats = get_features(skeleton, frame.shape[0])
+      start_time = _lap(timings, 'features', start_time)
+      pose_clas = pose_clf.classify(feats)
+      start_time = _lap(timings, 'classify', start_time)
+    if lightcheck:
+      status = fproc.lightcheck(frame)
+      start_time = _lap(timings, 'lightcheck', start_time)
+      light_fail = status is not None
+      assert status is None, status
+  except Exception as ex:
+    error_text = str(ex)
+  if timings is not None:
+    timings['detected'], timings['light_fail'] = detected, light_fail
+    timings['model_tier'] = fproc.model_tier()
+  return skeleton, pose_clas, error_text, fproc.landmarks, timings
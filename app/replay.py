@@ -0,0 +1,117 @@
+"""
+  Replays recorded sessions(see utils.recording) through the stages after pose estimation -
+  features, classification, pose corrections and rep counting - as fast as the CPU allows.
+  The records are memory-mapped and processed in chunks, the stateless stages over a whole
+  chunk at once and the counter sequentially, so hours of workouts replay in seconds and
+  threshold or counting changes can be checked against the same sessions every time.
+
+  Sessions are recorded from the app by setting RECORD_FILE, eg.
+    > RECORD_FILE=../recordings/station3.vfrec streamlit run app.py
+  and replayed from the app directory by
+    > python replay.py ../recordings/*.vfrec
+  With --recorded the classifier output saved in the recording is counted instead of
+  classifying again, which isolates changes to the counting logic.
+"""
+import time
+import argparse
+import numpy as np
+
+from utils.skeleton import POINT_NAMES, N_FEATURES, to_skeleton, visibility_mask, get_batch_features
+from utils.recording import DETECTED, load_recording, record_landmarks
+from utils.rep_counter import SESSION_MAX_GAP, RepCounter
+from utils.pose_rules import PoseCorrector
+from utils.pose_classifier import PoseClassifier
+
+
+def _chunk_skeletons(records):
+  # returns the skeletons and features of the records, a frame size at a time
+  landmarks = record_landmarks(records)
+  skeletons = np.empty((len(records), len(POINT_NAMES), 3), dtype=np.float32)
+  features = np.empty((len(records), N_FEATURES), dtype=np.float64)
+  shapes, inverse = np.unique(records['shape'], axis=0, return_inverse=True)
+  for k, (height, width) in enumerate(shapes.tolist()):
+    rows = np.flatnonzero(inverse == k)
+    skeletons[rows] = to_skeleton(landmarks[rows], (height, width))
+    features[rows] = get_batch_features(skeletons[rows], height)
+  return skeletons, features
+
+def replay(records, labels, pose_clf=None, corrector=None, counter=None, chunk_size=1<<16):
+  """
+    Runs the records of a recording through the later stages. The recorded pose classes
+    (pose ids indexing labels) are counted when pose_clf is None, else the frames are
+    classified again. Returns the per-frame pose classes, smoothed pose classes, and the
+    (time stamp, exercise, correction) of every count change
+  """
+  corrector = PoseCorrector() if corrector is None else corrector
+  counter = RepCounter(max_gap=SESSION_MAX_GAP) if counter is None else counter
+  labels = np.array(labels if pose_clf is None else pose_clf.labels, dtype=object)
+  n_records = len(records)
+  poses = np.full(n_records, None, dtype=object)
+  smoothed = np.full(n_records, None, dtype=object)
+  events = list()
+  for start in range(0, n_records, chunk_size):
+    chunk = np.asarray(records[start:start+chunk_size])
+    rows = np.flatnonzero(chunk['flags'] & DETECTED)
+    skeletons = np.empty((0, len(POINT_NAMES), 3), dtype=np.float32)
+    valid = np.zeros(0, dtype=bool)
+    if len(rows):
+      skeletons, features = _chunk_skeletons(chunk[rows])
+      # frames failing the visibility checks were not classified in the session either
+      valid = visibility_mask(skeletons)
+      if pose_clf is not None:
+        pose_ids = np.full(len(rows), -1, dtype=np.intp)
+        if valid.any():
+          pose_ids[valid] = pose_clf.classify_batch(features[valid])
+      else:
+        pose_ids = np.where(valid, chunk['pose'][rows], -1)
+      poses[start+rows[pose_ids >= 0]] = labels[pose_ids[pose_ids >= 0]]
+
+    added_rows, added = list(), list()
+    for i, time_stamp in enumerate(chunk['time'].tolist()):
+      smoothed[start+i], exercise = counter.update(time_stamp, poses[start+i])
+      if exercise is not None:
+        added_rows.append(i)
+        added.append(exercise)
+
+    # corrections are checked for the frames which changed the counts, in one batch
+    corrections = [None]*len(added)
+    # only the skeletons passing the visibility checks, the session had no skeleton for the others
+    skeleton_rows = np.full(len(chunk), -1, dtype=np.intp)
+    skeleton_rows[rows[valid]] = np.flatnonzero(valid)
+    checked = [k for k, i in enumerate(added_rows) if skeleton_rows[i] >= 0]
+    if checked:
+      masks = corrector.masks(skeletons[skeleton_rows[[added_rows[k] for k in checked]]],
+                              [smoothed[start+added_rows[k]] for k in checked])
+      for k, mask in zip(checked, masks):
+        corrections[k] = corrector.feedback(mask)
+    events.extend(zip(chunk['time'][added_rows].tolist(), added, corrections))
+  return poses, smoothed, events
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Replay recorded sessions through the later stages')
+  parser.add_argument('recordings', nargs='+', help='session recordings to replay')
+  parser.add_argument('--recorded', action='store_true', help='count the recorded pose classes instead of classifying')
+  parser.add_argument('--events', action='store_true', help='print every count change')
+  args = parser.parse_args()
+
+  pose_clf = None if args.recorded else PoseClassifier()
+  corrector = PoseCorrector()
+  total_frames, total_time = 0, 0.0
+  for file_path in args.recordings:
+    header, records = load_recording(file_path)
+    start_time = time.perf_counter()
+    counter = RepCounter(max_gap=SESSION_MAX_GAP)
+    poses, _, events = replay(records, header['labels'], pose_clf, corrector, counter)
+    elapsed = time.perf_counter()-start_time
+    total_frames, total_time = total_frames+len(records), total_time+elapsed
+    if args.events:
+      for time_stamp, exercise, correction in events:
+        print("  %.2f : %s %s" %(time_stamp, exercise, correction or ''))
+    summary = "%s : %d frames in %.3f secs  %s" %(file_path, len(records), elapsed, counter.sets_counts)
+    if pose_clf is not None:
+      # frames whose pose class changed from the one classified in the session, pose id -1 is None
+      recorded = np.array(header['labels'] + [None], dtype=object)[records['pose']]
+      summary += "  %d poses changed" %int((recorded != poses).sum())
+    print(summary)
+  print("Replayed %d frames at %.0f frames/sec" %(total_frames, total_frames/max(total_time, 1e-9)))
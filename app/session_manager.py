@@ -0,0 +1,308 @@
+"""
+  Runs many independent exercise sessions - camera streams, or video files standing in for
+  them - on one host. Every session keeps its own capture, frame gate and rep counting state,
+  while all of them share one loaded pose classifier and a bounded pool of pose estimation
+  workers. Each session sticks to one worker, which tracks the person across its frames.
+  The workers serve their sessions round robin, with at most one frame of a session in
+  flight and the freshest frame of each session waiting, so that a busy session cannot
+  starve the others.
+
+  Run from the app directory :
+    > python session_manager.py 0 1 ../recordings/station3.mp4 --workers 4
+"""
+import time
+import threading
+import argparse
+import numpy as np
+import multiprocessing as mp
+from collections import deque
+
+import cv2
+
+from main_engine import analyse_frame
+from utils.worker import FrameRing, Event
+from utils.sources import open_source
+from utils.frame_gate import FrameGate
+from utils.rep_counter import SESSION_MAX_GAP, RepCounter
+from utils.pose_rules import PoseCorrector
+from utils.frame_processor import FrameProcessor
+from utils.pose_classifier import PoseClassifier
+
+
+class Session(object):
+  """
+    One stream and its state. A capture thread reads the source, at its own frame rate for
+    video files, and keeps only the freshest frame sampled every min_interval secs.
+
+    Arguments:
+      session_id : index of the session in the manager
+      source : camera index or video file path
+      min_interval : interval(secs) at which frames are sampled for analysis
+      loop : if True a video file is replayed from the start when it ends
+      gate : if True, badly lit and still frames skip pose estimation(see FrameGate)
+  """
+  def __init__(self, session_id, source, min_interval=0.2, loop=False, gate=True):
+    self.session_id = session_id
+    self.source = source
+    self.min_interval = min_interval
+    self.loop = loop
+    self.capture = open_source(source)
+    status, frame = self.capture.read()
+    assert status, "Cannot read from %s" %str(source)
+    self.is_file = not str(source).isdigit()
+    self.ring = FrameRing(frame.shape, n_slots=2)
+    self.gate = FrameGate() if gate else None
+    self.counter = RepCounter(max_gap=SESSION_MAX_GAP)
+    self.last_result = (None, None, None)
+    self.last_counts = ({}, {})
+    self.last_lightcheck = None
+    self.lock = threading.Lock()
+    self.latest = None
+    self.events, self.seq = list(), 0
+    self.latencies = deque(maxlen=1000)
+    self.sampled, self.processed, self.dropped, self.skipped = 0, 0, 0, 0
+    self.running = False
+
+  def start(self):
+    self.running = True
+    self.thread = threading.Thread(target=self._capture, daemon=True)
+    self.thread.start()
+
+  def stop(self):
+    self.running = False
+    self.thread.join()
+    self.capture.release()
+    self.ring.close()
+
+  def _capture(self):
+    # reads the source and keeps the freshest sampled frame, replacing one not yet taken
+    frame_time = 1.0/(self.capture.get(cv2.CAP_PROP_FPS) or 30.0)
+    next_time, last_sample = time.time(), 0.0
+    while self.running:
+      status, frame = self.capture.read()
+      if not status:
+        if self.is_file and self.loop:
+          self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+          continue
+        break
+      if self.is_file:
+        # video files are paced to their frame rate, as a camera would deliver them
+        next_time += frame_time
+        time.sleep(max(0.0, next_time-time.time()))
+      now = time.time()
+      if now-last_sample >= self.min_interval:
+        last_sample = now
+        with self.lock:
+          if self.latest is not None:
+            self.dropped += 1
+          self.latest = (now, frame)
+          self.sampled += 1
+
+  def take(self):
+    """   returns the freshest sampled frame with its capture time, None if there is none   """
+    with self.lock:
+      latest, self.latest = self.latest, None
+    return latest
+
+  def admit(self, time_stamp):
+    """   returns True if a lightcheck is due, every 2 secs   """
+    lightcheck = (self.last_lightcheck is None) or (time_stamp-self.last_lightcheck > 2)
+    if lightcheck:
+      self.last_lightcheck = time_stamp
+    return lightcheck
+
+  def emit(self, kind, data=None):
+    with self.lock:
+      self.seq += 1
+      self.events.append(Event(self.seq, kind, data))
+
+  def drain(self):
+    """   returns the events of the session since the last drain   """
+    with self.lock:
+      events, self.events = self.events, list()
+    return events
+
+
+# per-process state of the pose workers. The classifier loaded by the manager is inherited
+# by the workers when they are forked, so all sessions share one copy of the models
+_worker = {}
+
+def _init_pose_worker(rings):
+  _worker['rings'] = rings
+  _worker['fprocs'] = {}
+  if 'pose_clf' not in _worker:
+    _worker['pose_clf'] = PoseClassifier()
+
+def _pose_task(session_id, frame, lightcheck):
+  # runs the stateless stages for a frame of a session, frame can be a ring slot index.
+  # Each worker keeps a pose session per stream it serves, so that tracking is not mixed up
+  if isinstance(frame, int):
+    frame = _worker['rings'][session_id].get(frame)
+  fproc = _worker['fprocs'].get(session_id)
+  if fproc is None:
+    fproc = _worker['fprocs'][session_id] = FrameProcessor(static_image_mode=False, roi=True)
+  skeleton, pose_clas, error_text, _, _ = analyse_frame(fproc, _worker['pose_clf'], frame, lightcheck)
+  return skeleton, pose_clas, error_text
+
+
+class SessionManager(object):
+  """
+    Runs the sessions of the given sources on a shared pool of pose estimation workers
+
+    Arguments:
+      sources : camera indices or video file paths, one per session
+      n_workers : number of pose estimation processes, session i is served by worker i%n_workers
+      min_interval : interval(secs) at which the frames of each session are sampled
+      loop : if True video files are replayed from the start when they end
+      gate : if True, badly lit and still frames skip pose estimation
+  """
+  def __init__(self, sources, n_workers=mp.cpu_count(), min_interval=0.2, loop=False, gate=True):
+    # a worker serves whole sessions, more workers than sessions would sit idle
+    self.n_workers = max(1, min(n_workers, len(sources)))
+    self.pose_clf = PoseClassifier()
+    self.corrector = PoseCorrector()
+    self.sessions = [Session(i, source, min_interval, loop, gate) for i, source in enumerate(sources)]
+    _worker['pose_clf'] = self.pose_clf
+    # single process pools, so that the consecutive frames of a session go to one worker
+    rings = [s.ring for s in self.sessions]
+    self.pools = [mp.Pool(1, initializer=_init_pose_worker, initargs=(rings,)) for _ in range(self.n_workers)]
+    # frame in flight of each session, as (capture time, ring slot, async result)
+    self.pending = dict()
+    self.next_session = 0
+    self.running = False
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.stop()
+
+  def start(self):
+    """   starts capturing all the sessions and scheduling their frames   """
+    self.running = True
+    for session in self.sessions:
+      session.start()
+    self.thread = threading.Thread(target=self._schedule, daemon=True)
+    self.thread.start()
+    return self
+
+  def stop(self):
+    """   stops all the sessions and the workers, returns their remaining events   """
+    self.running = False
+    self.thread.join()
+    for pool in self.pools:
+      pool.close()
+      pool.join()
+    for session in self.sessions:
+      session.stop()
+    return self.drain()
+
+  def drain(self):
+    """   returns the (session id, event) of all the sessions since the last drain   """
+    return [(session.session_id, event) for session in self.sessions for event in session.drain()]
+
+  def stats(self):
+    """   returns the frame counters and latency percentiles(ms) of every session   """
+    stats = list()
+    for session in self.sessions:
+      latencies = np.array(session.latencies)*1000
+      stats.append({'source': str(session.source), 'sampled': session.sampled, 'processed': session.processed,
+                    'dropped': session.dropped, 'skipped': session.skipped,
+                    'p50': float(np.percentile(latencies, 50)) if len(latencies) else float('nan'),
+                    'p95': float(np.percentile(latencies, 95)) if len(latencies) else float('nan')})
+    return stats
+
+  def _schedule(self):
+    # completes the frames done by the workers and dispatches the waiting ones round robin
+    n_sessions = len(self.sessions)
+    while self.running or self.pending:
+      progressed = False
+      for session_id, (time_stamp, slot, result) in list(self.pending.items()):
+        if result.ready():
+          del self.pending[session_id]
+          session = self.sessions[session_id]
+          if slot is not None:
+            session.ring.release(slot)
+          self._sequence(session, time_stamp, result.get())
+          progressed = True
+
+      # a worker has one frame in flight at a time
+      busy = set(session_id % self.n_workers for session_id in self.pending)
+      for k in range(n_sessions if self.running else 0):
+        if len(busy) >= self.n_workers:
+          break
+        session = self.sessions[(self.next_session+k) % n_sessions]
+        if (session.session_id in self.pending) or (session.session_id % self.n_workers in busy):
+          continue
+        latest = session.take()
+        if latest is None:
+          continue
+        # the next round starts after the session served last
+        self.next_session = (session.session_id+1) % n_sessions
+        if self._dispatch(session, *latest):
+          busy.add(session.session_id % self.n_workers)
+        progressed = True
+      if not progressed:
+        time.sleep(0.002)
+
+  def _dispatch(self, session, time_stamp, frame):
+    # gates the frame and sends it to the session's worker, or sequences it right away if it
+    # is skipped. Returns True if the frame was sent
+    lightcheck = session.admit(time_stamp)
+    if session.gate is not None:
+      status, reuse = session.gate.check(frame, time_stamp)
+      if (status is not None) or reuse:
+        session.skipped += 1
+        result = session.last_result if reuse else (None, None, status if lightcheck else None)
+        self._sequence(session, time_stamp, result)
+        return False
+      lightcheck = False
+    slot = session.ring.put(frame)
+    pool = self.pools[session.session_id % self.n_workers]
+    self.pending[session.session_id] = (time_stamp, slot, pool.apply_async(_pose_task,
+                                        (session.session_id, frame if slot is None else slot, lightcheck)))
+    return True
+
+  def _sequence(self, session, time_stamp, result):
+    # the stateful stage of a session, its frames arrive in order as only one is in flight
+    skeleton, pose_clas, error_text = result
+    session.last_result = result
+    counter = session.counter
+    pose_clas, added = counter.update(time_stamp, pose_clas)
+    if added is not None:
+      correction = None
+      if skeleton is not None:
+        correction = self.corrector.feedback(self.corrector.mask(skeleton, pose_clas))
+      session.emit('add', added)
+      session.emit('correction', correction)
+    if error_text is not None:
+      session.emit('error', error_text)
+    counts = (counter.sets_counts, counter.pose_counts)
+    if counts != session.last_counts:
+      session.last_counts = (dict(counter.sets_counts), dict(counter.pose_counts))
+      session.emit('counts', session.last_counts)
+    session.latencies.append(time.time()-time_stamp)
+    session.processed += 1
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Run many exercise sessions on one host')
+  parser.add_argument('sources', nargs='+', help='camera indices or video files, one per session')
+  parser.add_argument('--workers', type=int, default=mp.cpu_count(), help='number of pose estimation processes')
+  parser.add_argument('--interval', type=float, default=0.2, help='frame sampling interval in secs')
+  parser.add_argument('--loop', action='store_true', help='replay video files when they end')
+  parser.add_argument('--seconds', type=float, default=60.0, help='how long to run')
+  args = parser.parse_args()
+
+  with SessionManager(args.sources, n_workers=args.workers, min_interval=args.interval, loop=args.loop) as manager:
+    end_time = time.time()+args.seconds
+    while time.time() < end_time:
+      time.sleep(5.0)
+      for session_id, event in manager.drain():
+        if event.kind in ('add', 'error'):
+          print("session %d : %s %s" %(session_id, event.kind, event.data))
+      for session_id, stats in enumerate(manager.stats()):
+        print("session %d : %d processed  %d dropped  p95 %.1f ms" %(session_id, stats['processed'],
+              stats['dropped'], stats['p95']))
+  for session in manager.sessions:
+    print("session %d %s : %s" %(session.session_id, session.source, session.counter.sets_counts))
@@ -0,0 +1,203 @@
+"""
+  Trains the pose classifier cascade : the class model, and the sub-class model which also gets
+  the class id as a feature. Every candidate of the notebook's searches(LR, KNN, SVM, SGD and
+  XGBoost) is grid searched for both models, over cross validation folds computed once and
+  cached per dataset. Each pair of class and sub-class models is then timed on the deployment
+  path, PoseClassifier's classify() and classify_batch(), and the most accurate pair within the
+  latency budget is kept. Pairs whose accuracy is within the tolerance of the best are ties,
+  which go to the fastest.
+
+  The models and encoders are written to a new version under resources/models/cascade, with a
+  manifest of the dataset, the searches, the timings and the selection. The manifest of the
+  cascade directory points PoseClassifier to the current version.
+
+  Run from the app directory :
+    > python train_models.py --workers 4 --latency-budget 1.0
+"""
+import os
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+
+import joblib
+import sklearn
+import xgboost
+from sklearn.svm import SVC
+from sklearn.preprocessing import LabelEncoder
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.linear_model import SGDClassifier, LogisticRegression
+from sklearn.model_selection import GridSearchCV, StratifiedShuffleSplit, train_test_split
+from xgboost import XGBClassifier
+
+from utils.dataset import load_csv, content_hash
+from utils.pose_classifier import CASCADE_DIR, PoseClassifier
+
+
+SEED = 123
+
+
+def candidates():
+  """   returns the estimator and parameter grid of every candidate, as searched in the notebook   """
+  return {
+    'lr': (LogisticRegression(class_weight='balanced', max_iter=1000, random_state=SEED),
+           [{'penalty': ['l2'], 'solver': ['newton-cg', 'sag', 'lbfgs']},
+            {'penalty': ['elasticnet'], 'solver': ['saga'], 'l1_ratio': [0, 0.25, 0.5, 0.75, 1]}]),
+    'knn': (KNeighborsClassifier(),
+            {'n_neighbors': [3, 5, 7, 10, 15], 'weights': ['uniform', 'distance'],
+             'metric': ['cosine', 'minkowski', 'euclidean']}),
+    'svm': (SVC(class_weight='balanced', random_state=SEED),
+            {'C': [0.001, 0.01, 0.1, 1, 10], 'kernel': ['rbf', 'poly', 'sigmoid']}),
+    'sgd': (SGDClassifier(class_weight='balanced', early_stopping=False, random_state=SEED),
+            {'loss': ['log', 'modified_huber'], 'penalty': ['l2', 'elasticnet'], 'max_iter': [100, 300, 500, 700],
+             'alpha': [0.00001, 0.0001, 0.001, 0.01, 0.1], 'epsilon': [0.01, 0.05, 0.1]}),
+    'xgb': (XGBClassifier(use_label_encoder=False, eval_metric='mlogloss', n_jobs=1, random_state=SEED),
+            {'max_depth': [3, 5, 7], 'n_estimators': [5, 10, 20, 35, 60], 'learning_rate': [0.1, 0.2, 0.3, 0.5, 0.7]}),
+  }
+
+def cv_folds(labels, n_splits, cache_path):
+  """
+    returns the (train rows, validation rows) of each fold. The folds are shuffled and stratified
+    by label, and cached so every search and every re-run on the same data uses the same folds
+  """
+  if os.path.exists(cache_path):
+    with np.load(cache_path) as arrays:
+      return [(arrays['train%d' %k], arrays['val%d' %k]) for k in range(n_splits)]
+  splitter = StratifiedShuffleSplit(n_splits=n_splits, test_size=0.25, random_state=SEED)
+  folds = list(splitter.split(np.zeros(len(labels)), labels))
+  os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+  arrays = dict()
+  for k, (train, val) in enumerate(folds):
+    arrays['train%d' %k], arrays['val%d' %k] = train, val
+  np.savez(cache_path, **arrays)
+  return folds
+
+def search(name, features, targets, folds, scoring, workers):
+  """   grid searches a candidate, returns its refitted best model and the search summary   """
+  estimator, params = candidates()[name]
+  gs_cv = GridSearchCV(estimator, params, scoring=scoring, cv=folds, n_jobs=workers, refit=True, error_score='raise')
+  start_time = time.time()
+  gs_cv.fit(features, targets)
+  summary = {'best_params': gs_cv.best_params_, 'cv_score': float(gs_cv.best_score_),
+             'n_fits': len(gs_cv.cv_results_['params'])*len(folds), 'search_secs': time.time()-start_time}
+  return gs_cv.best_estimator_, summary
+
+def time_cascade(pose_clf, rows, batch_size, repeat=3):
+  """   returns the single row p50/p95 latency(ms) of classify(), and the ms per row of classify_batch()   """
+  pose_clf.classify_batch(rows[:batch_size])   # warm up
+  latencies = list()
+  for row in rows:
+    start_time = time.perf_counter()
+    pose_clf.classify(row)
+    latencies.append(time.perf_counter()-start_time)
+  latencies = np.array(latencies)*1000
+  start_time = time.perf_counter()
+  for _ in range(repeat):
+    for i in range(0, len(rows), batch_size):
+      pose_clf.classify_batch(rows[i:i+batch_size])
+  batch_ms = (time.perf_counter()-start_time)*1000/(repeat*len(rows))
+  return float(np.percentile(latencies, 50)), float(np.percentile(latencies, 95)), batch_ms
+
+def select(pairs, latency_budget, tolerance):
+  """   returns the most accurate pair within the latency budget, ties within tolerance go to the fastest   """
+  within = [pair for pair in pairs if pair['p95_ms'] <= latency_budget]
+  assert within, "No pair of models classifies within %.3f ms, fastest is %.3f ms" %(latency_budget,
+                  min(pair['p95_ms'] for pair in pairs))
+  best_accuracy = max(pair['accuracy'] for pair in within)
+  ties = [pair for pair in within if pair['accuracy'] >= best_accuracy-tolerance]
+  return min(ties, key=lambda pair: (pair['p95_ms'], pair['batch_ms']))
+
+def next_version(cascade_dir):
+  # versions are numbered v1, v2 ..
+  numbers = [int(name[1:]) for name in os.listdir(cascade_dir) if name[:1] == 'v' and name[1:].isdigit()]
+  return 'v%d' %(max(numbers, default=0)+1)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Trains and selects the pose classifier cascade')
+  parser.add_argument('--data', default='../resources/data/expanded_data_v2.csv', help='features csv')
+  parser.add_argument('--out', default=CASCADE_DIR, help='directory of the cascade versions')
+  parser.add_argument('--cache', default='../resources/data/cv_cache', help='directory of the cached folds')
+  parser.add_argument('--candidates', nargs='+', default=list(candidates()), choices=list(candidates()), help='models searched')
+  parser.add_argument('--workers', type=int, default=-1, help='parallel fits, -1 for all the cores')
+  parser.add_argument('--folds', type=int, default=5, help='cross validation folds')
+  parser.add_argument('--scoring', default='accuracy', help='sklearn scoring of the searches')
+  parser.add_argument('--latency-budget', type=float, default=1.0, help='p95 ms of a single row classify()')
+  parser.add_argument('--tolerance', type=float, default=0.002, help='accuracy difference counted as a tie')
+  parser.add_argument('--batch', type=int, default=64, help='batch size of the classify_batch() timing')
+  args = parser.parse_args()
+
+  dataset_hash = content_hash(args.data)
+  features, labels = load_csv(args.data)
+  clas = np.array([label.split('-', 1)[0] for label in labels])
+  rows = np.arange(len(labels))
+  train, test = train_test_split(rows, train_size=0.7, random_state=SEED, stratify=labels)
+
+  clas_encoder = LabelEncoder().fit(clas[train])
+  subclas_encoder = LabelEncoder().fit(labels[train])
+  clas_ids = clas_encoder.transform(clas)
+  label_ids = subclas_encoder.transform(labels)
+  # the sub-class model is trained with the true class id as its last feature
+  subclas_features = np.hstack((features, clas_ids[:, None]))
+
+  cache_path = os.path.join(args.cache, 'folds_%s_%d_%d.npz' %(dataset_hash[:12], args.folds, SEED))
+  folds = cv_folds(labels[train], args.folds, cache_path)
+
+  models = {'clas': dict(), 'subclas': dict()}
+  searches = {'clas': dict(), 'subclas': dict()}
+  for stage, stage_features, targets in (('clas', features, clas_ids), ('subclas', subclas_features, label_ids)):
+    for name in args.candidates:
+      models[stage][name], searches[stage][name] = search(name, stage_features[train], targets[train],
+                                                          folds, args.scoring, args.workers)
+      print("%-7s %-4s : cv %.4f  %4d fits in %6.1f secs  %s" %(stage, name, searches[stage][name]['cv_score'],
+              searches[stage][name]['n_fits'], searches[stage][name]['search_secs'], searches[stage][name]['best_params']))
+
+  # every pair is timed as it is deployed, the sub-class model gets the predicted class id
+  pairs = list()
+  for clas_name, subclas_name in itertools.product(args.candidates, args.candidates):
+    pose_clf = PoseClassifier.from_cascade(models['clas'][clas_name], models['subclas'][subclas_name],
+                                           clas_encoder, subclas_encoder)
+    pred = pose_clf.classify_batch(features[test])
+    accuracy = float(np.mean(np.array(pose_clf.labels)[pred] == labels[test]))
+    p50_ms, p95_ms, batch_ms = time_cascade(pose_clf, features[test], args.batch)
+    pairs.append({'clas': clas_name, 'subclas': subclas_name, 'accuracy': accuracy,
+                  'p50_ms': p50_ms, 'p95_ms': p95_ms, 'batch_ms': batch_ms})
+    print("%-4s + %-4s : test acc %.4f  p50 %7.3f ms  p95 %7.3f ms  batch %7.4f ms/row" %(clas_name,
+            subclas_name, accuracy, p50_ms, p95_ms, batch_ms))
+
+  selected = select(pairs, args.latency_budget, args.tolerance)
+  print("selected %(clas)s + %(subclas)s, test acc %(accuracy).4f  p95 %(p95_ms).3f ms" %selected)
+
+  os.makedirs(args.out, exist_ok=True)
+  version = next_version(args.out)
+  version_dir = os.path.join(args.out, version)
+  os.makedirs(version_dir)
+  files = {'clf_clas': 'clf_clas.model', 'clf_subclas': 'clf_subclas.model',
+           'clas_encoder': 'clas_encoder.model', 'subclas_encoder': 'subclas_encoder.model'}
+  joblib.dump(models['clas'][selected['clas']], os.path.join(version_dir, files['clf_clas']))
+  joblib.dump(models['subclas'][selected['subclas']], os.path.join(version_dir, files['clf_subclas']))
+  joblib.dump(clas_encoder, os.path.join(version_dir, files['clas_encoder']))
+  joblib.dump(subclas_encoder, os.path.join(version_dir, files['subclas_encoder']))
+
+  manifest = {'version': version, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'files': files,
+              'dataset': {'path': args.data, 'sha1': dataset_hash, 'rows': len(labels), 'train': len(train), 'test': len(test)},
+              'seed': SEED, 'folds': args.folds, 'scoring': args.scoring, 'latency_budget_ms': args.latency_budget,
+              'tolerance': args.tolerance, 'batch': args.batch, 'selected': selected, 'searches': searches, 'pairs': pairs,
+              'libraries': {'numpy': np.__version__, 'sklearn': sklearn.__version__, 'xgboost': xgboost.__version__,
+                            'joblib': joblib.__version__}}
+  with open(os.path.join(version_dir, 'manifest.json'), 'w') as f:
+    json.dump(manifest, f, indent=2, default=str)
+
+  # the cascade manifest makes the new version current, earlier versions are kept to roll back to
+  index_path = os.path.join(args.out, 'manifest.json')
+  index = {'current': version, 'versions': dict()}
+  if os.path.exists(index_path):
+    with open(index_path) as f:
+      index['versions'] = json.load(f)['versions']
+  index['versions'][version] = {'created': manifest['created'], 'dataset_sha1': dataset_hash, 'selected': selected}
+  # written under a temporary name first, so PoseClassifier never reads a partial manifest
+  with open(index_path+'.tmp', 'w') as f:
+    json.dump(index, f, indent=2)
+  os.replace(index_path+'.tmp', index_path)
+  print("saved %s, now the current cascade" %version_dir)
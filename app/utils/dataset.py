@@ -0,0 +1,26 @@
+"""
+  Helpers for the dataset and the files the scripts work on, kept out of the scripts so that
+  they can be shared without importing the pose estimation stack.
+"""
+import csv
+import hashlib
+import numpy as np
+
+
+def content_hash(file_path, chunk_size=1<<20):
+  """   returns the sha1 hex digest of the file contents   """
+  sha = hashlib.sha1()
+  with open(file_path, 'rb') as f:
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+      sha.update(chunk)
+  return sha.hexdigest()
+
+def load_csv(file_path):
+  """   returns the (N, n_features) features and the N 'class-subclass' labels of the dataset   """
+  with open(file_path, newline='') as f:
+    rows = list(csv.reader(f))
+  header, rows = rows[0], rows[1:]
+  n_features = len(header)-2   # the last two columns are Class and SubClass
+  features = np.array([row[:n_features] for row in rows], dtype=np.float64)
+  labels = np.array(['%s-%s' %(row[n_features], row[n_features+1]) for row in rows])
+  return features, labels
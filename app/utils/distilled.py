@@ -0,0 +1,56 @@
+"""
+  Single-stage pose model distilled from the cascade, see distill.py. It is a small
+  multi-layer perceptron over the standardised frame features which predicts the pose label
+  directly. The weights are stored as plain arrays in an .npz file and evaluated with NumPy
+  only, so the model needs neither xgboost nor sklearn at runtime.
+"""
+import numpy as np
+
+
+DISTILLED_PATH = '../resources/models/distilled/pose_mlp.npz'
+
+
+class DistilledModel(object):
+  """
+    Arguments:
+      mean, scale : per-feature standardisation, features are (x-mean)/scale
+      layers : list of (weights, bias) of the dense layers, all but the last are ReLU
+      labels : the pose label of every output
+  """
+  def __init__(self, mean, scale, layers, labels):
+    self.mean = np.asarray(mean, dtype=np.float32)
+    self.scale = np.asarray(scale, dtype=np.float32)
+    self.layers = [(np.asarray(w, dtype=np.float32), np.asarray(b, dtype=np.float32)) for w, b in layers]
+    self.labels = [str(label) for label in labels]
+    self.n_features = len(self.mean)
+
+  @classmethod
+  def load(cls, file_path=DISTILLED_PATH):
+    """   loads a model saved by save()   """
+    with np.load(file_path, allow_pickle=False) as arrays:
+      layers = [(arrays['w%d' %k], arrays['b%d' %k]) for k in range(int(arrays['n_layers']))]
+      return cls(arrays['mean'], arrays['scale'], layers, arrays['labels'])
+
+  def save(self, file_path):
+    """   saves the arrays of the model to an .npz file   """
+    arrays = {'mean': self.mean, 'scale': self.scale, 'labels': np.array(self.labels),
+              'n_layers': np.array(len(self.layers))}
+    for k, (w, b) in enumerate(self.layers):
+      arrays['w%d' %k], arrays['b%d' %k] = w, b
+    np.savez(file_path, **arrays)
+
+  def nbytes(self):
+    """   returns the memory held by the weights   """
+    return self.mean.nbytes + self.scale.nbytes + sum(w.nbytes+b.nbytes for w, b in self.layers)
+
+  def logits(self, features_matrix):
+    """   returns the (N, n_labels) scores for (N, n_features) frame features   """
+    x = (np.asarray(features_matrix, dtype=np.float32).reshape(-1, self.n_features)-self.mean)/self.scale
+    for w, b in self.layers[:-1]:
+      x = np.maximum(x @ w + b, 0.0)
+    w, b = self.layers[-1]
+    return x @ w + b
+
+  def predict(self, features_matrix):
+    """   returns the label ids for (N, n_features) frame features   """
+    return self.logits(features_matrix).argmax(axis=1)
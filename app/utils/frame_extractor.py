@@ -7,12 +7,46 @@ class FrameExtractor(object):
 
     Arguments:
       time_interval : time interval of frame capturing in ms (default 100ms)
+      scale : factor by which the frames are resized at extraction (default 1.0, no resize)
       debug : print info if debug is true
   """
-  def __init__(self, time_interval=100, debug=False):
+  def __init__(self, time_interval=100, scale=1.0, debug=False):
     self.time_interval = time_interval
+    self.scale = scale
     self.debug = debug
-  
+
+  def iter_frames(self, file_path):
+    """
+      Yields (timestamp_ms, frame) from video file at every time_interval. The video is
+      decoded sequentially, the frames in between are grabbed without being retrieved, so
+      only one frame is held in memory at a time
+
+      Arguments:
+        file_path : path to video file
+    """
+    assert os.path.isfile(file_path), "File not found: %s"%file_path
+    vidObj = cv2.VideoCapture(file_path)
+    fps = vidObj.get(cv2.CAP_PROP_FPS)
+    frame_count, next_time = 0, 0.0
+    try:
+      while vidObj.grab():
+        # prefer the frame rate for timestamps, as not all backends report the position
+        time_ms = frame_count*1000.0/fps if fps > 0 else vidObj.get(cv2.CAP_PROP_POS_MSEC)
+        frame_count += 1
+        if time_ms+1e-6 < next_time:
+          continue
+        status, image = vidObj.retrieve()
+        if not status:
+          break
+        if self.scale != 1.0:
+          image = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        yield time_ms, image
+        # the next frame due is the first one at or after the next interval mark
+        while next_time <= time_ms:
+          next_time += self.time_interval
+    finally:
+      vidObj.release()
+
   def get_frames(self, file_path):
     """
       Returns the frames from video file
@@ -22,24 +56,12 @@ class FrameExtractor(object):
     """
     assert os.path.isfile(file_path), "File not found: %s"%file_path
     try:
-      vidObj = cv2.VideoCapture(file_path)
-      frames, frame_count = list(), 0
-      # start reading video stream
-      status, image = vidObj.read()
-      while status:
-        frame_count += 1
-        frames.append(image)
-        # set the video time to the corret time as per time_interval
-        vidObj.set(cv2.CAP_PROP_POS_MSEC, frame_count*self.time_interval)
-        status, image = vidObj.read()
-      else:
-        if self.debug:
-          print("%d frames extracted." %frame_count)
+      frames = [image for _, image in self.iter_frames(file_path)]
+      if self.debug:
+        print("%d frames extracted." %len(frames))
 
     except Exception as ex:
       frames = None
       print("Error: %s" %str(ex))
 
     return frames
-
-
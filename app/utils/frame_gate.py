@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+
+
+DARK_MESSAGE = "Please come to a lighted area."
+BRIGHT_MESSAGE = "Your screen is overexposed. Please adjust."
+
+
+def small_gray(frame, size=(64, 48)):
+  """   returns the heavily downscaled grayscale of a BGR frame, size is (width, height)   """
+  small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+  return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+def light_status(gray, fraction=0.3, dark_threshold=30, bright_threshold=225):
+  """
+    Checks the light conditions of a grayscale image from a single histogram. Returns the
+    message for the user if more than fraction of the pixels are too dark or too bright,
+    else None
+  """
+  hist = np.bincount(gray.ravel(), minlength=256)
+  total_pixels = gray.size
+  if hist[:dark_threshold+1].sum()/total_pixels > fraction:
+    return DARK_MESSAGE
+  if hist[bright_threshold:].sum()/total_pixels > fraction:
+    return BRIGHT_MESSAGE
+  return None
+
+
+class FrameGate(object):
+  """
+    Cheap pre-inference gate on a downscaled copy of the frame. It flags bad lighting, and
+    frames with negligible motion since the last frame which ran pose estimation, whose
+    landmarks and classification can be reused instead.
+
+    Arguments:
+      size : (width, height) of the downscaled frame
+      motion_threshold : mean absolute gray level difference below which a frame is still
+      max_reuse : maximum time(secs) a result is reused for, after which a still frame
+                  runs pose estimation again
+  """
+  def __init__(self, size=(64, 48), motion_threshold=3.0, max_reuse=1.0):
+    self.size = size
+    self.motion_threshold = motion_threshold
+    self.max_reuse = max_reuse
+    self.reset()
+
+  def reset(self):
+    """   forgets the reference frame, so that the next frame runs pose estimation   """
+    self.last_gray = None
+    self.last_time_stamp = None
+
+  def check(self, frame, time_stamp):
+    """
+      Gates the frame at time_stamp(secs). Returns the light status(None if the lighting is
+      fine) and whether the last result can be reused for the frame
+    """
+    gray = small_gray(frame, self.size)
+    status = light_status(gray)
+    if status is not None:
+      # nothing reliable can be reused across bad lighting
+      self.reset()
+      return status, False
+    if (self.last_gray is not None) and (time_stamp-self.last_time_stamp < self.max_reuse):
+      # motion is measured against the last processed frame, so slow drifts add up
+      if cv2.absdiff(gray, self.last_gray).mean() < self.motion_threshold:
+        return None, True
+    self.last_gray, self.last_time_stamp = gray, time_stamp
+    return None, False
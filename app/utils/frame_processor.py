@@ -1,304 +1,291 @@
 import cv2
+import time
 import numpy as np
-import mediapipe as mp
 
-np.random.seed(123)
+from .skeleton import POINT_NAMES, LANDMARK_IDS, landmarks_array, to_skeleton, visibility_status, get_features
+from .pose_rules import PoseCorrector
+from .frame_gate import small_gray, light_status
 
+np.random.seed(123)
 
-class Point(object):
-  """
-    Class to denote a joint in 2-D space 
+# MediaPipe pose model complexities, from the fastest to the most accurate
+MODEL_TIERS = ['lite', 'full', 'heavy']
 
-    Arguments:
-      x, y : x-axis and y-axis co-ordinates
-      visibility : visibility score of the joint
-  """
-  def __init__(self, x=0.0, y=0.0, visibility=0.0):
-    self.x = x
-    self.y = y
-    self.visibility = visibility
-  
-  def __add__(self, other):
-    return Point(self.x+other.x, self.y+other.y, (self.visibility+other.visibility)*0.5)
-  
-  def __sub__(self, other):
-    return Point(self.x-other.x, self.y-other.y, (self.visibility+other.visibility)*0.5)
-  
-  def __mul__(self, num):
-    if (type(num) is int) or (type(num) is float):
-      return Point(self.x*num, self.y*num, self.visibility)
-    raise AttributeError("Multiplication allowed only with scalars")
-  
-  def __repr__(self):
-    return "x=%f  y=%f  visibility=%f" %(self.x, self.y, self.visibility)
+# mediapipe is slow to import, it is imported by the first FrameProcessor so that the
+# processes which never run pose estimation(eg. the UI) do not pay for it
+mp = None
 
+def _mediapipe():
+  global mp
+  if mp is None:
+    import mediapipe
+    mp = mediapipe
+  return mp
 
 
 class FrameProcessor(object):
   """
     Class containing utility methods for processing a frame and returning its 
-    featurized form
+    featurized form. It owns a long-lived MediaPipe pose session which is opened 
+    lazily on the first frame, so that it lives in the process which uses it.
+
+    Arguments:
+      static_image_mode : if True every frame runs a full person detection (use for
+                          unrelated images, eg. training data), else the previous 
+                          detection is tracked across consecutive video frames
+      min_detection_confidence : minimum confidence for person detection
+      min_tracking_confidence : minimum confidence for landmark tracking
+      roi : if True, the person's bounding box from the previous frame's landmarks is
+            tracked and only that region(with a margin) of the next frame is processed
+      roi_margin : margin added on each side of the bounding box, as a fraction of its size
+      roi_size : side of the square input the region is resized to
+      roi_min_visibility : mean visibility of the skeleton landmarks below which the region
+                           is dropped and the frame is searched in full
+      model_complexity : pose model tier to start with, index in MODEL_TIERS
+      latency_budget : if given, the per-frame landmark time(secs) to stay within. The model
+                       moves to a lighter tier when over it, and to a heavier tier when
+                       there is headroom and the landmark visibilities are low
+      low_visibility : mean visibility of the skeleton landmarks below which a heavier tier
+                       is tried
+      switch_interval : minimum time(secs) between two model switches
   """
-  def __init__(self):
-    self.mp_pose = mp.solutions.pose
-    self.mp_drawing = mp.solutions.drawing_utils
-    self.mp_drawing_styles = mp.solutions.drawing_styles
-    self.point_names = ['NOSE','LEFT_SHOULDER','RIGHT_SHOULDER','LEFT_HIP','RIGHT_HIP',
-      'LEFT_ELBOW','RIGHT_ELBOW' ,'LEFT_WRIST','RIGHT_WRIST','LEFT_KNEE','RIGHT_KNEE',
-      'LEFT_ANKLE','RIGHT_ANKLE','LEFT_FOOT_INDEX','RIGHT_FOOT_INDEX']
+  def __init__(self, static_image_mode=True, min_detection_confidence=0.3, min_tracking_confidence=0.4,
+               roi=False, roi_margin=0.25, roi_size=256, roi_min_visibility=0.5,
+               model_complexity=1, latency_budget=None, low_visibility=0.7, switch_interval=5.0):
+    solutions = _mediapipe().solutions
+    self.mp_pose = solutions.pose
+    self.mp_drawing = solutions.drawing_utils
+    self.mp_drawing_styles = solutions.drawing_styles
+    self.point_names = POINT_NAMES
+    self.static_image_mode = static_image_mode
+    self.min_detection_confidence = min_detection_confidence
+    self.min_tracking_confidence = min_tracking_confidence
+    self.pose = None
+    self.tracking = False
+    self.corrector = PoseCorrector()
+    self.skeleton = None
+    self.frame_height = None
+    # landmarks of the last frame, None if no pose was found in it
+    self.landmarks = None
+    self.roi = roi
+    self.roi_margin = roi_margin
+    self.roi_size = roi_size
+    self.roi_min_visibility = roi_min_visibility
+    # (x0, y0, side) of the square region in pixels, None searches the full frame
+    self.roi_box = None
+    self.roi_fallbacks = 0
+    self.model_complexity = model_complexity
+    self.latency_budget = latency_budget
+    self.low_visibility = low_visibility
+    self.switch_interval = switch_interval
+    self.last_switch = time.time()
+    # moving averages of the landmark time per tier and of the skeleton visibility
+    self.tier_time = dict()
+    self.visibility = None
+
+  def __enter__(self):
+    return self.open()
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def open(self):
+    """   opens the pose session, if it is not already open   """
+    if self.pose is None:
+      self.pose = self.mp_pose.Pose(static_image_mode=self.static_image_mode,
+                                    model_complexity=self.model_complexity,
+                                    min_detection_confidence=self.min_detection_confidence,
+                                    min_tracking_confidence=self.min_tracking_confidence)
+    self.tracking = False
+    return self
+
+  def reset(self):
+    """   drops the tracked person, so that the next frame runs a fresh detection   """
+    if self.pose is not None:
+      self.pose.reset()
+    self.tracking = False
+    self.roi_box = None
+
+  def close(self):
+    """   releases the pose session and its graph resources   """
+    if self.pose is not None:
+      self.pose.close()
+      self.pose = None
+    self.tracking = False
   
   def _get_frame_landmarks(self, frame):
     # returns the landmarks if pose is detected in the given image frame array, else None
-    with self.mp_pose.Pose(static_image_mode=True,min_detection_confidence=0.3,min_tracking_confidence=0.4) as pose:
-      results = pose.process(frame)
+    if self.pose is None:
+      self.open()
+    results = self.pose.process(frame)
+    if results.pose_landmarks is None and self.tracking:
+      # tracking is lost, start over from person detection on the next frame
+      self.reset()
+    self.tracking = (results.pose_landmarks is not None) and (not self.static_image_mode)
     return results.pose_landmarks
 
-  def _get_points_coordinates(self, pose_landmarks, frame_shape):
-    # returns the co-ordinates of the points after translational normalization
+  def _get_roi_landmarks(self, frame):
+    # returns the landmarks of the pose in the tracked region, mapped back to the full frame,
+    # else None if the pose is not found in it with enough confidence
+    x0, y0, side = self.roi_box
+    crop = frame[y0:y0+side, x0:x0+side]
+    interpolation = cv2.INTER_AREA if side > self.roi_size else cv2.INTER_LINEAR
+    pose_landmarks = self._get_frame_landmarks(cv2.resize(crop, (self.roi_size, self.roi_size),
+                                                          interpolation=interpolation))
+    if pose_landmarks is None:
+      return None
+    landmarks = landmarks_array(pose_landmarks)
+    if landmarks[LANDMARK_IDS, 2].mean() < self.roi_min_visibility:
+      return None
+    h, w = frame.shape[:2]
+    landmarks[:, 0] = (x0 + landmarks[:, 0]*side)/w
+    landmarks[:, 1] = (y0 + landmarks[:, 1]*side)/h
+    return landmarks
+
+  def _update_roi(self, landmarks, frame_shape):
+    # moves the region to the bounding box of the visible landmarks, with a margin. The
+    # region is kept while the person stays well inside it, so that the tracker sees a
+    # stable image, and the tracker is restarted whenever the region changes
     h, w = frame_shape[:2]
-    lhip, rhip = (pose_landmarks.landmark[self.mp_pose.PoseLandmark['LEFT_HIP']],
-                  pose_landmarks.landmark[self.mp_pose.PoseLandmark['RIGHT_HIP']])
-    
-    # find the mid-hip coordinates 
-    mid_hips = Point((lhip.x+rhip.x)*0.5, (lhip.y+rhip.y)*0.5, (lhip.visibility+rhip.visibility)*0.5)
-    points = list()
-    for name in self.point_names:
-      point = pose_landmarks.landmark[self.mp_pose.PoseLandmark[name]]
-      points.append(Point((point.x-mid_hips.x)*w, (point.y-mid_hips.y)*h, point.visibility))
-    
-    return points
-  
-  def _get_distance(self, p1, p2):
-    # returns euclidean dist between two points
-    p = p1 - p2
-    return np.sqrt(p.x**2 + p.y**2)
+    visible = landmarks[landmarks[:, 2] >= self.roi_min_visibility, :2]*(w, h)
+    box = None
+    if len(visible) >= len(LANDMARK_IDS)//2:
+      (x_min, y_min), (x_max, y_max) = visible.min(axis=0), visible.max(axis=0)
+      size = max(x_max-x_min, y_max-y_min)
+      side = max(int(size*(1+2*self.roi_margin)), 32)
+      if side < min(h, w):
+        box = self.roi_box
+        if box is not None:
+          x0, y0, cur_side = box
+          inner = cur_side*self.roi_margin/2
+          inside = (x_min >= x0+inner) and (y_min >= y0+inner) and (x_max <= x0+cur_side-inner) \
+                    and (y_max <= y0+cur_side-inner)
+          if not (inside and cur_side <= 2*side):
+            box = None
+        if box is None:
+          x0 = int(min(max((x_min+x_max-side)/2, 0), w-side))
+          y0 = int(min(max((y_min+y_max-side)/2, 0), h-side))
+          box = (x0, y0, side)
+    if box != self.roi_box:
+      self.reset()
+      self.roi_box = box
 
-  def _get_angle(self, p1, p2, p3):
-    # returns anti-clockwise angle made by point 2 with point 1 and 3
-    ab, bc = p1-p2, p3-p2
-    dot_prod = (ab.x*bc.x)+(ab.y*bc.y)
-    mod_prod = np.sqrt((ab.x**2+ab.y**2)*(bc.x**2+bc.y**2))
-    angle = np.rad2deg(np.arccos(dot_prod/mod_prod))   # in degrees
-    det = ab.x*bc.y - ab.y*bc.x   # determinant for correct quadrant
-    angle = 360-angle if det<0 else angle
-    return angle
+  def model_tier(self):
+    """   returns the name of the pose model tier in use   """
+    return MODEL_TIERS[self.model_complexity]
 
-  def get_frame_features(self, frame):
-    """   returns the featurized form of the given frame(image array)   """
-    pose_landmarks = self._get_frame_landmarks(frame)
-    features = None
-    self.coordinates = None
-    
-    if pose_landmarks is not None:
-      # get all the required body points
-      (nose, left_shoulder, right_shoulder, left_hip, right_hip, left_elbow, right_elbow, 
-      left_wrist, right_wrist, left_knee, right_knee, left_ankle, right_ankle, 
-      left_foot_idx, right_foot_idx) = self._get_points_coordinates(pose_landmarks, frame.shape)
-      
-      assert (nose.visibility>0.4), "Face not in frame"
-      assert (left_shoulder.visibility>0.4 and right_shoulder.visibility>0.4), "Shoulders not in frame"
-      assert (left_hip.visibility>0.4 and right_hip.visibility>0.4), "Body not in frame"
-      assert (left_foot_idx.visibility>0.4 and right_foot_idx.visibility>0.4), "Feet not in frame"
-      
-      # calculate the torso length which will be used to normalise the distances
-      neck = (left_shoulder + right_shoulder)*0.5
-      torso_len = (self._get_distance(neck, left_hip) + self._get_distance(neck, right_hip))*0.5
-      
-      # find body core - mid-point of line joining mid-shoulder and mid-hips
-      mid_hips = (left_hip + right_hip)*0.5
-      core = (neck + mid_hips)*0.5
-      
-      # calculate distance features
-      dist_feats = np.array([
-        # distance of limbs from body core
-            self._get_distance(core, nose),
-            # self._get_distance(core, left_shoulder), self._get_distance(core, right_shoulder),
-            self._get_distance(core, left_elbow), self._get_distance(core, right_elbow),
-            self._get_distance(core, left_wrist), self._get_distance(core, right_wrist),
-            # self._get_distance(core, left_hip), self._get_distance(core, right_hip),
-            self._get_distance(core, left_knee), self._get_distance(core, right_knee),
-            self._get_distance(core, left_ankle), self._get_distance(core, right_ankle),
-        
-        # 2-joints distances
-            self._get_distance(left_shoulder, left_wrist), self._get_distance(right_shoulder, right_wrist),
-            self._get_distance(left_hip, left_elbow), self._get_distance(right_hip, right_elbow),
-            self._get_distance(left_shoulder, left_knee), self._get_distance(right_shoulder, right_knee),
-            self._get_distance(left_hip, left_ankle), self._get_distance(right_hip, right_ankle),
-            self._get_distance(left_knee, left_foot_idx), self._get_distance(right_knee, right_foot_idx),
-        
-        # cross joint distances
-            self._get_distance(left_wrist, right_wrist), self._get_distance(left_elbow, right_elbow),
-            self._get_distance(left_shoulder, right_shoulder), self._get_distance(left_hip, right_hip),
-            self._get_distance(left_knee, right_knee)  #, self._get_distance(left_ankle, right_ankle)
-        ])
-      # normalise dist features
-      dist_feats /= torso_len
-      
-      # calculate angle features
-      ground = Point(core.x, frame.shape[0]-1, 0.9)
-      angle_feats = np.array([
-        # angles made by neck with both elbows, angles made by hips with both knees,
-        # spine angle, and body with respect to ground
-          self._get_angle(left_elbow, neck, right_elbow), self._get_angle(left_knee, mid_hips, right_knee),
-          self._get_angle(nose, neck, mid_hips), self._get_angle(nose, core, ground)
-      ])
-      angle_feats /= 360.0
-      
-      visibility_feats = np.array([
-        # visibility features of left and right profiles(upper and lower body)
-            (left_shoulder.visibility + left_hip.visibility)*0.5,
-            (left_hip.visibility + left_knee.visibility)*0.5,
-            (right_shoulder.visibility + right_hip.visibility)*0.5,
-            (right_hip.visibility + right_knee.visibility)*0.5
-        ])
-      
-      features = np.hstack((dist_feats, angle_feats, visibility_feats))
+  def _adapt(self, elapsed, landmarks):
+    # tracks the landmark time and visibility, and switches the model tier to stay within
+    # the latency budget. The heavier tier is taken only when its expected time(measured, or
+    # else assumed twice the current) fits the budget with some headroom
+    tier = self.model_complexity
+    prev = self.tier_time.get(tier)
+    self.tier_time[tier] = elapsed if prev is None else 0.8*prev+0.2*elapsed
+    if landmarks is not None:
+      visibility = float(landmarks[LANDMARK_IDS, 2].mean())
+      self.visibility = visibility if self.visibility is None else 0.8*self.visibility+0.2*visibility
+    if time.time()-self.last_switch < self.switch_interval:
+      return
 
-      # Save the coordinates for pose checking later
-      self.coordinates = (nose, left_shoulder, right_shoulder, left_hip, right_hip, left_elbow, right_elbow,
-            left_wrist, right_wrist, left_knee, right_knee, left_ankle, right_ankle, left_foot_idx, 
-            right_foot_idx, neck, torso_len, mid_hips, core, ground)
-    return features
+    new_tier = tier
+    if (self.tier_time[tier] > self.latency_budget) and (tier > 0):
+      new_tier = tier-1
+    elif (tier < len(MODEL_TIERS)-1) and (self.visibility is not None) and (self.visibility < self.low_visibility):
+      expected = self.tier_time.get(tier+1, 2*self.tier_time[tier])
+      if expected < 0.8*self.latency_budget:
+        new_tier = tier+1
+    if new_tier != tier:
+      # the session is re-opened with the new model on the next frame
+      self.close()
+      self.model_complexity = new_tier
+      self.last_switch = time.time()
 
-  def pose_corrector(self, pose_clas):
+  def get_frame_landmarks(self, frame):
     """
-      This function checks the Pose for various key-points specific to it and recommends
-      changes to the user. It uses the stored co-ordinates of just previously featurized frame.
+      returns the (33, 3) landmarks array, normalised to the full frame, of the pose in the
+      given frame(image array), else None. With roi, only the tracked region is processed
+      and the full frame is searched when the pose is lost in it
     """
-    feedback = list()
-    if self.coordinates is not None:
-      (nose, left_shoulder, right_shoulder, left_hip, right_hip, left_elbow, right_elbow,
-          left_wrist, right_wrist, left_knee, right_knee, left_ankle, right_ankle, left_foot_idx, 
-          right_foot_idx, neck, torso_len, mid_hips, core, ground) = self.coordinates
-
-      if pose_clas.startswith('jumping_jacks'):
-        feet_width = self._get_distance(left_ankle, right_ankle)
-        shoulder_width = self._get_distance(left_shoulder, right_shoulder)
-        body_angle = self._get_angle(neck, core, mid_hips)
-        body_angle = min(body_angle, 360.0-body_angle)
-        if pose_clas=='jumping_jacks-start':
-          # feet should be around (2*shoulder width) apart, hands stretched straight
-          left_hand_angle = self._get_angle(left_shoulder, left_elbow, left_wrist)
-          left_hand_angle = min(left_hand_angle, 360-left_hand_angle)
-          right_hand_angle = self._get_angle(right_shoulder, right_elbow, right_wrist)
-          right_hand_angle = min(right_hand_angle, 360-right_hand_angle)
-          
-          if(feet_width <= shoulder_width*0.85):
-            feedback.append("Your feet are too close when starting Jumping Jacks.")
-          if(feet_width > 2*shoulder_width):
-            feedback.append("Your feet are too wide when starting Jumping Jacks.")
-          if((left_hand_angle < 120 and left_hand_angle > 180) or (right_hand_angle < 120 and right_hand_angle > 180)):
-            feedback.append("Keep your arms straight while doing Jumping Jacks.")
+    start_time = time.perf_counter()
+    self.landmarks = None
+    # the session is opened lazily, on the first frame and after a tier switch
+    opened = self.pose is None
+    landmarks = self._find_landmarks(frame)
+    if (self.latency_budget is not None) and (not opened):
+      # the frame which built the graph is not a measure of the tier's latency
+      self._adapt(time.perf_counter()-start_time, landmarks)
+    self.landmarks = landmarks
+    return landmarks
 
-        if pose_clas=='jumping_jacks-end':
-          # Keep hands above head and legs (2-3 shoulder length) wide apart
-          if not(nose.y > left_wrist.y and nose.y > right_wrist.y):
-            feedback.append("Keep your arms above your head when ending Jumping Jacks.")
-          if(feet_width <= 1.5*shoulder_width):
-            feedback.append("Your feet are too close when ending Jumping Jacks.")
-          if(feet_width > 2.75*shoulder_width):
-            feedback.append("Your feet are too wide when ending Jumping Jacks.")
-
-      elif pose_clas.startswith('crunches'):
-        if pose_clas=='crunches-start':
-          body_angle = self._get_angle(neck, core, mid_hips)
-          body_angle = min(body_angle, 360.0-body_angle)
-          # Keep your body relaxed on ground
-          if body_angle > 190 or body_angle < 170:
-            feedback.append("Lie down in a relaxed way while starting crunches.")
-        if pose_clas=='crunches-end':
-          body_angle = self._get_angle(nose, core, mid_hips)
-          body_angle = min(body_angle, 360.0-body_angle)
-          # Keep your head slightly raised from ground
-          if body_angle < 120 or body_angle > 160:
-            feedback.append("Raise your head slightly from neck while ending crunches.")
+  def _find_landmarks(self, frame):
+    # returns the landmarks array of the pose in the region or the full frame, else None
+    if self.roi_box is not None:
+      landmarks = self._get_roi_landmarks(frame)
+      if landmarks is not None:
+        self._update_roi(landmarks, frame.shape)
+        return landmarks
+      # fall back to a full frame search
+      self.roi_fallbacks += 1
+      self.reset()
+    pose_landmarks = self._get_frame_landmarks(frame)
+    if pose_landmarks is None:
+      return None
+    landmarks = landmarks_array(pose_landmarks)
+    if self.roi:
+      self._update_roi(landmarks, frame.shape)
+    return landmarks
 
-      elif pose_clas.startswith('lunges'):
-        body_angle = self._get_angle(neck, core, mid_hips)
-        body_angle = min(body_angle, 360.0-body_angle)
-        # core straight 
-        if body_angle > 190 or body_angle < 170:
-          feedback.append("Keep your core straight while doing lunges.")
-        if pose_clas=='lunges-start':
-          pass
-        if pose_clas=='lunges-end':
-          # knees should not cross toes
-          left_leg_angle = self._get_angle(left_ankle, left_knee, left_hip)
-          left_leg_angle = min(left_leg_angle, 360.0-left_leg_angle)
-          right_leg_angle = self._get_angle(right_ankle, right_knee, right_hip)
-          right_leg_angle = min(right_leg_angle, 360.0-right_leg_angle)
-          if ((left_leg_angle > 100 or left_leg_angle < 80) or (right_leg_angle > 100 or right_leg_angle < 80)):
-            feedback.append("While doing lunges your knees should be at right angles.")
-      
-      elif pose_clas.startswith('planks'):
-        # check if the whole body is in straight line - 
-        # neck, core, mid-hips :: mid-hips, mid-knees, mid-ankle
-        upper_body_angle = self._get_angle(neck, core, mid_hips)
-        upper_body_angle = min(upper_body_angle, 360.0-upper_body_angle)
-        mid_knees = (left_knee + right_knee)*0.5
-        mid_ankle = (left_ankle + right_ankle)*0.5
-        lower_body_angle = self._get_angle(mid_hips, mid_knees, mid_ankle)
-        lower_body_angle = min(lower_body_angle, 360.0-lower_body_angle)
-        if upper_body_angle < 165 and upper_body_angle > 190:
-          feedback.append("Straighten your upper body while doing planks.")
-        if lower_body_angle < 165 and lower_body_angle > 190:
-          feedback.append("Straighten your lower body while doing planks.")
+  def get_frame_skeleton(self, frame):
+    """   returns the skeleton array of the pose in the given frame(image array), else None   """
+    landmarks = self.get_frame_landmarks(frame)
+    if landmarks is None:
+      return None
+    skeleton = to_skeleton(landmarks, frame.shape)
+    status = visibility_status(skeleton)
+    assert status is None, status
+    return skeleton
 
-      elif pose_clas.startswith('squats'):
-        if pose_clas=='squats-start':
-          pass
-        if pose_clas=='squats-end':
-          # knees should not cross toes
-          if (right_knee.x-right_hip.x >= 0):
-            # facing right
-            dist = right_foot_idx.x - right_knee.x
-          else:
-            dist = left_knee.x - left_foot_idx.x
-          if dist <= 0:
-            feedback.append("While doing squats your knees should not cross your toes.")
-      
-      else:
-        pass
+  def get_frame_features(self, frame):
+    """   returns the featurized form of the given frame(image array)   """
+    features = None
+    self.skeleton, self.frame_height = None, frame.shape[0]
+    self.skeleton = self.get_frame_skeleton(frame)
+    if self.skeleton is not None:
+      features = get_features(self.skeleton, self.frame_height)
+    return features
 
-    return " ".join(feedback) if len(feedback) else None
+  def pose_corrector(self, pose_clas, skeleton=None):
+    """
+      This function checks the Pose for various key-points specific to it and recommends
+      changes to the user. It checks the given skeleton, else the one of just previously 
+      featurized frame. See pose_rules.RULES for the checks.
+    """
+    skeleton = self.skeleton if skeleton is None else skeleton
+    if skeleton is None:
+      return None
+    return self.corrector.feedback(self.corrector.mask(skeleton, pose_clas))
   
   def lightcheck(self, frame):
     """   
       Function to check light conditions given an image frame
     """
-    thres, bright_thres, dark_thres = 0.3, 225, 30
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    total_pixels = np.size(gray)
-    dark_pixels = np.sum(gray <= dark_thres)
-    bright_pixels = np.sum(gray >= bright_thres)
-    
-    light_status = None
-    if dark_pixels/total_pixels > thres:
-      light_status = "Please come to a lighted area."
-    elif bright_pixels/total_pixels > thres:
-      light_status = "Your screen is overexposed. Please adjust."
-    else:
-      pass
-    return light_status
-
+    return light_status(small_gray(frame, (frame.shape[1]//4, frame.shape[0]//4)))
 
 
 if __name__ == '__main__':
-  import cv2
+  # featurizes the frames of a video, run from the app directory :
+  #   > python -m utils.frame_processor ../resources/videos/user_video_webcam.mp4
+  import sys
   import time
-  from frame_extractor import FrameExtractor
-
-  fproc = FrameProcessor()
-  # fex = FrameExtractor(time_interval=50)
-  # user_frames = fex.get_frames('../../resources/videos/user_video_webcam.mp4')
-  # for frame in user_frames:
-  #   start_time = time.time()
-  #   frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-  #   feats = fproc.get_frame_features(frame)
-  #   if feats is not None:
-  #     print(feats.shape)
-  #   else:
-  #     print("No features")
-  #   print("Time taken: %f" %(time.time()-start_time))
-  #   print('-'*50)
+  from .frame_extractor import FrameExtractor
 
+  fex = FrameExtractor(time_interval=50)
+  with FrameProcessor(static_image_mode=False) as fproc:
+    for time_ms, frame in fex.iter_frames(sys.argv[1]):
+      start_time = time.time()
+      try:
+        feats = fproc.get_frame_features(frame)
+        status = "No features" if feats is None else "features %s" %(feats.shape,)
+      except AssertionError as e:
+        status = str(e)
+      print("%8.0f ms : %-22s in %.1f ms" %(time_ms, status, (time.time()-start_time)*1000))
@@ -0,0 +1,72 @@
+import json
+import time
+from collections import Counter
+
+
+class Metrics(object):
+  """
+    Low overhead counters and per-stage timers for the hot path. When disabled every call
+    returns right away, so the instrumentation can stay in place.
+
+    Arguments:
+      enabled : collect the metrics if True
+      file_path : if given, every published snapshot is also appended to this file as a
+                  line of JSON
+  """
+  def __init__(self, enabled=False, file_path=None):
+    self.enabled = enabled
+    self.file_path = file_path
+    self.reset()
+
+  def reset(self):
+    """   clears all the collected metrics   """
+    self.stage_count = Counter()
+    self.stage_total = Counter()
+    self.stage_max = dict()
+    self.counts = Counter()
+    self.errors = Counter()
+    self.gauges = dict()
+    self.started = time.time()
+
+  def add_time(self, stage, secs):
+    """   records one timing(secs) of a stage   """
+    if not self.enabled:
+      return
+    self.stage_count[stage] += 1
+    self.stage_total[stage] += secs
+    if secs >= self.stage_max.get(stage, 0.0):
+      self.stage_max[stage] = secs
+
+  def count(self, name, n=1):
+    """   increments a counter   """
+    if self.enabled:
+      self.counts[name] += n
+
+  def error(self, message):
+    """   counts an error by its message   """
+    if self.enabled:
+      self.errors[message] += 1
+
+  def gauge(self, name, value):
+    """   sets the current value of a gauge, eg. a queue depth   """
+    if self.enabled:
+      self.gauges[name] = value
+
+  def snapshot(self):
+    """   returns the metrics collected so far as a plain dict   """
+    stages = {stage: {'count': self.stage_count[stage],
+                      'mean_ms': self.stage_total[stage]*1000/self.stage_count[stage],
+                      'max_ms': self.stage_max.get(stage, 0.0)*1000}
+              for stage in self.stage_count}
+    frames = self.counts.get('frames', 0)
+    return {'time': time.time(), 'elapsed': time.time()-self.started, 'stages': stages,
+            'counts': dict(self.counts), 'gauges': dict(self.gauges), 'errors': dict(self.errors),
+            'detection_miss_rate': self.counts.get('detection_miss', 0)/frames if frames else 0.0}
+
+  def publish(self):
+    """   returns the snapshot, after appending it to the metrics file if there is one   """
+    snapshot = self.snapshot()
+    if self.file_path is not None:
+      with open(self.file_path, 'a') as f:
+        f.write(json.dumps(snapshot)+'\n')
+    return snapshot
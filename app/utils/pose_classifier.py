@@ -1,30 +1,162 @@
+import os
+import json
 import numpy as np
-from joblib import load
+
+from .distilled import DISTILLED_PATH, DistilledModel
+
+# pose model used when none is given, eg. POSE_MODEL=distilled streamlit run app.py
+POSE_MODEL = os.environ.get('POSE_MODEL', 'cascade')
+MODELS = ['cascade', 'distilled']
+CASCADE_DIR = '../resources/models/cascade'
+# files of the cascade saved by the notebook, used when there is no manifest from train_models.py
+LEGACY_FILES = {'clf_clas': 'xgb_clf.model', 'clf_subclas': 'knn_clf.model',
+                'clas_encoder': 'clas_encoder.model', 'subclas_encoder': 'subclas_encoder.model'}
+
+
+def cascade_files(cascade_dir=CASCADE_DIR):
+  """   returns the paths of the current cascade models, from the manifest written by train_models.py   """
+  manifest_path = os.path.join(cascade_dir, 'manifest.json')
+  if not os.path.exists(manifest_path):
+    return {name: os.path.join(cascade_dir, file) for name, file in LEGACY_FILES.items()}
+  with open(manifest_path) as f:
+    version_dir = os.path.join(cascade_dir, json.load(f)['current'])
+  with open(os.path.join(version_dir, 'manifest.json')) as f:
+    files = json.load(f)['files']
+  return {name: os.path.join(version_dir, file) for name, file in files.items()}
+
 
 class PoseClassifier(object):
   """
     Returns the class(exercise) and sub-class(start/end) from the frame features
 
     Arguments:
-      features : image pixel array
+      model : 'cascade' for the class and sub-class models(see cascade_files), or 'distilled'
+              for the single-stage NumPy model(see utils.distilled). Defaults to POSE_MODEL
   """
-  def __init__(self):
-    # load models
-    self.clf_clas = load('../resources/models/cascade/xgb_clf.model')
-    self.clf_subclas = load('../resources/models/cascade/knn_clf.model')
-    self.clas_encoder = load('../resources/models/cascade/clas_encoder.model')
-    self.subclas_encoder = load('../resources/models/cascade/subclas_encoder.model')
-  
+  def __init__(self, model=None):
+    self.model = POSE_MODEL if model is None else model
+    assert self.model in MODELS, "Unknown pose model %s" %self.model
+    if self.model == 'distilled':
+      # plain arrays, the xgboost and sklearn runtimes are not imported
+      self.distilled = DistilledModel.load(DISTILLED_PATH)
+      self.labels = self.distilled.labels
+      self.n_features = self.distilled.n_features
+      return
+    # load models, joblib brings in xgboost and sklearn as it unpickles them
+    from joblib import load
+    self.model_files = cascade_files()
+    for name, file_path in self.model_files.items():
+      setattr(self, name, load(file_path))
+    self._prepare()
+
+  @classmethod
+  def from_cascade(cls, clf_clas, clf_subclas, clas_encoder, subclas_encoder):
+    """   returns a cascade classifier of already loaded models, eg. the candidates of train_models.py   """
+    pose_clf = cls.__new__(cls)
+    pose_clf.model = 'cascade'
+    pose_clf.model_files = dict()
+    pose_clf.clf_clas, pose_clf.clf_subclas = clf_clas, clf_subclas
+    pose_clf.clas_encoder, pose_clf.subclas_encoder = clas_encoder, subclas_encoder
+    pose_clf._prepare()
+    return pose_clf
+
+  def _prepare(self):
+    # Precomputes everything the per-frame path would otherwise redo on every call
+    # XGBoost class models are called through their booster, others through predict()
+    self.booster = self.clf_clas.get_booster() if hasattr(self.clf_clas, 'get_booster') else None
+    self.clas_ids = np.asarray(self.clf_clas.classes_)
+
+    # reference matrix of a KNN sub-class model, with the norms needed by its distance metric
+    knn = self.clf_subclas
+    self.knn_metric = None
+    if hasattr(knn, '_fit_X'):
+      self.knn_X = np.asarray(knn._fit_X, dtype=np.float64)
+      self.knn_y = np.asarray(knn._y)
+      self.knn_classes = np.asarray(knn.classes_)
+      self.knn_k = knn.n_neighbors
+      self.knn_weights = knn.weights
+      self.knn_metric = knn.effective_metric_
+      if self.knn_metric == 'minkowski' and knn.effective_metric_params_.get('p', knn.p) == 2:
+        self.knn_metric = 'euclidean'
+      if self.knn_metric == 'cosine':
+        self.knn_X = self.knn_X/np.linalg.norm(self.knn_X, axis=1, keepdims=True)
+      self.knn_sq_norms = np.einsum('ij,ij->i', self.knn_X, self.knn_X)
+    # the class id is the last feature of the sub-class model
+    self.n_features = (self.knn_X.shape[1] if self.knn_metric is not None else knn.n_features_in_)-1
+
+    # final labels are the sub-classes, plus 'random-random' when both classifiers disagree.
+    # agree_lut[clas id, sub-class id] gives the final label id
+    self.labels = list(self.subclas_encoder.classes_)
+    if 'random-random' not in self.labels:
+      self.labels.append('random-random')
+    self.random_id = self.labels.index('random-random')
+    clas_names = self.clas_encoder.classes_
+    self.agree_lut = np.full((len(clas_names), len(self.subclas_encoder.classes_)), self.random_id, dtype=np.intp)
+    for clas_id, clas_name in enumerate(clas_names):
+      for subclas_id, subclas_name in enumerate(self.subclas_encoder.classes_):
+        if subclas_name.startswith(clas_name):
+          # if both classifiers agree to a common exercise type then they are probably correct
+          self.agree_lut[clas_id, subclas_id] = subclas_id
+
+  def _predict_clas(self, features_matrix):
+    # returns the class ids from the booster, skipping the sklearn wrapper
+    if self.booster is None:
+      return self.clf_clas.predict(features_matrix)
+    probs = self.booster.inplace_predict(features_matrix)
+    if probs.ndim == 2:
+      pred = probs.argmax(axis=1)
+    elif len(self.clas_ids) > 2:
+      # softmax objective already gives the class index
+      pred = probs.astype(np.intp)
+    else:
+      pred = (probs > 0.5).astype(np.intp)
+    return self.clas_ids[pred]
+
+  def _knn_distances(self, queries):
+    # returns the (N, n_reference) distances of the queries from the reference matrix
+    if self.knn_metric == 'euclidean':
+      sq_dist = (np.einsum('ij,ij->i', queries, queries)[:, None] + self.knn_sq_norms[None, :]
+                  - 2.0*(queries @ self.knn_X.T))
+      return np.sqrt(np.maximum(sq_dist, 0.0))
+    if self.knn_metric == 'cosine':
+      queries = queries/np.linalg.norm(queries, axis=1, keepdims=True)
+      return 1.0 - queries @ self.knn_X.T
+    return None
+
+  def _predict_subclas(self, features_matrix):
+    # returns the sub-class ids from the nearest neighbours of the reference matrix
+    dist = self._knn_distances(features_matrix)
+    if dist is None:
+      # not a KNN, or a metric without a fast path, let sklearn handle it
+      return self.clf_subclas.predict(features_matrix)
+    k = self.knn_k
+    neigh = np.argpartition(dist, k-1, axis=1)[:, :k] if k < dist.shape[1] else np.argsort(dist, axis=1)
+    neigh_dist = np.take_along_axis(dist, neigh, axis=1)
+    if self.knn_weights == 'distance':
+      with np.errstate(divide='ignore'):
+        weights = 1.0/neigh_dist
+      # exact matches take all the weight, same as sklearn
+      inf_mask = np.isinf(weights)
+      inf_rows = inf_mask.any(axis=1)
+      weights[inf_rows] = inf_mask[inf_rows]
+    else:
+      weights = np.ones(neigh.shape, dtype=np.float64)
+    votes = np.zeros((neigh.shape[0], len(self.knn_classes)), dtype=np.float64)
+    np.add.at(votes, (np.arange(neigh.shape[0])[:, None], self.knn_y[neigh]), weights)
+    return self.knn_classes[votes.argmax(axis=1)]
+
+  def classify_batch(self, features_matrix):
+    """
+      returns the pose label ids(index in self.labels) for (N, n_features) frame features
+    """
+    if self.model == 'distilled':
+      return self.distilled.predict(features_matrix)
+    features_matrix = np.asarray(features_matrix, dtype=np.float64).reshape(-1, self.n_features)
+    pred_clas = self._predict_clas(features_matrix)
+    features_matrix = np.hstack((features_matrix, pred_clas[:, None]))
+    pred_subclas = self._predict_subclas(features_matrix)
+    return self.agree_lut[pred_clas, pred_subclas]
+
   def classify(self, features):
     """   returns the identified pose class, for given frame features   """
-    pred_clas = self.clf_clas.predict(features.reshape(1, -1))
-    clas_name = self.clas_encoder.inverse_transform(pred_clas)[0]
-    features = np.hstack((features, pred_clas))
-    pred_subclas = self.clf_subclas.predict(features.reshape(1, -1))
-    subclas_name = self.subclas_encoder.inverse_transform(pred_subclas)[0]
-
-    final_pred = 'random-random'
-    if subclas_name.startswith(clas_name):
-      # if both classifiers agree to a common exercise type then they are probably correct
-      final_pred = subclas_name
-    return final_pred
+    return self.labels[self.classify_batch(features)[0]]
@@ -0,0 +1,263 @@
+"""
+  Declarative pose correction rules, evaluated as array operations over one skeleton or a
+  batch of skeletons. Each rule measures a metric over some joints of the extended skeleton
+  and triggers its message when the metric crosses the threshold. The result for a frame
+  is a bitmask over MESSAGES, which is converted to text only when needed. The rules give
+  the same feedback as the original if/elif chain of FrameProcessor.pose_corrector, except
+  for the arms straight and planks checks : the chain tested those as 'x < low and x > high',
+  which never holds, the rules check that the angle is outside the range.
+"""
+import math
+import operator
+import numpy as np
+from collections import namedtuple
+
+from .skeleton import JOINT, POINT_NAMES, extend_skeleton
+
+
+# pose : sub-class(eg. 'lunges-end') or exercise(eg. 'lunges') the rule applies to
+# metric : 'angle' - angle(0-180 degrees) made by the middle of 3 joints
+#          'width_ratio' - distance between first pair of joints relative to the second pair
+#          'height_diff' - y co-ordinate of first joint minus that of the second joint
+#          'toe_clearance' - horizontal gap between toes and knee of the leg facing forward,
+#                            given the joints (hip, knee, toe) of right and then left leg
+# op, threshold : the rule triggers when 'metric op threshold' holds, 'outside' takes
+#                 a (low, high) range. op None keeps the message bit of a disabled check
+Rule = namedtuple('Rule', ['pose', 'metric', 'joints', 'op', 'threshold', 'message'])
+
+RULES = [
+  # feet should be around (2*shoulder width) apart, hands stretched straight
+  Rule('jumping_jacks-start', 'width_ratio', (('LEFT_ANKLE','RIGHT_ANKLE'), ('LEFT_SHOULDER','RIGHT_SHOULDER')),
+        '<=', 0.85, "Your feet are too close when starting Jumping Jacks."),
+  Rule('jumping_jacks-start', 'width_ratio', (('LEFT_ANKLE','RIGHT_ANKLE'), ('LEFT_SHOULDER','RIGHT_SHOULDER')),
+        '>', 2.0, "Your feet are too wide when starting Jumping Jacks."),
+  Rule('jumping_jacks-start', 'angle', ('LEFT_SHOULDER','LEFT_ELBOW','LEFT_WRIST'),
+        'outside', (120, 180), "Keep your arms straight while doing Jumping Jacks."),
+  Rule('jumping_jacks-start', 'angle', ('RIGHT_SHOULDER','RIGHT_ELBOW','RIGHT_WRIST'),
+        'outside', (120, 180), "Keep your arms straight while doing Jumping Jacks."),
+  # Keep hands above head and legs (2-3 shoulder length) wide apart
+  Rule('jumping_jacks-end', 'height_diff', ('NOSE','LEFT_WRIST'),
+        '<=', 0.0, "Keep your arms above your head when ending Jumping Jacks."),
+  Rule('jumping_jacks-end', 'height_diff', ('NOSE','RIGHT_WRIST'),
+        '<=', 0.0, "Keep your arms above your head when ending Jumping Jacks."),
+  Rule('jumping_jacks-end', 'width_ratio', (('LEFT_ANKLE','RIGHT_ANKLE'), ('LEFT_SHOULDER','RIGHT_SHOULDER')),
+        '<=', 1.5, "Your feet are too close when ending Jumping Jacks."),
+  Rule('jumping_jacks-end', 'width_ratio', (('LEFT_ANKLE','RIGHT_ANKLE'), ('LEFT_SHOULDER','RIGHT_SHOULDER')),
+        '>', 2.75, "Your feet are too wide when ending Jumping Jacks."),
+  # Keep your body relaxed on ground, then head slightly raised from ground
+  Rule('crunches-start', 'angle', ('NECK','CORE','MID_HIPS'),
+        'outside', (170, 190), "Lie down in a relaxed way while starting crunches."),
+  Rule('crunches-end', 'angle', ('NOSE','CORE','MID_HIPS'),
+        'outside', (120, 160), "Raise your head slightly from neck while ending crunches."),
+  # core straight, and knees at right angles
+  Rule('lunges', 'angle', ('NECK','CORE','MID_HIPS'),
+        'outside', (170, 190), "Keep your core straight while doing lunges."),
+  Rule('lunges-end', 'angle', ('LEFT_ANKLE','LEFT_KNEE','LEFT_HIP'),
+        'outside', (80, 100), "While doing lunges your knees should be at right angles."),
+  Rule('lunges-end', 'angle', ('RIGHT_ANKLE','RIGHT_KNEE','RIGHT_HIP'),
+        'outside', (80, 100), "While doing lunges your knees should be at right angles."),
+  # whole body in straight line - neck, core, mid-hips :: mid-hips, mid-knees, mid-ankle
+  Rule('planks', 'angle', ('NECK','CORE','MID_HIPS'),
+        'outside', (165, 190), "Straighten your upper body while doing planks."),
+  Rule('planks', 'angle', ('MID_HIPS','MID_KNEES','MID_ANKLES'),
+        'outside', (165, 190), "Straighten your lower body while doing planks."),
+  # knees should not cross toes
+  Rule('squats-end', 'toe_clearance', ('RIGHT_HIP','RIGHT_KNEE','RIGHT_FOOT_INDEX','LEFT_HIP','LEFT_KNEE',
+        'LEFT_FOOT_INDEX'), '<=', 0.0, "While doing squats your knees should not cross your toes."),
+]
+
+# messages in the order they are reported, bit i of a correction mask is MESSAGES[i]
+MESSAGES = list(dict.fromkeys(rule.message for rule in RULES))
+
+_OPS = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal}
+_SCALAR_OPS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+def _joint_ids(joints):
+  # converts (possibly nested) tuples of joint names to joint indices
+  return [_joint_ids(j) for j in joints] if isinstance(joints, tuple) else JOINT[joints]
+
+# the metrics below follow the arithmetic of the original checks step by step, so that the
+# rules trigger on exactly the same frames. Unlike skeleton.joint_angles(), an angle is nan
+# where arccos is undefined, and then never triggers
+
+def _distances(ext, pairs):
+  # (N, len(pairs)) euclidean distances between the joint pairs
+  dx = ext[:, pairs[:, 0], 0] - ext[:, pairs[:, 1], 0]
+  dy = ext[:, pairs[:, 0], 1] - ext[:, pairs[:, 1], 1]
+  return np.sqrt(dx*dx + dy*dy)
+
+def _angles(ext, triples):
+  # (N, len(triples)) angles(0-180 degrees) made by the middle joints
+  abx = ext[:, triples[:, 0], 0] - ext[:, triples[:, 1], 0]
+  aby = ext[:, triples[:, 0], 1] - ext[:, triples[:, 1], 1]
+  bcx = ext[:, triples[:, 2], 0] - ext[:, triples[:, 1], 0]
+  bcy = ext[:, triples[:, 2], 1] - ext[:, triples[:, 1], 1]
+  dot_prod = abx*bcx + aby*bcy
+  mod_prod = np.sqrt((abx*abx + aby*aby)*(bcx*bcx + bcy*bcy))
+  with np.errstate(invalid='ignore', divide='ignore'):
+    angle = np.rad2deg(np.arccos(dot_prod/mod_prod))
+  det = abx*bcy - aby*bcx   # determinant for correct quadrant
+  angle = np.where(det < 0, 360.0-angle, angle)
+  return np.minimum(angle, 360.0-angle)
+
+def _points(skeleton):
+  # (x, y) floats of every joint in JOINT_NAMES, for a single (15, 3) skeleton
+  points = np.asarray(skeleton, dtype=np.float64).reshape(len(POINT_NAMES), 3)[:, :2].tolist()
+  def mid(p1, p2):
+    return ((p1[0]+p2[0])*0.5, (p1[1]+p2[1])*0.5)
+  neck = mid(points[JOINT['LEFT_SHOULDER']], points[JOINT['RIGHT_SHOULDER']])
+  mid_hips = mid(points[JOINT['LEFT_HIP']], points[JOINT['RIGHT_HIP']])
+  core = mid(neck, mid_hips)
+  points += [neck, mid_hips, core, mid(points[JOINT['LEFT_KNEE']], points[JOINT['RIGHT_KNEE']]),
+             mid(points[JOINT['LEFT_ANKLE']], points[JOINT['RIGHT_ANKLE']]), (core[0], math.nan)]
+  return points
+
+def _distance(p1, p2):
+  # euclidean distance between two points
+  dx, dy = p1[0]-p2[0], p1[1]-p2[1]
+  return math.sqrt(dx*dx + dy*dy)
+
+def _angle(p1, p2, p3):
+  # angle(0-180 degrees) made by point 2 with point 1 and 3
+  abx, aby = p1[0]-p2[0], p1[1]-p2[1]
+  bcx, bcy = p3[0]-p2[0], p3[1]-p2[1]
+  mod_prod = math.sqrt((abx*abx + aby*aby)*(bcx*bcx + bcy*bcy))
+  cos = (abx*bcx + aby*bcy)/mod_prod if mod_prod > 0 else math.nan
+  if not -1.0 <= cos <= 1.0:
+    return math.nan
+  angle = math.degrees(math.acos(cos))
+  if abx*bcy - aby*bcx < 0:
+    angle = 360.0-angle
+  return min(angle, 360.0-angle)
+
+
+class PoseCorrector(object):
+  """
+    Compiles the rule table into index tables, and evaluates it over skeletons
+
+    Arguments:
+      rules : list of Rule, defaults to RULES
+  """
+  def __init__(self, rules=None):
+    rules = RULES if rules is None else rules
+    self.messages = list(dict.fromkeys(rule.message for rule in rules))
+    # 'outside' rules are split into a lower and an upper check sharing the message bit,
+    # rules without an op keep their message bit but are not checked
+    checks = list()
+    for rule in rules:
+      if rule.op is None:
+        continue
+      if rule.op == 'outside':
+        low, high = rule.threshold
+        checks.append(rule._replace(op='<', threshold=low))
+        checks.append(rule._replace(op='>', threshold=high))
+      else:
+        assert rule.op in _OPS, "Unknown op %s" %rule.op
+        checks.append(rule)
+    self.checks = checks
+    self.bits = np.array([1 << self.messages.index(rule.message) for rule in checks], dtype=np.uint32)
+    self.thresholds = np.array([rule.threshold for rule in checks], dtype=np.float64)
+    self.op_columns = {op: np.array([i for i, rule in enumerate(checks) if rule.op == op], dtype=np.intp)
+                        for op in _OPS}
+    self.metric_columns = dict()
+    for metric in ('angle', 'width_ratio', 'height_diff', 'toe_clearance'):
+      columns = [i for i, rule in enumerate(checks) if rule.metric == metric]
+      joints = np.array([_joint_ids(rule.joints) for rule in checks if rule.metric == metric],
+                        dtype=np.intp)
+      self.metric_columns[metric] = (np.array(columns, dtype=np.intp), joints)
+    self.pose_checks = dict()
+    self.pose_scalar_checks = dict()
+
+  def _applicable(self, pose_clas):
+    # returns the boolean vector of checks applicable to the given pose class
+    applicable = self.pose_checks.get(pose_clas)
+    if applicable is None:
+      exc_clas = pose_clas.split('-')[0]
+      applicable = np.array([rule.pose in (pose_clas, exc_clas) for rule in self.checks], dtype=bool)
+      self.pose_checks[pose_clas] = applicable
+    return applicable
+
+  def _scalar_checks(self, pose_clas):
+    # returns the (metric, joint ids, op, threshold, bit) of the checks applicable to the pose class
+    checks = self.pose_scalar_checks.get(pose_clas)
+    if checks is None:
+      checks = [(rule.metric, _joint_ids(rule.joints), _SCALAR_OPS[rule.op], float(rule.threshold), int(bit))
+                for rule, bit, applies in zip(self.checks, self.bits, self._applicable(pose_clas)) if applies]
+      self.pose_scalar_checks[pose_clas] = checks
+    return checks
+
+  def _metrics(self, ext):
+    # returns the (N, n_checks) matrices of the metric values of every check, and the
+    # values they are compared with
+    values = np.zeros((ext.shape[0], len(self.checks)), dtype=np.float64)
+    limits = np.repeat(self.thresholds[None, :], ext.shape[0], axis=0)
+    columns, joints = self.metric_columns['angle']
+    if len(columns):
+      values[:, columns] = _angles(ext, joints)
+    columns, joints = self.metric_columns['width_ratio']
+    if len(columns):
+      # compared as 'width op threshold*reference width', as in the original checks
+      values[:, columns] = _distances(ext, joints[:, 0])
+      limits[:, columns] = self.thresholds[columns]*_distances(ext, joints[:, 1])
+    columns, joints = self.metric_columns['height_diff']
+    if len(columns):
+      values[:, columns] = ext[:, joints[:, 0], 1] - ext[:, joints[:, 1], 1]
+    columns, joints = self.metric_columns['toe_clearance']
+    if len(columns):
+      x = ext[:, joints, 0]   # (N, n_columns, 6)
+      facing_right = (x[..., 1]-x[..., 0]) >= 0
+      values[:, columns] = np.where(facing_right, x[..., 2]-x[..., 1], x[..., 4]-x[..., 5])
+    return values, limits
+
+  def masks(self, skeletons, pose_classes):
+    """
+      Returns the uint32 correction bitmask for each of the (N, 15, 3) skeletons, checked
+      against the rules of its pose class
+    """
+    ext = extend_skeleton(skeletons)
+    pose_classes = np.asarray(pose_classes).reshape(-1)
+    assert len(pose_classes) == ext.shape[0], "One pose class is needed per skeleton"
+    unique_classes, inverse = np.unique(pose_classes, return_inverse=True)
+    applicable = np.stack([self._applicable(str(clas)) for clas in unique_classes])[inverse]
+
+    values, limits = self._metrics(ext)
+    triggered = np.zeros(values.shape, dtype=bool)
+    for op, columns in self.op_columns.items():
+      if len(columns):
+        triggered[:, columns] = _OPS[op](values[:, columns], limits[:, columns])
+    triggered &= applicable
+    return np.bitwise_or.reduce(np.where(triggered, self.bits, 0).astype(np.uint32), axis=1)
+
+  def mask(self, skeleton, pose_clas):
+    """
+      Returns the correction bitmask of a single (15, 3) skeleton, same as masks() but with
+      plain float arithmetic over only the checks of its pose class, for the online path
+    """
+    checks = self._scalar_checks(pose_clas)
+    if not checks:
+      return 0
+    points = _points(skeleton)
+    mask = 0
+    for metric, joints, op, threshold, bit in checks:
+      if mask & bit:
+        continue
+      if metric == 'angle':
+        value = _angle(points[joints[0]], points[joints[1]], points[joints[2]])
+      elif metric == 'width_ratio':
+        value = _distance(points[joints[0][0]], points[joints[0][1]])
+        threshold = threshold*_distance(points[joints[1][0]], points[joints[1][1]])
+      elif metric == 'height_diff':
+        value = points[joints[0]][1] - points[joints[1]][1]
+      else:
+        x = [points[j][0] for j in joints]
+        value = x[2]-x[1] if x[1]-x[0] >= 0 else x[4]-x[5]
+      if op(value, threshold):
+        mask |= bit
+    return mask
+
+  def feedback(self, mask):
+    """   returns the feedback text for a correction bitmask, else None   """
+    mask = int(mask)
+    if mask == 0:
+      return None
+    return " ".join(message for i, message in enumerate(self.messages) if mask & (1 << i))
@@ -0,0 +1,136 @@
+"""
+  Compact session recordings. Every processed frame is appended as a fixed size binary record
+  of its time stamp, frame size, raw landmarks with their visibilities and the classifier
+  output, 345 bytes a frame. A header holds the labels the pose ids refer to, and the records
+  after it are memory-mapped as a NumPy structured array when the recording is loaded.
+"""
+import os
+import json
+import struct
+import numpy as np
+
+from .skeleton import N_LANDMARKS
+
+
+MAGIC = b'VFITREC1'
+HEADER_ALIGN = 64
+
+RECORD_DTYPE = np.dtype([
+  ('time', '<f8'),                        # time stamp of the frame(secs)
+  ('shape', '<u2', (2,)),                 # frame height and width
+  ('landmarks', '<f4', (N_LANDMARKS, 2)), # normalised x, y, NaN if no pose was detected
+  ('visibility', '<f2', (N_LANDMARKS,)),
+  ('pose', '<i2'),                        # classified pose id in the labels, -1 if none
+  ('flags', 'u1')])
+
+# flags of a record
+DETECTED = 1
+ERROR = 2
+REUSED = 4
+
+
+def _read_header(f):
+  # returns the header dict and the offset of the first record
+  magic = f.read(len(MAGIC))
+  assert magic == MAGIC, "Not a session recording"
+  length, = struct.unpack('<I', f.read(4))
+  header = json.loads(f.read(length).decode())
+  assert header['dtype'] == str(RECORD_DTYPE.descr), "Unsupported record format"
+  return header, header['offset']
+
+
+class SessionRecorder(object):
+  """
+    Appends the processed frames of a session to a recording file. An existing recording is
+    appended to, after dropping a partial record left by an interrupted writer.
+
+    Arguments:
+      file_path : path of the recording
+      labels : pose labels, the pose ids of the records index them
+      flush_every : number of records buffered before they are written
+  """
+  def __init__(self, file_path, labels, flush_every=64):
+    self.file_path = file_path
+    self.labels = list(labels)
+    self.label_ids = {label: i for i, label in enumerate(self.labels)}
+    self.flush_every = flush_every
+    self.buffer = np.zeros(flush_every, dtype=RECORD_DTYPE)
+    self.n_buffered = 0
+    self.n_records = 0
+    if os.path.isfile(file_path) and os.path.getsize(file_path) > 0:
+      with open(file_path, 'rb') as f:
+        header, offset = _read_header(f)
+      assert header['labels'] == self.labels, "Recording has different labels"
+      self.n_records = (os.path.getsize(file_path)-offset)//RECORD_DTYPE.itemsize
+      os.truncate(file_path, offset+self.n_records*RECORD_DTYPE.itemsize)
+      self.file = open(file_path, 'ab')
+    else:
+      self.file = open(file_path, 'wb')
+      self._write_header()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def _write_header(self):
+    header = {'labels': self.labels, 'dtype': str(RECORD_DTYPE.descr)}
+    # the records start at an aligned offset, which is known before the header is written
+    length = len(json.dumps(dict(header, offset=0)).encode())+16
+    header['offset'] = -(-(len(MAGIC)+4+length)//HEADER_ALIGN)*HEADER_ALIGN
+    data = json.dumps(header).encode()
+    data += b' '*(header['offset']-len(MAGIC)-4-len(data))
+    self.file.write(MAGIC+struct.pack('<I', len(data))+data)
+
+  def append(self, time_stamp, frame_shape, landmarks=None, pose_clas=None, flags=0):
+    """
+      Records a frame at time_stamp(secs) of the given shape, with its (33, 3) normalised
+      landmarks(None if no pose was detected), the classified pose and the record flags
+    """
+    record = self.buffer[self.n_buffered]
+    record['time'] = time_stamp
+    record['shape'] = frame_shape[:2]
+    if landmarks is None:
+      record['landmarks'] = np.nan
+      record['visibility'] = 0.0
+    else:
+      record['landmarks'] = landmarks[:, :2]
+      record['visibility'] = landmarks[:, 2]
+      flags |= DETECTED
+    record['pose'] = -1 if pose_clas is None else self.label_ids[pose_clas]
+    record['flags'] = flags
+    self.n_buffered += 1
+    self.n_records += 1
+    if self.n_buffered == self.flush_every:
+      self.flush()
+
+  def flush(self):
+    """   writes the buffered records   """
+    self.file.write(self.buffer[:self.n_buffered].tobytes())
+    self.file.flush()
+    self.n_buffered = 0
+
+  def close(self):
+    self.flush()
+    self.file.close()
+
+
+def load_recording(file_path):
+  """
+    Returns the header and the records of a recording, memory-mapped read only. A partial
+    record at the end, from a writer still appending, is left out
+  """
+  with open(file_path, 'rb') as f:
+    header, offset = _read_header(f)
+  n_records = (os.path.getsize(file_path)-offset)//RECORD_DTYPE.itemsize
+  if n_records == 0:
+    return header, np.zeros(0, dtype=RECORD_DTYPE)
+  return header, np.memmap(file_path, dtype=RECORD_DTYPE, mode='r', offset=offset, shape=(n_records,))
+
+def record_landmarks(records):
+  """   returns the (N, 33, 3) landmarks of the records as x, y, visibility   """
+  landmarks = np.empty((len(records), N_LANDMARKS, 3), dtype=np.float32)
+  landmarks[..., :2] = records['landmarks']
+  landmarks[..., 2] = records['visibility']
+  return landmarks
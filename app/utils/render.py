@@ -0,0 +1,119 @@
+"""
+  Rendering helpers for the UI. The camera preview is downscaled and encoded on a
+  background thread at a limited frame rate, widgets are re-rendered only when their
+  content changes and the reference media is read from disk once.
+"""
+import time
+import threading
+from functools import lru_cache
+
+import cv2
+
+
+@lru_cache(maxsize=None)
+def reference_gif(exercise, videos_dir='../resources/videos'):
+  """   returns the bytes of the reference GIF of an exercise, read once   """
+  with open('%s/%s.gif' %(videos_dir, exercise), 'rb') as f:
+    return f.read()
+
+
+class WidgetSlot(object):
+  """
+    Wraps a UI placeholder(eg. st.empty()) and re-renders it only when its content changes
+
+    Arguments:
+      placeholder : the placeholder the content is rendered to
+  """
+  def __init__(self, placeholder):
+    self.placeholder = placeholder
+    self.content = None
+
+  def update(self, method, *args, **kwargs):
+    """   calls method of the placeholder, unless it was last called with the same arguments   """
+    content = (method, args, sorted(kwargs.items()))
+    if content == self.content:
+      return False
+    self.content = content
+    getattr(self.placeholder, method)(*args, **kwargs)
+    return True
+
+
+class PreviewRenderer(object):
+  """
+    Encodes camera frames for the preview off the capture path. Frames are submitted at
+    most fps times a second, the latest one is downscaled and JPEG encoded on a background
+    thread, and the encoded preview is picked up by the UI loop.
+
+    Arguments:
+      fps : preview frame rate
+      width : preview width in pixels, the height keeps the aspect ratio
+      quality : JPEG quality of the preview
+  """
+  def __init__(self, fps=15, width=480, quality=80):
+    self.fps = fps
+    self.width = width
+    self.quality = quality
+    self.frame = None
+    self.preview = None
+    self.last_submit = 0.0
+    self.encoded = 0
+    self.running = False
+    self.cond = threading.Condition()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.stop()
+
+  def start(self):
+    """   starts the encoding thread   """
+    self.running = True
+    self.thread = threading.Thread(target=self._encode_loop, daemon=True)
+    self.thread.start()
+    return self
+
+  def stop(self):
+    """   stops the encoding thread   """
+    with self.cond:
+      self.running = False
+      self.cond.notify()
+    self.thread.join()
+
+  def submit(self, frame):
+    """   hands a camera frame to the encoder if a preview is due, returns True if it was taken   """
+    now = time.time()
+    if now-self.last_submit < 1.0/self.fps:
+      return False
+    self.last_submit = now
+    with self.cond:
+      # a frame still waiting to be encoded is replaced by the newer one
+      self.frame = frame
+      self.cond.notify()
+    return True
+
+  def latest(self):
+    """   returns the encoded preview if there is a new one since the last call, else None   """
+    with self.cond:
+      preview, self.preview = self.preview, None
+    return preview
+
+  def encode(self, frame):
+    """   returns the downscaled JPEG bytes of a frame   """
+    h, w = frame.shape[:2]
+    if w > self.width:
+      frame = cv2.resize(frame, (self.width, int(h*self.width/w)), interpolation=cv2.INTER_AREA)
+    return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])[1].tobytes()
+
+  def _encode_loop(self):
+    while True:
+      with self.cond:
+        while self.running and (self.frame is None):
+          self.cond.wait()
+        if not self.running:
+          break
+        frame, self.frame = self.frame, None
+      preview = self.encode(frame)
+      with self.cond:
+        self.preview = preview
+        self.encoded += 1
@@ -0,0 +1,121 @@
+from collections import deque
+
+
+# max_gap of the app's counters. Their frames are sampled at an interval which adapts to the
+# processing time, so gaps longer than the default are still credited
+SESSION_MAX_GAP = 2.0
+
+class RepCounter(object):
+  """
+    Streaming state machine counting the exercise sets(reps) and plank time from a sequence
+    of classified poses and their time stamps. Poses are smoothed by a majority vote over a
+    ring buffer of the recent ones, no older than vote_secs so that the smoothing does not
+    swallow whole poses at low frame rates. A rep is counted when the end pose of an exercise is
+    reached after its start pose, and a plank is credited with the real time between its
+    frames, so that the counts do not depend on the frame rate or on dropped frames.
+
+    Arguments:
+      window : maximum number of recent poses in the majority vote
+      vote_secs : maximum age(secs) of a pose in the majority vote
+      hysteresis : votes by which a pose has to lead the current one to replace it
+      min_dwell : time(secs) a pose has to be held to be reached, eg. the start of a rep
+      max_gap : longest time(secs) between two frames credited to a plank, or a random pose
+                can last without breaking a rep. Longer gaps also start the vote afresh
+  """
+  def __init__(self, window=3, vote_secs=0.6, hysteresis=1, min_dwell=0.0, max_gap=1.0):
+    self.window = window
+    self.vote_secs = vote_secs
+    self.hysteresis = hysteresis
+    self.min_dwell = min_dwell
+    self.max_gap = max_gap
+    self.reset()
+
+  def reset(self):
+    """   clears the counts and the state   """
+    self._clear_votes()
+    self.current = None
+    self.phase_start = None
+    self.reached = False
+    # exercise whose start pose was reached, a rep is counted when its end pose follows
+    self.armed = None
+    self.last_time_stamp = None
+    self.last_plank_time = None
+    # sets_counts keeps a count of all the completed exercise, whereas pose_counts keeps
+    # count of all types of classified pose. These is later used for analysis between exercise
+    # and non-exercise(random) poses
+    self.sets_counts, self.pose_counts = {}, {}
+
+  def _clear_votes(self):
+    self.ring = deque()
+    self.votes = dict()
+
+  def _vote(self, time_stamp, pose_clas):
+    # pushes the pose to the ring buffer and returns the smoothed pose. Only the pushed pose
+    # gains a vote, so only it can take the lead, unless the current pose lost evicted votes
+    current_lost = False
+    while self.ring and ((len(self.ring) >= self.window) or (self.ring[0][0] < time_stamp-self.vote_secs)):
+      evicted = self.ring.popleft()[1]
+      self.votes[evicted] -= 1
+      current_lost = current_lost or (evicted == self.current)
+    self.ring.append((time_stamp, pose_clas))
+    self.votes[pose_clas] = self.votes.get(pose_clas, 0)+1
+    if self.current is None:
+      return pose_clas
+    candidates = self.votes if current_lost else (pose_clas,)
+    leader = max(candidates, key=self.votes.get)
+    if self.votes[leader] >= self.votes.get(self.current, 0)+self.hysteresis:
+      return leader
+    return self.current
+
+  def _reach(self, pose_clas):
+    # advances the rep state when a pose is reached, returns the exercise counted if any
+    exc_clas, phase = pose_clas.split('-')[0], pose_clas.split('-')[-1]
+    if phase == 'start':
+      self.armed = exc_clas
+    elif (phase == 'end') and (self.armed == exc_clas):
+      # Handles Jumping Jacks, Squats, Crunches, Lunges
+      self.sets_counts[exc_clas] = self.sets_counts.get(exc_clas, 0)+1
+      self.armed = None
+      return exc_clas
+    elif exc_clas != 'random':
+      # another exercise breaks the rep
+      self.armed = None
+    return None
+
+  def update(self, time_stamp, pose_clas=None):
+    """
+      Updates the counts with the pose class of the frame at time_stamp(secs), None if no
+      pose was classified in it. Returns the smoothed pose class and the exercise whose
+      count changed, if any
+    """
+    if pose_clas is None:
+      return None, None
+    gap = None if self.last_time_stamp is None else time_stamp-self.last_time_stamp
+    if (gap is not None) and (gap > self.max_gap):
+      self._clear_votes()
+    self.last_time_stamp = time_stamp
+
+    previous = self.current
+    self.current = self._vote(time_stamp, pose_clas)
+    if self.current != previous:
+      self.phase_start, self.reached = time_stamp, False
+    pose_clas = self.current
+    exc_clas = pose_clas.split('-')[0]
+    self.pose_counts[exc_clas] = self.pose_counts.get(exc_clas, 0)+1
+
+    added = None
+    if pose_clas.endswith('planks'):
+      # Handles planks. Planks are measured in seconds held since the last plank frame, so
+      # that a short misclassification does not lose the hold time
+      self.armed = None
+      if (self.last_plank_time is not None) and (time_stamp-self.last_plank_time <= self.max_gap):
+        self.sets_counts[exc_clas] = self.sets_counts.get(exc_clas, 0)+time_stamp-self.last_plank_time
+        added = exc_clas
+      self.last_plank_time = time_stamp
+    elif (exc_clas == 'random') and (time_stamp-self.phase_start > self.max_gap):
+      # a random pose held too long breaks the rep
+      self.armed = None
+    elif (not self.reached) and (time_stamp-self.phase_start >= self.min_dwell):
+      self.reached = True
+      added = self._reach(pose_clas)
+    return pose_clas, added
@@ -0,0 +1,183 @@
+"""
+  Array based skeleton and the vectorized geometry used for featurizing poses.
+
+  A skeleton is a float32 array of shape (15, 3), or (N, 15, 3) for a batch, holding the
+  x, y pixel co-ordinates (translated so that mid-hips is the origin) and visibility of
+  the body joints in POINT_NAMES. The extended skeleton further appends the derived
+  joints (neck, mid-hips, core etc.) used by the features and the pose checks.
+"""
+import math
+import numpy as np
+
+
+POINT_NAMES = ['NOSE','LEFT_SHOULDER','RIGHT_SHOULDER','LEFT_HIP','RIGHT_HIP',
+  'LEFT_ELBOW','RIGHT_ELBOW' ,'LEFT_WRIST','RIGHT_WRIST','LEFT_KNEE','RIGHT_KNEE',
+  'LEFT_ANKLE','RIGHT_ANKLE','LEFT_FOOT_INDEX','RIGHT_FOOT_INDEX']
+
+# index of the above points in the 33 landmarks returned by MediaPipe pose
+LANDMARK_IDS = np.array([0, 11, 12, 23, 24, 13, 14, 15, 16, 25, 26, 27, 28, 31, 32], dtype=np.intp)
+N_LANDMARKS = 33
+
+JOINT_NAMES = POINT_NAMES + ['NECK','MID_HIPS','CORE','MID_KNEES','MID_ANKLES','GROUND']
+JOINT = {name: idx for idx, name in enumerate(JOINT_NAMES)}
+
+def _joint_table(rows):
+  # converts rows of joint names to an index table
+  return np.array([[JOINT[name] for name in row] for row in rows], dtype=np.intp)
+
+# distance features - limbs from body core, 2-joints and cross joint distances
+DIST_PAIRS = _joint_table([
+  ('CORE','NOSE'), ('CORE','LEFT_ELBOW'), ('CORE','RIGHT_ELBOW'), ('CORE','LEFT_WRIST'),
+  ('CORE','RIGHT_WRIST'), ('CORE','LEFT_KNEE'), ('CORE','RIGHT_KNEE'), ('CORE','LEFT_ANKLE'),
+  ('CORE','RIGHT_ANKLE'),
+  ('LEFT_SHOULDER','LEFT_WRIST'), ('RIGHT_SHOULDER','RIGHT_WRIST'), ('LEFT_HIP','LEFT_ELBOW'),
+  ('RIGHT_HIP','RIGHT_ELBOW'), ('LEFT_SHOULDER','LEFT_KNEE'), ('RIGHT_SHOULDER','RIGHT_KNEE'),
+  ('LEFT_HIP','LEFT_ANKLE'), ('RIGHT_HIP','RIGHT_ANKLE'), ('LEFT_KNEE','LEFT_FOOT_INDEX'),
+  ('RIGHT_KNEE','RIGHT_FOOT_INDEX'),
+  ('LEFT_WRIST','RIGHT_WRIST'), ('LEFT_ELBOW','RIGHT_ELBOW'), ('LEFT_SHOULDER','RIGHT_SHOULDER'),
+  ('LEFT_HIP','RIGHT_HIP'), ('LEFT_KNEE','RIGHT_KNEE')])
+
+# torso length is the mean of these distances and normalises the distance features
+TORSO_PAIRS = _joint_table([('NECK','LEFT_HIP'), ('NECK','RIGHT_HIP')])
+
+# angles made by neck with both elbows, angles made by hips with both knees,
+# spine angle, and body with respect to ground
+ANGLE_TRIPLES = _joint_table([
+  ('LEFT_ELBOW','NECK','RIGHT_ELBOW'), ('LEFT_KNEE','MID_HIPS','RIGHT_KNEE'),
+  ('NOSE','NECK','MID_HIPS'), ('NOSE','CORE','GROUND')])
+
+# visibility features of left and right profiles(upper and lower body)
+VISIBILITY_PAIRS = _joint_table([
+  ('LEFT_SHOULDER','LEFT_HIP'), ('LEFT_HIP','LEFT_KNEE'),
+  ('RIGHT_SHOULDER','RIGHT_HIP'), ('RIGHT_HIP','RIGHT_KNEE')])
+
+N_FEATURES = len(DIST_PAIRS) + len(ANGLE_TRIPLES) + len(VISIBILITY_PAIRS)
+
+# the same tables as lists, for the single skeleton path
+_DIST_PAIRS, _TORSO_PAIRS = DIST_PAIRS.tolist(), TORSO_PAIRS.tolist()
+_ANGLE_TRIPLES, _VISIBILITY_PAIRS = ANGLE_TRIPLES.tolist(), VISIBILITY_PAIRS.tolist()
+
+# joints which must be visible for a frame to be featurized, with the message otherwise
+VISIBILITY_THRESHOLD = 0.4
+VISIBILITY_CHECKS = [
+  (('NOSE',), "Face not in frame"),
+  (('LEFT_SHOULDER','RIGHT_SHOULDER'), "Shoulders not in frame"),
+  (('LEFT_HIP','RIGHT_HIP'), "Body not in frame"),
+  (('LEFT_FOOT_INDEX','RIGHT_FOOT_INDEX'), "Feet not in frame")]
+
+
+def landmarks_array(pose_landmarks):
+  """   returns the (33, 3) float32 array of x, y, visibility of MediaPipe pose landmarks   """
+  return np.array([(lm.x, lm.y, lm.visibility) for lm in pose_landmarks.landmark], dtype=np.float32)
+
+def to_skeleton(landmarks, frame_shape):
+  """
+    Returns the skeleton(s) for normalised MediaPipe landmarks of shape (33, 3) or
+    (N, 33, 3), after translating to mid-hips and scaling to the frame size
+  """
+  h, w = frame_shape[:2]
+  points = np.asarray(landmarks, dtype=np.float64)[..., LANDMARK_IDS, :]
+  mid_hips = (points[..., JOINT['LEFT_HIP'], :2] + points[..., JOINT['RIGHT_HIP'], :2])*0.5
+  skeleton = np.empty(points.shape, dtype=np.float32)
+  skeleton[..., :2] = (points[..., :2] - mid_hips[..., None, :])*(w, h)
+  skeleton[..., 2] = points[..., 2]
+  return skeleton
+
+def extend_skeleton(skeletons, frame_height=np.nan):
+  """
+    Returns the (N, len(JOINT_NAMES), 3) float64 skeletons including the derived joints.
+    The ground point lies below the core at the bottom row of the frame.
+  """
+  skeletons = np.asarray(skeletons, dtype=np.float64).reshape(-1, len(POINT_NAMES), 3)
+  ext = np.empty((skeletons.shape[0], len(JOINT_NAMES), 3), dtype=np.float64)
+  ext[:, :len(POINT_NAMES)] = skeletons
+  # mid-points, with visibility as the mean of both the joints
+  ext[:, JOINT['NECK']] = (ext[:, JOINT['LEFT_SHOULDER']] + ext[:, JOINT['RIGHT_SHOULDER']])*0.5
+  ext[:, JOINT['MID_HIPS']] = (ext[:, JOINT['LEFT_HIP']] + ext[:, JOINT['RIGHT_HIP']])*0.5
+  ext[:, JOINT['CORE']] = (ext[:, JOINT['NECK']] + ext[:, JOINT['MID_HIPS']])*0.5
+  ext[:, JOINT['MID_KNEES']] = (ext[:, JOINT['LEFT_KNEE']] + ext[:, JOINT['RIGHT_KNEE']])*0.5
+  ext[:, JOINT['MID_ANKLES']] = (ext[:, JOINT['LEFT_ANKLE']] + ext[:, JOINT['RIGHT_ANKLE']])*0.5
+  ext[:, JOINT['GROUND'], 0] = ext[:, JOINT['CORE'], 0]
+  ext[:, JOINT['GROUND'], 1] = frame_height-1
+  ext[:, JOINT['GROUND'], 2] = 0.9
+  return ext
+
+def joint_distances(ext, pairs):
+  """   returns (N, len(pairs)) euclidean distances between the joint pairs   """
+  diff = ext[:, pairs[:, 0], :2] - ext[:, pairs[:, 1], :2]
+  return np.sqrt(np.einsum('nkd,nkd->nk', diff, diff))
+
+def joint_angles(ext, triples):
+  """   returns (N, len(triples)) anti-clockwise angles(degrees) made by the middle joint   """
+  ab = ext[:, triples[:, 0], :2] - ext[:, triples[:, 1], :2]
+  bc = ext[:, triples[:, 2], :2] - ext[:, triples[:, 1], :2]
+  dot_prod = np.einsum('nkd,nkd->nk', ab, bc)
+  mod_prod = np.sqrt(np.einsum('nkd,nkd->nk', ab, ab)*np.einsum('nkd,nkd->nk', bc, bc))
+  with np.errstate(invalid='ignore', divide='ignore'):
+    angle = np.rad2deg(np.arccos(np.clip(dot_prod/mod_prod, -1.0, 1.0)))
+  det = ab[..., 0]*bc[..., 1] - ab[..., 1]*bc[..., 0]   # determinant for correct quadrant
+  return np.where(det < 0, 360.0-angle, angle)
+
+def visibility_status(skeleton):
+  """   returns the message of the first failed visibility check of a skeleton, else None   """
+  for names, message in VISIBILITY_CHECKS:
+    if not all(skeleton[JOINT[name], 2] > VISIBILITY_THRESHOLD for name in names):
+      return message
+  return None
+
+def visibility_mask(skeletons):
+  """   returns the boolean vector of the (N, 15, 3) skeletons passing all the visibility checks   """
+  passed = np.ones(len(skeletons), dtype=bool)
+  for names, _ in VISIBILITY_CHECKS:
+    passed &= (skeletons[:, [JOINT[name] for name in names], 2] > VISIBILITY_THRESHOLD).all(axis=1)
+  return passed
+
+def get_batch_features(skeletons, frame_height):
+  """
+    Returns the (N, N_FEATURES) feature matrix for (N, 15, 3) skeletons, taken from
+    frames of the given height
+  """
+  ext = extend_skeleton(skeletons, frame_height)
+  torso_len = joint_distances(ext, TORSO_PAIRS).mean(axis=1, keepdims=True)
+  features = np.empty((ext.shape[0], N_FEATURES), dtype=np.float64)
+  n_dist, n_angle = len(DIST_PAIRS), len(ANGLE_TRIPLES)
+  features[:, :n_dist] = joint_distances(ext, DIST_PAIRS)/torso_len
+  features[:, n_dist:n_dist+n_angle] = joint_angles(ext, ANGLE_TRIPLES)/360.0
+  features[:, n_dist+n_angle:] = ext[:, VISIBILITY_PAIRS, 2].mean(axis=2)
+  return features
+
+def get_features(skeleton, frame_height):
+  """
+    Returns the N_FEATURES feature vector of a single (15, 3) skeleton, the same as
+    get_batch_features() for one skeleton but with float arithmetic, for the online path
+  """
+  joints = np.asarray(skeleton, dtype=np.float64).reshape(len(POINT_NAMES), 3).tolist()
+  def mid(j1, j2):
+    return [(j1[0]+j2[0])*0.5, (j1[1]+j2[1])*0.5, (j1[2]+j2[2])*0.5]
+  def distance(j1, j2):
+    dx, dy = j1[0]-j2[0], j1[1]-j2[1]
+    return math.sqrt(dx*dx + dy*dy)
+  neck = mid(joints[JOINT['LEFT_SHOULDER']], joints[JOINT['RIGHT_SHOULDER']])
+  mid_hips = mid(joints[JOINT['LEFT_HIP']], joints[JOINT['RIGHT_HIP']])
+  core = mid(neck, mid_hips)
+  joints += [neck, mid_hips, core, mid(joints[JOINT['LEFT_KNEE']], joints[JOINT['RIGHT_KNEE']]),
+             mid(joints[JOINT['LEFT_ANKLE']], joints[JOINT['RIGHT_ANKLE']]), [core[0], frame_height-1, 0.9]]
+
+  features = np.empty(N_FEATURES, dtype=np.float64)
+  n_dist, n_angle = len(_DIST_PAIRS), len(_ANGLE_TRIPLES)
+  torso_len = sum(distance(joints[i], joints[j]) for i, j in _TORSO_PAIRS)/len(_TORSO_PAIRS)
+  with np.errstate(invalid='ignore', divide='ignore'):
+    features[:n_dist] = np.array([distance(joints[i], joints[j]) for i, j in _DIST_PAIRS])/torso_len
+  for k, (i, j, l) in enumerate(_ANGLE_TRIPLES):
+    abx, aby = joints[i][0]-joints[j][0], joints[i][1]-joints[j][1]
+    bcx, bcy = joints[l][0]-joints[j][0], joints[l][1]-joints[j][1]
+    mod_prod = math.sqrt((abx*abx + aby*aby)*(bcx*bcx + bcy*bcy))
+    cos = min(max((abx*bcx + aby*bcy)/mod_prod, -1.0), 1.0) if mod_prod > 0 else math.nan
+    angle = math.degrees(math.acos(cos))
+    features[n_dist+k] = (360.0-angle if abx*bcy - aby*bcx < 0 else angle)/360.0
+  features[n_dist+n_angle:] = [(joints[i][2]+joints[j][2])/2 for i, j in _VISIBILITY_PAIRS]
+  return features
+
+def get_landmark_features(landmarks, frame_shape):
+  """   Returns the (N, N_FEATURES) feature matrix for (N, 33, 3) MediaPipe landmarks   """
+  return get_batch_features(to_skeleton(landmarks, frame_shape), frame_shape[0])
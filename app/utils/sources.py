@@ -0,0 +1,8 @@
+import cv2
+
+
+def open_source(source):
+  """   opens a camera index(an int or a string of digits) or a video file   """
+  if isinstance(source, str) and source.isdigit():
+    source = int(source)
+  return cv2.VideoCapture(source)
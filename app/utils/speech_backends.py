@@ -0,0 +1,116 @@
+"""
+  Text to speech backends and audio players used by the SpeechEngine. A backend renders a
+  phrase to an audio file, a player loads that file(decoding it into memory if it can) and
+  plays it. Either can be replaced, eg. by a stub in tests, by passing it to SpeechEngine.
+"""
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+from gtts import gTTS
+from playsound import playsound
+
+# optional local backends
+try:
+  import pyttsx3
+except ImportError:
+  pyttsx3 = None
+try:
+  import simpleaudio
+except ImportError:
+  simpleaudio = None
+
+
+class TTSBackend(ABC):
+  """   renders text to an audio file   """
+  # extension of the audio files written by the backend
+  extension = '.mp3'
+
+  @abstractmethod
+  def synthesize(self, text, file_path):
+    # This function writes the speech audio of text to file_path
+    pass
+
+
+class GTTSBackend(TTSBackend):
+  """   Google text to speech, needs network access   """
+  extension = '.mp3'
+
+  def __init__(self, lang='en', slow=False):
+    self.lang = lang
+    self.slow = slow
+
+  def synthesize(self, text, file_path):
+    gTTS(text=text, lang=self.lang, slow=self.slow).save(file_path)
+
+
+class Pyttsx3Backend(TTSBackend):
+  """   offline speech synthesis with the platform's local engine(espeak, SAPI5 or NSSpeech)   """
+  extension = '.wav'
+
+  def __init__(self, rate=170):
+    self.rate = rate
+    self.engine = None
+
+  def synthesize(self, text, file_path):
+    if self.engine is None:
+      # the engine is started in the process which uses it
+      self.engine = pyttsx3.init()
+      self.engine.setProperty('rate', self.rate)
+    self.engine.save_to_file(text, file_path)
+    self.engine.runAndWait()
+
+
+class AudioPlayer(ABC):
+  """   loads and plays audio files   """
+
+  def load(self, file_path):
+    # This function returns the playable audio of the file, kept in the speech cache
+    return file_path
+
+  @abstractmethod
+  def play(self, audio):
+    # This function plays the loaded audio and returns when it is done
+    pass
+
+
+class PlaysoundPlayer(AudioPlayer):
+  """   plays any audio file, decoding it on every play   """
+
+  def play(self, audio):
+    playsound(audio, block=True)
+
+
+class SimpleaudioPlayer(AudioPlayer):
+  """   keeps the decoded wave audio in memory, so that playback starts right away   """
+
+  def load(self, file_path):
+    return simpleaudio.WaveObject.from_wave_file(file_path)
+
+  def play(self, audio):
+    audio.play().wait_done()
+
+
+def _pyttsx3_works():
+  # pyttsx3 imports even without its platform engine(eg. espeak), so a word is rendered to check it
+  if pyttsx3 is None:
+    return False
+  fd, tmp_path = tempfile.mkstemp(suffix=Pyttsx3Backend.extension)
+  os.close(fd)
+  try:
+    Pyttsx3Backend().synthesize("ready", tmp_path)
+    return os.path.getsize(tmp_path) > 0
+  except Exception:
+    return False
+  finally:
+    os.remove(tmp_path)
+
+def default_backend():
+  """   returns the local backend if it is installed and can synthesize, else the network one   """
+  return Pyttsx3Backend() if _pyttsx3_works() else GTTSBackend()
+
+def default_player(backend):
+  """   returns the player which can keep the backend's audio decoded in memory, if installed   """
+  if (simpleaudio is not None) and (backend.extension == '.wav'):
+    return SimpleaudioPlayer()
+  return PlaysoundPlayer()
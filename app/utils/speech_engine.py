@@ -1,27 +1,60 @@
+import re
 import time, os
+import queue
 import hashlib
-from gtts import gTTS
-from playsound import playsound
+import threading
+import multiprocessing as mp
+from collections import OrderedDict
 
 
 from .worker import Worker
+from .skeleton import VISIBILITY_CHECKS
+from .pose_rules import MESSAGES
+from .frame_gate import DARK_MESSAGE, BRIGHT_MESSAGE
+from .speech_backends import default_backend, default_player
+
+
+def split_sentences(text):
+  """   returns the sentences of text, each of which is rendered and cached on its own   """
+  return [sentence for sentence in re.split(r'(?<=[.!?])\s+', text.strip()) if sentence]
+
+def known_phrases():
+  """   returns all the sentences the app is known to speak   """
+  texts = list(MESSAGES) + [message for _, message in VISIBILITY_CHECKS] + [DARK_MESSAGE, BRIGHT_MESSAGE]
+  return list(dict.fromkeys(sentence for text in texts for sentence in split_sentences(text)))
 
 
 class SpeechEngine(Worker):
   """
-    This will handle text to speech related stuffs
+    This will handle text to speech related stuffs. Every known phrase is rendered ahead of
+    time, sentence by sentence, so that the combined corrections need no new synthesis.
+
+    Arguments:
+      backend : text to speech backend, see speech_backends. Defaults to the local one if
+                installed
+      player : audio player, see speech_backends
+      prewarm : if True, all known phrases are rendered and loaded when the engine starts
+      max_cached : number of loaded phrases kept in memory
+      repeat_interval : time(secs) within which a phrase is not repeated
+      speech_dir : directory of the rendered audio files
   """
-  def __init__(self):
+  def __init__(self, backend=None, player=None, prewarm=True, max_cached=64, repeat_interval=10,
+               speech_dir='../resources/speech/'):
     # Setup the audio repository
-    self.speech_dir = '../resources/speech/'
+    self.speech_dir = speech_dir
     if not os.path.isdir(self.speech_dir):
       os.mkdir(self.speech_dir)
-    
-    # cache the previously converted and stored speech files for faster processing.
-    # Also the time_stamp for each speech is saved so that we do not bombard the user
-    # with any single speech continuously.  
-    self.speech_history = {file: time.time()-10 for file in os.listdir(self.speech_dir) \
-                          if os.path.isfile(os.path.join(self.speech_dir, file))}
+    self.backend = default_backend() if backend is None else backend
+    self.player = default_player(self.backend) if player is None else player
+    self.prewarm = prewarm
+    self.max_cached = max_cached
+    self.repeat_interval = repeat_interval
+    # set once the known phrases are rendered and loaded
+    self.ready = mp.Event()
+
+    # the time_stamp for each speech is saved so that we do not bombard the user
+    # with any single speech continuously.
+    self.speech_history = {}
     self.run()
 
   def name(self):
@@ -29,8 +62,70 @@ class SpeechEngine(Worker):
 
   def say(self, text):
     self.inputs.put((time.time(), text))
-  
+
+  def _file_path(self, sentence):
+    # convert to hash code to name the rendered speech audio
+    hash_code = hashlib.md5(sentence.encode()).hexdigest()
+    return os.path.join(self.speech_dir, hash_code+self.backend.extension)
+
+  def _load(self, sentence):
+    # returns the loaded audio of the sentence, rendering it only if it was never rendered
+    audio = self.audio_cache.get(sentence)
+    if audio is not None:
+      self.audio_cache.move_to_end(sentence)
+      return audio
+    file_path = self._file_path(sentence)
+    if not os.path.isfile(file_path):
+      # rendered under a temporary name, so that a failed synthesis leaves no partial file
+      tmp_path = file_path+'.tmp'+self.backend.extension
+      self.backend.synthesize(sentence, tmp_path)
+      os.replace(tmp_path, file_path)
+    audio = self.player.load(file_path)
+    self.audio_cache[sentence] = audio
+    if len(self.audio_cache) > self.max_cached:
+      # least recently used phrase is dropped from memory, its file stays on disk
+      self.audio_cache.popitem(last=False)
+    return audio
+
+  def _enqueue(self, sentence, audio):
+    # queues the sentence for playback, unless it is already waiting to be played
+    with self.play_lock:
+      if sentence in self.queued:
+        return
+      self.queued.add(sentence)
+    self.play_queue.put((sentence, audio))
+
+  def _playback(self):
+    # plays the queued sentences one after another, off the synthesis loop
+    while True:
+      item = self.play_queue.get()
+      if item is None:
+        break
+      sentence, audio = item
+      with self.play_lock:
+        self.queued.discard(sentence)
+      try:
+        self.player.play(audio)
+      except Exception as ex:
+        print("Error in SpeechEngine playback : %s" %str(ex))
+
+  def _prewarm(self):
+    # renders and loads the known phrases, which fail silently without a working backend
+    for sentence in known_phrases()[:self.max_cached]:
+      try:
+        self._load(sentence)
+      except Exception as ex:
+        print("Error in SpeechEngine prewarm : %s" %str(ex))
+
   def main(self):
+    self.audio_cache = OrderedDict()
+    self.play_queue, self.play_lock, self.queued = queue.Queue(), threading.Lock(), set()
+    player_thread = threading.Thread(target=self._playback, daemon=True)
+    player_thread.start()
+    if self.prewarm:
+      self._prewarm()
+    self.ready.set()
+
     while True:
       inp = self.inputs.get()
       if (type(inp) is int) and (inp == 0):
@@ -39,25 +134,16 @@ class SpeechEngine(Worker):
       else:
         time_stamp, text = inp
 
-      try:
-        # convert to hash code and save the processed speech audio
-        hash_code = hashlib.md5(text.encode()).hexdigest()
-        file_name = hash_code+'.mp3'
-        time_hist = self.speech_history.get(file_name)
-        if time_hist is None:
-          # process the speech only once and then cache it
-          speech_obj = gTTS(text=text, lang='en', slow=False)
-          speech_obj.save(os.path.join(self.speech_dir, file_name))
-          self.speech_history[file_name] = time.time()
-          playsound(os.path.join(self.speech_dir, file_name), block=False)
-        else:
-          # if it was played before then ensure it is not repeated in next 10 secs
-          if time_stamp-time_hist > 10:
-            self.speech_history[file_name] = time.time()
-            playsound(os.path.join(self.speech_dir, file_name), block=False)
-        # self.outputs.put("success")
-      except Exception as ex:
-        print("Error in SpeechEngine : %s" %str(ex))
-        # self.outputs.put("error")
-      finally:
-        pass
+      for sentence in split_sentences(text):
+        try:
+          # if it was played before then ensure it is not repeated in next few secs
+          time_hist = self.speech_history.get(sentence)
+          if (time_hist is not None) and (time_stamp-time_hist <= self.repeat_interval):
+            continue
+          self.speech_history[sentence] = time.time()
+          self._enqueue(sentence, self._load(sentence))
+        except Exception as ex:
+          print("Error in SpeechEngine : %s" %str(ex))
+
+    self.play_queue.put(None)
+    player_thread.join()
@@ -1,5 +1,139 @@
+import time
+import queue
+import numpy as np
 import multiprocessing as mp
+from multiprocessing import shared_memory
 from abc import ABC, abstractmethod
+from collections import namedtuple
+
+
+class FrameRing(object):
+  """
+    A ring of fixed size frame slots in shared memory. The producer copies a frame into a 
+    free slot and passes only the slot index across the process boundary, the consumer 
+    reads the frame in place and then releases the slot for reuse.
+
+    Arguments:
+      frame_shape : shape of the frames, eg. (720, 1280, 3)
+      n_slots : number of frames which can be in flight at once
+      dtype : data type of the frames
+  """
+  def __init__(self, frame_shape, n_slots=4, dtype=np.uint8):
+    self.frame_shape = tuple(frame_shape)
+    self.n_slots = n_slots
+    self.dtype = np.dtype(dtype)
+    size = n_slots*int(np.prod(self.frame_shape))*self.dtype.itemsize
+    self.shm = shared_memory.SharedMemory(create=True, size=size)
+    self.owner = True
+    self.free_slots = mp.Queue()
+    for slot in range(n_slots):
+      self.free_slots.put(slot)
+    self._map()
+
+  def _map(self):
+    self.frames = np.ndarray((self.n_slots,)+self.frame_shape, dtype=self.dtype, buffer=self.shm.buf)
+
+  def __getstate__(self):
+    # only the name of the shared memory crosses to the other process
+    state = self.__dict__.copy()
+    del state['frames'], state['shm']
+    state['shm_name'], state['owner'] = self.shm.name, False
+    return state
+
+  def __setstate__(self, state):
+    shm_name = state.pop('shm_name')
+    self.__dict__.update(state)
+    self.shm = shared_memory.SharedMemory(name=shm_name)
+    self._map()
+
+  def put(self, frame):
+    """   copies the frame to a free slot and returns the slot index, None if all slots are busy   """
+    if frame.shape != self.frame_shape:
+      return None
+    try:
+      slot = self.free_slots.get_nowait()
+    except queue.Empty:
+      return None
+    np.copyto(self.frames[slot], frame)
+    return slot
+
+  def get(self, slot):
+    """   returns the frame in the slot, valid until the slot is released   """
+    return self.frames[slot]
+
+  def release(self, slot):
+    """   returns the slot for reuse by the producer   """
+    self.free_slots.put(slot)
+
+  def close(self):
+    """   unmaps the shared memory, and frees it if this is the creating process   """
+    self.frames = None
+    self.shm.close()
+    if self.owner:
+      self.shm.unlink()
+
+
+# an event sent by a worker, seq orders all the events of a channel
+Event = namedtuple('Event', ['seq', 'kind', 'data'])
+
+
+def coalesce(events, state_kinds):
+  """   returns the events, dropping the state events superseded by a later one of their kind   """
+  seen, kept = set(), list()
+  for event in reversed(events):
+    if event.kind in state_kinds:
+      if event.kind in seen:
+        continue
+      seen.add(event.kind)
+    kept.append(event)
+  return kept[::-1]
+
+
+class EventChannel(object):
+  """
+    Typed events from a worker process to its caller. The worker emits sequence numbered
+    events which are sent in batches, one queue message per flush, and the caller drains
+    all the pending events at once. Events of the state kinds(eg. counts) carry the whole
+    state, so only the latest of each is delivered.
+
+    Arguments:
+      state_kinds : kinds of events which supersede the earlier ones of the same kind
+  """
+  def __init__(self, state_kinds=('counts', 'metrics')):
+    self.queue = mp.Queue()
+    self.state_kinds = frozenset(state_kinds)
+    self.seq = 0
+    self.pending = list()
+
+  def emit(self, kind, data=None):
+    """   adds an event to the batch being built, sent on the next flush   """
+    self.seq += 1
+    self.pending.append(Event(self.seq, kind, data))
+
+  def flush(self):
+    """   sends the pending events as one batch   """
+    if self.pending:
+      self.queue.put(coalesce(self.pending, self.state_kinds))
+      self.pending = list()
+
+  def drain(self, timeout=None):
+    """
+      returns all the events received so far, in order, waiting up to timeout(secs) for the
+      first batch if given
+    """
+    events = list()
+    try:
+      if timeout is not None:
+        events.extend(self.queue.get(timeout=timeout))
+      while True:
+        events.extend(self.queue.get_nowait())
+    except queue.Empty:
+      pass
+    return coalesce(events, self.state_kinds)
+
+  def qsize(self):
+    """   returns the number of batches waiting to be drained   """
+    return self.queue.qsize()
 
 
 class Worker(ABC):
@@ -21,25 +155,47 @@ class Worker(ABC):
     pass
 
 
+  # shared memory frame ring, if created before run()
+  ring = None
+
+  def create_ring(self, frame_shape, n_slots=4):
+    # This function sets up a shared memory frame ring for passing frames to the worker 
+    # process without pickling. It has to be called before run()
+    self.ring = FrameRing(frame_shape, n_slots)
+    return self.ring
+
   def run(self):
     # This function starts the main method for this worker after setting up the queues 
     # for communicaton
     self.inputs = mp.Queue()
-    self.outputs = mp.Queue()
+    self.outputs = EventChannel()
     self.proc = mp.Process(target=self.main)
     self.proc.start()
 
 
-  def stop(self):
-    # This function will kill the process
+  def stop(self, timeout=10.0):
+    # This function will kill the process and returns its remaining events. The outputs are
+    # drained while waiting, as a process does not exit before its queued data is read, and
+    # the process is terminated if it does not exit within timeout secs
     self.inputs.put(0)
-    # print("%s:  Inputs(%s)  Outputs(%s)" %(self.name(), self.inputs.empty(), self.outputs.empty()))
+    events = list()
+    deadline = time.time()+timeout
+    while self.proc.is_alive() and (time.time() < deadline):
+      events.extend(self.outputs.drain(timeout=0.05))
+      self.proc.join(0.05)
+    if self.proc.is_alive():
+      self.proc.terminate()
     self.proc.join()
+    events = coalesce(events+self.outputs.drain(), self.outputs.state_kinds)
+    if self.ring is not None:
+      self.ring.close()
+      self.ring = None
     print("%s killed with code %s" %(self.name(), str(self.proc.exitcode)))
+    return events
 
 
-  def get_output(self):
-    # This function reads and returns from the output queue
-    return None if self.outputs.empty() else self.outputs.get()
+  def drain(self, timeout=None):
+    # This function returns all the pending events from the worker, see EventChannel.drain
+    return self.outputs.drain(timeout)
 
 